@@ -6,6 +6,9 @@ import sys
 
 def main():
     """Run administrative tasks."""
+    if sys.argv[1:2] == ['test']:
+        # run the tests on in-memory SQLite unless told otherwise
+        os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mysite.test_settings')
     os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mysite.settings')
     try:
         from django.core.management import execute_from_command_line
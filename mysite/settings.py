@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 
 from pathlib import Path
 from decouple import config, Csv
+from django.core.exceptions import ImproperlyConfigured
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -47,6 +48,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'polls.ratelimit.RateLimitMiddleware',
 ]
 
 ROOT_URLCONF = 'mysite.urls'
@@ -83,6 +85,33 @@ DATABASES = {
     }
 }
 
+# With DATABASE_POOL each server process keeps a pool of PostgreSQL
+# connections (requires psycopg[pool]), the warm-up opens its
+# DATABASE_POOL_MIN_SIZE connections before the process takes traffic.
+
+if config('DATABASE_POOL', cast=bool, default=False):
+    DATABASES["default"]["OPTIONS"] = {
+        "pool": {
+            "min_size": config('DATABASE_POOL_MIN_SIZE', cast=int, default=2),
+            "max_size": config('DATABASE_POOL_MAX_SIZE', cast=int,
+                               default=10),
+        },
+    }
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    }
+}
+
+# Sessions are written through to the cache, so reading the session of a
+# request (e.g. for its user's rate limit) usually takes no query.
+
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -101,30 +130,168 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Password hashing
+# https://docs.djangoproject.com/en/4.2/topics/auth/passwords/
+# PASSWORD_HASHER picks the profile used to hash new passwords (pbkdf2,
+# argon2 or scrypt). Passwords hashed by any other listed hasher or with
+# other parameters are transparently re-hashed when the user logs in.
+# The argon2 profile requires the argon2-cffi package.
+
+PASSWORD_HASHER_PROFILES = {
+    'pbkdf2': 'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'argon2': 'polls.hashers.TunedArgon2PasswordHasher',
+    'scrypt': 'polls.hashers.TunedScryptPasswordHasher',
+}
+PASSWORD_HASHER = config('PASSWORD_HASHER', default='pbkdf2')
+if PASSWORD_HASHER not in PASSWORD_HASHER_PROFILES:
+    raise ImproperlyConfigured(
+        f"Unknown PASSWORD_HASHER {PASSWORD_HASHER!r}, use one of: "
+        f"{', '.join(PASSWORD_HASHER_PROFILES)}")
+PASSWORD_HASHERS = [PASSWORD_HASHER_PROFILES[PASSWORD_HASHER]] + [
+    hasher for profile, hasher in PASSWORD_HASHER_PROFILES.items()
+    if profile != PASSWORD_HASHER
+] + ['django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher']
+
+ARGON2_TIME_COST = config('ARGON2_TIME_COST', cast=int, default=2)
+ARGON2_MEMORY_COST = config('ARGON2_MEMORY_COST', cast=int, default=102400)
+ARGON2_PARALLELISM = config('ARGON2_PARALLELISM', cast=int, default=8)
+SCRYPT_WORK_FACTOR = config('SCRYPT_WORK_FACTOR', cast=int, default=2 ** 14)
+SCRYPT_BLOCK_SIZE = config('SCRYPT_BLOCK_SIZE', cast=int, default=8)
+SCRYPT_PARALLELISM = config('SCRYPT_PARALLELISM', cast=int, default=1)
+
 AUTHENTICATION_BACKENDS = [
     # username & password authentication
     'django.contrib.auth.backends.ModelBackend',
 ]
 
+# Rate limiting
+# Requests to these URL names are limited per client IP and per logged in
+# user with token buckets, rates are '<requests>/<s|m|h|d>'.
+
+# Clients are identified by REMOTE_ADDR. Behind TRUSTED_PROXY_COUNT reverse
+# proxies that append to X-Forwarded-For the client address is read from
+# that header instead.
+
+TRUSTED_PROXY_COUNT = config('TRUSTED_PROXY_COUNT', cast=int, default=0)
+RATELIMIT_CACHE = config('RATELIMIT_CACHE', default='default')
+RATELIMIT_METHODS = ['POST']
+RATELIMITS = {
+    'polls:vote': {'ip': '300/m', 'user': '30/m'},
+    'polls:clear': {'ip': '300/m', 'user': '30/m'},
+    'polls:submit_survey': {'ip': '100/m', 'user': '10/m'},
+    'login': {'ip': '20/m'},
+    'register': {'ip': '10/m'},
+}
+
+# Participation sketches
+# Seconds a worker buffers vote sketches before a background thread merges
+# them into the database (0 merges them in the request), and the number of
+# votes from one IP within an hour that is reported as suspicious.
+
+SKETCH_FLUSH_INTERVAL = config('SKETCH_FLUSH_INTERVAL', cast=int, default=10)
+SKETCH_SUSPICIOUS_VOTES = config('SKETCH_SUSPICIOUS_VOTES', cast=int,
+                                 default=50)
+
+# Idempotency keys
+# Responses to POSTs with an Idempotency-Key header are kept for
+# IDEMPOTENCY_TTL seconds, retries wait up to IDEMPOTENCY_WAIT seconds
+# for the first request to finish.
+
+IDEMPOTENCY_CACHE = config('IDEMPOTENCY_CACHE', default='default')
+IDEMPOTENCY_TTL = config('IDEMPOTENCY_TTL', cast=int, default=300)
+IDEMPOTENCY_WAIT = config('IDEMPOTENCY_WAIT', cast=float, default=5)
+
+# Vote history
+# Vote events are written in batches by a background thread every
+# HISTORY_FLUSH_INTERVAL seconds or once HISTORY_BATCH_SIZE events are
+# waiting. With an interval of 0 full batches are written by the request.
+
+HISTORY_FLUSH_INTERVAL = config('HISTORY_FLUSH_INTERVAL', cast=float,
+                                default=2)
+HISTORY_BATCH_SIZE = config('HISTORY_BATCH_SIZE', cast=int, default=500)
+
+# Background tasks
+# Side effects of votes are written to an outbox and run by the run_workers
+# command, which leases TASK_BATCH_SIZE tasks at a time for
+# TASK_LEASE_SECONDS and gives up on a task after TASK_MAX_ATTEMPTS.
+# With TASKS_EAGER tasks run in the request instead.
+
+TASKS_EAGER = config('TASKS_EAGER', cast=bool, default=False)
+TASK_BATCH_SIZE = config('TASK_BATCH_SIZE', cast=int, default=100)
+TASK_LEASE_SECONDS = config('TASK_LEASE_SECONDS', cast=int, default=60)
+TASK_MAX_ATTEMPTS = config('TASK_MAX_ATTEMPTS', cast=int, default=5)
+
+# Vote partitioning and compaction
+# On PostgreSQL polls_vote is partitioned by ranges of VOTE_PARTITION_SIZE
+# question ids, the partition_votes command keeps VOTE_PARTITIONS_AHEAD
+# empty partitions ready for new questions. compact_votes replaces the votes
+# of polls closed for VOTE_COMPACT_AFTER_DAYS days by counts per choice.
+
+VOTE_PARTITION_SIZE = config('VOTE_PARTITION_SIZE', cast=int, default=10000)
+VOTE_PARTITIONS_AHEAD = config('VOTE_PARTITIONS_AHEAD', cast=int, default=2)
+VOTE_COMPACT_AFTER_DAYS = config('VOTE_COMPACT_AFTER_DAYS', cast=int,
+                                 default=365)
+
+# Poll scheduler
+# The run_scheduler command sleeps until the next poll opens or closes, but
+# at most SCHEDULER_MAX_SLEEP seconds so polls added meanwhile are noticed.
+
+SCHEDULER_MAX_SLEEP = config('SCHEDULER_MAX_SLEEP', cast=float, default=300)
+
+# Email
+# Voters are emailed the results of the polls they voted in when the polls
+# close, NOTIFY_BATCH_SIZE messages at a time over one connection. A task
+# sends NOTIFY_TASK_SIZE messages and leaves the rest to a new task.
+
+EMAIL_BACKEND = config('EMAIL_BACKEND',
+                       default='django.core.mail.backends.console.EmailBackend')
+EMAIL_HOST = config('EMAIL_HOST', default='localhost')
+EMAIL_PORT = config('EMAIL_PORT', cast=int, default=25)
+EMAIL_HOST_USER = config('EMAIL_HOST_USER', default='')
+EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD', default='')
+EMAIL_USE_TLS = config('EMAIL_USE_TLS', cast=bool, default=False)
+DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL',
+                            default='KU polls <noreply@localhost>')
+NOTIFY_BATCH_SIZE = config('NOTIFY_BATCH_SIZE', cast=int, default=500)
+NOTIFY_TASK_SIZE = config('NOTIFY_TASK_SIZE', cast=int, default=10000)
+
+# Warm-up
+# Server processes import the views, compile the templates and connect to
+# the database before /readyz reports them ready.
+
+WARM_UP = config('WARM_UP', cast=bool, default=True)
+
+# Results charts
+# Charts of closed polls are cached by clients and proxies for
+# CHART_CLOSED_MAX_AGE seconds, charts of open polls are revalidated with
+# their ETag on every request.
+
+CHART_CLOSED_MAX_AGE = config('CHART_CLOSED_MAX_AGE', cast=int,
+                              default=60 * 60 * 24 * 30)
+
 LOGIN_REDIRECT_URL = 'polls:index'
 LOGOUT_REDIRECT_URL = 'polls:index'
 
 # logging configuration
+# The polls log goes to the console unless LOG_FILE names a file to append
+# it to, which should be outside the source tree.
+
+LOG_FILE = config('LOG_FILE', default='')
+
 LOGGING = {
     "version": 1,
     "disable_existing_loggers": False,
     "handlers": {
-        "file": {
-            "class": "logging.FileHandler",
-            "filename": "poll_logs.log",
-            "level": "DEBUG",
+        "console": {
+            "class": "logging.StreamHandler",
+            "level": "INFO",
             "formatter": "verbose",
         },
     },
     "loggers": {
         "polls": {
             "level": "DEBUG",
-            "handlers": ["file"],
+            "handlers": ["console"],
             "propagate": False
         },
     },
@@ -138,6 +305,15 @@ LOGGING = {
     },
 }
 
+if LOG_FILE:
+    LOGGING["handlers"]["file"] = {
+        "class": "logging.FileHandler",
+        "filename": LOG_FILE,
+        "level": "DEBUG",
+        "formatter": "verbose",
+    }
+    LOGGING["loggers"]["polls"]["handlers"] = ["file"]
+
 # Internationalization
 # https://docs.djangoproject.com/en/4.2/topics/i18n/
 
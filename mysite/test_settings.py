@@ -0,0 +1,40 @@
+"""
+Django settings for running the test suite.
+
+Tests run against an in-memory SQLite database so no database server is
+needed and every --parallel worker gets its own copy of the database.
+Passwords are hashed with MD5 since a slow hasher only slows tests down.
+"""
+from .settings import *  # noqa: F401,F403
+from .settings import LOGGING
+
+# a vote locks the previous vote before writing, on SQLite transactions
+# must take the write lock when they start or concurrent votes deadlock
+DATABASES = {
+    "default": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": ":memory:",
+        "OPTIONS": {"transaction_mode": "IMMEDIATE"},
+    }
+}
+
+PASSWORD_HASHERS = ["django.contrib.auth.hashers.MD5PasswordHasher"]
+
+# write the vote history from the test's thread, tests flush it themselves
+HISTORY_FLUSH_INTERVAL = 0
+
+# merge the vote sketches in the request instead of a background thread
+SKETCH_FLUSH_INTERVAL = 0
+
+# run the side effects of votes in the request
+TASKS_EAGER = True
+
+# don't fill the log with the log messages of the test cases
+LOGGING = {
+    **LOGGING,
+    "handlers": {"null": {"class": "logging.NullHandler"}},
+    "loggers": {
+        "polls": {"level": "DEBUG", "handlers": ["null"],
+                  "propagate": False},
+    },
+}
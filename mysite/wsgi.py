@@ -8,9 +8,17 @@ https://docs.djangoproject.com/en/4.2/howto/deployment/wsgi/
 """
 
 import os
+import time
 
 from django.core.wsgi import get_wsgi_application
 
+started = time.perf_counter()
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mysite.settings')
 
 application = get_wsgi_application()
+
+# warm up in the background, /readyz reports ready once it is done
+from polls import warmup  # noqa: E402
+
+application = warmup.time_first_byte(application, started)
+warmup.start()
@@ -1,7 +1,154 @@
 """Module to register models to the admin site for easy configuration."""
 from django.contrib import admin
-from .models import Question, Choice
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils.functional import cached_property
+from .models import (Question, Choice, Survey, Vote, QuestionSketch,
+                     IPVoteWindow)
 
 
-admin.site.register(Question)
-admin.site.register(Choice)
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator using the planner's row estimate for unfiltered tables.
+
+    Counting every row of a huge table is slow on PostgreSQL, so when the
+    list is not filtered and pg_class estimates more than
+    ESTIMATE_THRESHOLD rows the estimate is used instead of COUNT(*). The
+    parent of a partitioned table has no rows of its own, its estimate is
+    the sum over its partitions.
+    """
+
+    ESTIMATE_THRESHOLD = 100000
+    # reltuples is -1 for tables that were never analyzed
+    ESTIMATE_SQL = (
+        "SELECT CASE WHEN c.relkind = 'p' THEN ("
+        "SELECT COALESCE(SUM(GREATEST(p.reltuples, 0)), 0) "
+        "FROM pg_inherits i JOIN pg_class p ON p.oid = i.inhrelid "
+        "WHERE i.inhparent = c.oid) ELSE c.reltuples END "
+        "FROM pg_class c WHERE c.oid = %s::regclass")
+
+    @cached_property
+    def count(self):
+        """Return the (possibly estimated) number of objects."""
+        query = self.object_list.query
+        connection = connections[self.object_list.db]
+        if connection.vendor == "postgresql" and not query.where:
+            with connection.cursor() as cursor:
+                cursor.execute(self.ESTIMATE_SQL,
+                               [query.model._meta.db_table])
+                row = cursor.fetchone()
+            if row and row[0] > self.ESTIMATE_THRESHOLD:
+                return int(row[0])
+        return super().count
+
+
+def vote_count(**filters):
+    """
+    Return a subquery counting the votes matching the filters.
+
+    A correlated subquery is only evaluated for the rows on the current
+    page, unlike a JOIN with GROUP BY over the whole vote table.
+    """
+    votes = (Vote.objects.filter(**filters).order_by().values(*filters)
+             .annotate(count=Count("*")).values("count"))
+    return Coalesce(Subquery(votes, output_field=IntegerField()), 0)
+
+
+class ChoiceInline(admin.TabularInline):
+    """Edit the choices of a question on the question's page."""
+
+    model = Choice
+    extra = 2
+
+
+@admin.register(Question)
+class QuestionAdmin(admin.ModelAdmin):
+    """Admin page for poll questions and their choices."""
+
+    inlines = [ChoiceInline]
+    list_display = ("question_text", "pub_date", "end_date", "poll_type",
+                    "votes")
+    list_filter = ("poll_type", "survey")
+    search_fields = ("question_text",)
+    date_hierarchy = "pub_date"
+    list_select_related = ("survey",)
+    raw_id_fields = ("survey",)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        """Annotate each question with its vote count."""
+        return super().get_queryset(request).annotate(
+            vote_count=vote_count(question=OuterRef("pk"))
+            + Coalesce(F("voter_bitmap__voters"), 0))
+
+    @admin.display(description="Votes", ordering="vote_count")
+    def votes(self, question):
+        """Return the number of votes on the question."""
+        return question.vote_count
+
+
+@admin.register(Choice)
+class ChoiceAdmin(admin.ModelAdmin):
+    """Admin page for the choices of all questions."""
+
+    list_display = ("choice_text", "question", "votes")
+    list_select_related = ("question",)
+    search_fields = ("choice_text", "question__question_text")
+    autocomplete_fields = ("question",)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        """Annotate each choice with its vote count."""
+        return super().get_queryset(request).annotate(
+            vote_count=vote_count(choice=OuterRef("pk"))
+            + F("compacted_votes"))
+
+    @admin.display(description="Votes", ordering="vote_count")
+    def votes(self, choice):
+        """Return the number of votes for the choice."""
+        return choice.vote_count
+
+
+@admin.register(Vote)
+class VoteAdmin(admin.ModelAdmin):
+    """Admin page for individual votes."""
+
+    list_display = ("user", "question", "choice", "updated_at")
+    list_select_related = ("user", "question", "choice")
+    autocomplete_fields = ("user", "question")
+    raw_id_fields = ("choice",)
+    readonly_fields = ("created_at", "updated_at")
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+admin.site.register(Survey)
+
+
+@admin.register(QuestionSketch)
+class QuestionSketchAdmin(admin.ModelAdmin):
+    """Admin page showing the estimated participation of each poll."""
+
+    list_display = ("question", "voter_count", "ip_count", "updated_at")
+    list_select_related = ("question",)
+    exclude = ("voters", "ips")
+    readonly_fields = ("question", "voter_count", "ip_count", "updated_at")
+
+
+@admin.register(IPVoteWindow)
+class IPVoteWindowAdmin(admin.ModelAdmin):
+    """Admin page listing the IPs that voted suspiciously often."""
+
+    list_display = ("start", "votes", "suspect_count")
+    exclude = ("sketch",)
+    readonly_fields = ("start", "votes", "suspects")
+    ordering = ("-start",)
+
+    @admin.display(description="Suspicious IPs")
+    def suspect_count(self, window):
+        """Return the number of suspicious IPs of the window."""
+        return len(window.suspects)
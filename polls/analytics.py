@@ -0,0 +1,168 @@
+"""Vectorized cross-tabulation analytics over the votes of many polls."""
+import itertools
+import numpy as np
+from django.db.models import Count
+from .models import Choice, Question, Vote
+
+# number of vote rows fetched from the database cursor at a time
+CHUNK_SIZE = 50000
+
+
+class QuestionVotes:
+    """
+    The votes of one question stored as NumPy arrays.
+
+    'users' holds the sorted ids of the users that voted and 'choices' holds
+    the index (into 'choice_texts') of the choice each of those users picked.
+    """
+
+    def __init__(self, question, choice_texts, users, choices):
+        """Initialize the vote arrays of a question."""
+        self.question = question
+        self.choice_texts = choice_texts
+        self.users = users
+        self.choices = choices
+
+
+class CrossTab:
+    """
+    A cross-tabulation of the votes of two questions.
+
+    matrix[i, j] is the number of users who picked choice i of question_a
+    and choice j of question_b. Only users who voted on both are counted.
+    """
+
+    def __init__(self, votes_a, votes_b):
+        """Cross-tabulate the users that voted on both questions."""
+        self.question_a = votes_a.question
+        self.question_b = votes_b.question
+        self.rows = votes_a.choice_texts
+        self.columns = votes_b.choice_texts
+        _, index_a, index_b = np.intersect1d(
+            votes_a.users, votes_b.users,
+            return_indices=True)
+        size = len(self.rows) * len(self.columns)
+        cells = (votes_a.choices[index_a] * len(self.columns)
+                 + votes_b.choices[index_b])
+        self.matrix = np.bincount(cells, minlength=size).reshape(
+            len(self.rows), len(self.columns))
+        self.voters = int(self.matrix.sum())
+
+    def association(self):
+        """
+        Return Cramér's V of the cross-tabulation.
+
+        The score is 0 when the answers to both questions are independent
+        and 1 when the answer to one determines the answer to the other.
+        """
+        matrix = self.matrix[self.matrix.sum(axis=1) > 0]
+        matrix = matrix[:, matrix.sum(axis=0) > 0]
+        if min(matrix.shape, default=0) < 2:
+            return 0.0
+        total = matrix.sum()
+        expected = np.outer(matrix.sum(axis=1), matrix.sum(axis=0)) / total
+        chi2 = ((matrix - expected) ** 2 / expected).sum()
+        return float(np.sqrt(chi2 / total / (min(matrix.shape) - 1)))
+
+    def agreement(self):
+        """
+        Return the share of common voters that picked the same answer.
+
+        Answers are matched by their choice text, questions without any
+        common choice text have no agreement score (None).
+        """
+        same = np.equal.outer(np.array(self.rows, dtype=object),
+                              np.array(self.columns, dtype=object))
+        if not same.any() or not self.voters:
+            return None
+        return float(self.matrix[same].sum() / self.voters)
+
+    def __str__(self):
+        """Return the cross-tabulation as a plain text table."""
+        width = max(len(text) for text in self.rows + self.columns + [""])
+        header = " " * width + "".join(f" {text:>{width}}"
+                                       for text in self.columns)
+        lines = [f"{self.question_a} x {self.question_b}", header]
+        for text, row in zip(self.rows, self.matrix):
+            lines.append(f"{text:>{width}}"
+                         + "".join(f" {count:>{width}}" for count in row))
+        return "\n".join(lines)
+
+
+def vote_counts(questions):
+    """Return a dict of question id to its number of votes."""
+    counts = dict.fromkeys(questions, 0)
+    counts.update(Vote.objects.filter(question_id__in=questions)
+                  .values("question_id").annotate(count=Count("id"))
+                  .values_list("question_id", "count"))
+    return counts
+
+
+def load_votes(question_ids, chunk_size=CHUNK_SIZE):
+    """
+    Load the votes of the given questions into NumPy arrays.
+
+    The arrays of each question are allocated from a count of its votes.
+    Votes are then streamed from the database as (user, question, choice)
+    tuples and copied into the arrays of their question one chunk at a
+    time, so no model instances are created and the votes are never held
+    twice.
+
+    :param question_ids: The ids of the questions to load
+    :param chunk_size: The number of votes converted at a time
+    :return: A dict of question id to QuestionVotes
+    """
+    questions = Question.objects.in_bulk(question_ids)
+    choice_rows = (Choice.objects.filter(question_id__in=questions)
+                   .order_by("question_id", "id")
+                   .values_list("question_id", "id", "choice_text"))
+    choice_ids = {pk: [] for pk in questions}
+    choice_texts = {pk: [] for pk in questions}
+    for question_id, choice_id, text in choice_rows:
+        choice_ids[question_id].append(choice_id)
+        choice_texts[question_id].append(text)
+    counts = vote_counts(questions)
+    users = {pk: np.empty(count, dtype=np.int64)
+             for pk, count in counts.items()}
+    choices = {pk: np.empty(count, dtype=np.int64)
+               for pk, count in counts.items()}
+    filled = dict.fromkeys(questions, 0)
+    rows = (Vote.objects.filter(question_id__in=questions)
+            .values_list("user_id", "question_id", "choice_id")
+            .iterator(chunk_size=chunk_size))
+    while chunk := list(itertools.islice(rows, chunk_size)):
+        chunk = np.array(chunk, dtype=np.int64)
+        chunk = chunk[np.argsort(chunk[:, 1], kind="stable")]
+        pks, starts = np.unique(chunk[:, 1], return_index=True)
+        for pk, part in zip(pks.tolist(), np.split(chunk, starts[1:])):
+            start, end = filled[pk], filled[pk] + len(part)
+            if end > len(users[pk]):
+                # votes cast after they were counted
+                users[pk] = np.resize(users[pk], end)
+                choices[pk] = np.resize(choices[pk], end)
+            users[pk][start:end] = part[:, 0]
+            choices[pk][start:end] = part[:, 2]
+            filled[pk] = end
+    result = {}
+    for pk, question in questions.items():
+        order = np.argsort(users[pk][:filled[pk]], kind="stable")
+        result[pk] = QuestionVotes(
+            question, choice_texts[pk], users[pk][order],
+            np.searchsorted(np.array(choice_ids[pk], dtype=np.int64),
+                            choices[pk][order]))
+    return result
+
+
+def crosstabs(question_ids, chunk_size=CHUNK_SIZE):
+    """
+    Cross-tabulate every pair of the given questions.
+
+    :param question_ids: The ids of the questions to compare, in order
+    :param chunk_size: The number of votes loaded at a time
+    :return: A list of CrossTab objects, one for each pair of questions
+    """
+    votes = load_votes(question_ids, chunk_size)
+    ordered = [votes[pk] for pk in dict.fromkeys(question_ids)
+               if pk in votes]
+    return [CrossTab(votes_a, votes_b)
+            for votes_a, votes_b in itertools.combinations(ordered, 2)]
@@ -0,0 +1,136 @@
+"""
+Server-side SVG charts of poll results.
+
+Charts are plain SVG markup built from the vote counts of the choices, so
+results can be embedded as images without a plotting library. A rendered
+chart only depends on the question and its results version, so charts are
+cached per version and the version doubles as a strong ETag.
+"""
+import math
+from django.core.cache import cache
+from django.db.models import Count
+from django.utils.html import escape
+from .models import Choice
+
+KINDS = ("bar", "pie")
+# bump when the markup changes so cached charts and ETags are replaced
+REVISION = 1
+# seconds a chart stays cached, a new vote changes the version key anyway
+CHART_CACHE_TIMEOUT = 60 * 60
+COLORS = ("#228B22", "#1f77b4", "#ff7f0e", "#d62728", "#9467bd",
+          "#8c564b", "#e377c2", "#7f7f7f", "#bcbd22", "#17becf")
+WIDTH = 480
+FONT = 'font-family="sans-serif" font-size="13"'
+# characters of a choice text shown next to a bar or in the legend
+LABEL_LENGTH = 24
+
+
+def etag(question, kind):
+    """Return the strong ETag of a chart of a question."""
+    return (f'"chart-{REVISION}-{question.pk}-'
+            f'{question.results_version}-{kind}"')
+
+
+def label(text):
+    """Shorten and escape a choice text for the chart."""
+    if len(text) > LABEL_LENGTH:
+        text = text[:LABEL_LENGTH - 1] + "…"
+    return escape(text)
+
+
+def svg(height, title, body):
+    """Wrap chart elements in an SVG document with a title."""
+    return (f'<svg xmlns="http://www.w3.org/2000/svg" width="{WIDTH}" '
+            f'height="{height}" viewBox="0 0 {WIDTH} {height}" role="img">'
+            f'<title>{escape(title)}</title>'
+            f'<rect width="100%" height="100%" fill="#fff"/>'
+            f'{"".join(body)}</svg>')
+
+
+def bar_chart(title, rows):
+    """
+    Draw a horizontal bar per choice.
+
+    :param title: The question text
+    :param rows: A list of (choice text, votes) tuples
+    :return: The SVG markup
+    """
+    row_height, left, bar_width = 28, 180, 240
+    most = max((votes for _, votes in rows), default=0) or 1
+    body = []
+    for n, (text, votes) in enumerate(rows):
+        y = 10 + n * row_height
+        width = round(bar_width * votes / most, 1)
+        body.append(
+            f'<text x="{left - 8}" y="{y + 18}" text-anchor="end" {FONT}>'
+            f'{label(text)}</text>'
+            f'<rect x="{left}" y="{y + 4}" width="{width}" height="20" '
+            f'fill="{COLORS[n % len(COLORS)]}"/>'
+            f'<text x="{left + width + 6}" y="{y + 18}" {FONT}>{votes}</text>')
+    return svg(20 + len(rows) * row_height, title, body)
+
+
+def pie_chart(title, rows):
+    """
+    Draw a pie slice per choice with a legend.
+
+    :param title: The question text
+    :param rows: A list of (choice text, votes) tuples
+    :return: The SVG markup
+    """
+    cx, cy, radius = 110, 110, 100
+    total = sum(votes for _, votes in rows)
+    body = []
+    if not total:
+        body.append(f'<circle cx="{cx}" cy="{cy}" r="{radius}" fill="#eee"/>'
+                    f'<text x="{cx}" y="{cy + 5}" text-anchor="middle" '
+                    f'{FONT}>No votes yet</text>')
+    angle = -math.pi / 2
+    for n, (text, votes) in enumerate(rows):
+        color = COLORS[n % len(COLORS)]
+        if votes == total and total:
+            body.append(f'<circle cx="{cx}" cy="{cy}" r="{radius}" '
+                        f'fill="{color}"/>')
+        elif votes:
+            end = angle + 2 * math.pi * votes / total
+            large = 1 if end - angle > math.pi else 0
+            body.append(
+                f'<path d="M{cx},{cy} '
+                f'L{cx + radius * math.cos(angle):.2f},'
+                f'{cy + radius * math.sin(angle):.2f} '
+                f'A{radius},{radius} 0 {large} 1 '
+                f'{cx + radius * math.cos(end):.2f},'
+                f'{cy + radius * math.sin(end):.2f} Z" fill="{color}"/>')
+            angle = end
+        share = f" ({votes / total:.0%})" if total else ""
+        y = 20 + n * 22
+        body.append(f'<rect x="240" y="{y - 11}" width="12" height="12" '
+                    f'fill="{color}"/>'
+                    f'<text x="258" y="{y}" {FONT}>{label(text)}: '
+                    f'{votes}{share}</text>')
+    return svg(max(220, 20 + len(rows) * 22), title, body)
+
+
+def render_chart(question, kind):
+    """
+    Return the SVG chart of the results of a question.
+
+    Charts are cached per results version of the question, so the votes
+    are only counted again after they changed.
+
+    :param question: A Question
+    :param kind: One of KINDS
+    :return: The SVG markup as a string
+    """
+    key = f"polls:chart:{REVISION}:{question.pk}:{question.results_version}:{kind}"
+    chart = cache.get(key)
+    if chart is not None:
+        return chart
+    rows = [(text, votes + compacted) for text, votes, compacted in
+            Choice.objects.filter(question=question).order_by("id")
+            .annotate(vote_count=Count("vote"))
+            .values_list("choice_text", "vote_count", "compacted_votes")]
+    draw = pie_chart if kind == "pie" else bar_chart
+    chart = draw(question.question_text, rows)
+    cache.set(key, chart, CHART_CACHE_TIMEOUT)
+    return chart
@@ -0,0 +1,170 @@
+"""
+Static HTML export of the results of closed polls.
+
+The results page of every closed question is rendered to
+'<directory>/polls/<pk>/results/index.html', mirroring the results URL, so
+a plain file server or CDN can serve archived results. Its bar chart is
+written next to it as 'chart.svg' and linked relatively, so the archive
+does not depend on the live chart endpoint. A manifest in the
+directory keeps the content hash of each exported poll; a poll is only
+rendered again when its question, choices or results version change.
+"""
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+import django
+from django.contrib.auth.models import AnonymousUser
+from django.db import connections
+from django.test import RequestFactory
+from django.urls import reverse
+from django.utils import timezone
+from . import charts
+from .models import Choice, Question
+
+MANIFEST = ".export-manifest.json"
+# file name of the chart, next to the index.html of the results page
+CHART = "chart.svg"
+# number of polls rendered by a worker process at a time
+CHUNK_SIZE = 50
+
+
+def closed_questions():
+    """Return the questions whose voting period has ended."""
+    return Question.objects.filter(end_date__lt=timezone.now())
+
+
+def content_hashes(questions):
+    """
+    Hash everything shown on the results page of each question.
+
+    Every change of a poll's votes bumps its results version, so the
+    version stands in for the vote counts and no votes are counted.
+
+    :param questions: A queryset of questions
+    :return: A dict mapping question pks to hex digests
+    """
+    hashes = {}
+    rows = questions.order_by("pk").values_list(
+        "pk", "question_text", "pub_date", "end_date", "poll_type",
+        "results_version")
+    for pk, *fields in rows.iterator():
+        hashes[pk] = hashlib.sha256(
+            json.dumps(fields, default=str).encode())
+    choices = (Choice.objects.filter(question__in=questions).order_by("pk")
+               .values_list("question_id", "pk", "choice_text",
+                            "compacted_votes"))
+    for question_id, *fields in choices.iterator():
+        hashes[question_id].update(json.dumps(fields).encode())
+    return {pk: digest.hexdigest() for pk, digest in hashes.items()}
+
+
+def results_path(directory, pk):
+    """Return the file the results page of a question is exported to."""
+    url = reverse("polls:results", args=(pk,))
+    return os.path.join(directory, url.strip("/"), "index.html")
+
+
+def write_file(path, content):
+    """Write a file atomically, so the file server never serves half of it."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(f"{path}.tmp", "wb") as file:
+        file.write(content)
+    os.replace(f"{path}.tmp", path)
+
+
+def render_results(directory, pks):
+    """
+    Render the results pages of questions into the export directory.
+
+    Pages are rendered by the results view for an anonymous user, with
+    their bar chart written next to them.
+
+    :param directory: The export directory
+    :param pks: The pks of the questions to render
+    :return: A list of the pks whose page was written
+    """
+    # imported here so the views import after django.setup() in workers
+    from .views import ResultsView
+    view = ResultsView.as_view(extra_context={"chart_url": CHART})
+    factory = RequestFactory()
+    written = []
+    for pk in pks:
+        request = factory.get(reverse("polls:results", args=(pk,)))
+        request.user = AnonymousUser()
+        response = view(request, pk=pk)
+        if response.status_code != 200:
+            # deleted or no longer published since the hashes were taken
+            continue
+        path = results_path(directory, pk)
+        chart = charts.render_chart(response.context_data["question"], "bar")
+        write_file(os.path.join(os.path.dirname(path), CHART),
+                   chart.encode())
+        write_file(path, response.render().content)
+        written.append(pk)
+    return written
+
+
+def setup_worker(settings_module):
+    """Set up Django in a worker process started without fork."""
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", settings_module)
+    django.setup()
+
+
+def load_manifest(directory):
+    """Return the content hashes of the previous export of a directory."""
+    try:
+        with open(os.path.join(directory, MANIFEST), encoding="utf-8") as file:
+            return {int(pk): digest for pk, digest in json.load(file).items()}
+    except FileNotFoundError:
+        return {}
+
+
+def save_manifest(directory, manifest):
+    """Store the content hashes of the exported polls."""
+    path = os.path.join(directory, MANIFEST)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as file:
+        json.dump(manifest, file, indent=0, sort_keys=True)
+    os.replace(f"{path}.tmp", path)
+
+
+def export_results(directory, jobs=1, force=False):
+    """
+    Export the results pages of closed polls that changed.
+
+    :param directory: The export directory, created if missing
+    :param jobs: The number of worker processes, 1 renders in this process
+    :param force: Render every closed poll, e.g. after a template change
+    :return: A tuple of the number of rendered, unchanged and removed pages
+    """
+    os.makedirs(directory, exist_ok=True)
+    previous = {} if force else load_manifest(directory)
+    hashes = content_hashes(closed_questions())
+    stale = [pk for pk, digest in hashes.items()
+             if previous.get(pk) != digest]
+    chunks = [stale[n:n + CHUNK_SIZE] for n in range(0, len(stale), CHUNK_SIZE)]
+    if jobs > 1 and len(chunks) > 1:
+        # forked workers must not share this process's connections
+        connections.close_all()
+        with ProcessPoolExecutor(
+                max_workers=jobs, initializer=setup_worker,
+                initargs=(os.environ["DJANGO_SETTINGS_MODULE"],)) as pool:
+            done = pool.map(render_results, [directory] * len(chunks), chunks)
+            written = [pk for chunk in done for pk in chunk]
+    else:
+        written = [pk for chunk in chunks
+                   for pk in render_results(directory, chunk)]
+    manifest = {pk: digest for pk, digest in previous.items()
+                if pk in hashes}
+    manifest.update((pk, hashes[pk]) for pk in written)
+    # polls that were deleted or reopened are no longer archived
+    removed = [pk for pk in load_manifest(directory) if pk not in hashes]
+    for pk in removed:
+        path = results_path(directory, pk)
+        for file in (path, os.path.join(os.path.dirname(path), CHART)):
+            try:
+                os.remove(file)
+            except FileNotFoundError:
+                pass
+    save_manifest(directory, manifest)
+    return len(written), len(hashes) - len(stale), len(removed)
@@ -0,0 +1,52 @@
+"""Password hashers with work factors configured in the settings."""
+from django.conf import settings
+from django.contrib.auth.hashers import (Argon2PasswordHasher,
+                                         ScryptPasswordHasher)
+
+
+class TunedArgon2PasswordHasher(Argon2PasswordHasher):
+    """
+    Argon2 password hasher using the ARGON2_* settings.
+
+    Requires the argon2-cffi package. Hashes made with other parameters are
+    re-hashed the next time the user logs in.
+    """
+
+    @property
+    def time_cost(self):
+        """Return the number of Argon2 iterations."""
+        return settings.ARGON2_TIME_COST
+
+    @property
+    def memory_cost(self):
+        """Return the Argon2 memory size in KiB."""
+        return settings.ARGON2_MEMORY_COST
+
+    @property
+    def parallelism(self):
+        """Return the number of Argon2 lanes."""
+        return settings.ARGON2_PARALLELISM
+
+
+class TunedScryptPasswordHasher(ScryptPasswordHasher):
+    """
+    Scrypt password hasher using the SCRYPT_* settings.
+
+    Hashes made with other parameters are re-hashed the next time the
+    user logs in.
+    """
+
+    @property
+    def work_factor(self):
+        """Return the scrypt CPU/memory cost (a power of 2)."""
+        return settings.SCRYPT_WORK_FACTOR
+
+    @property
+    def block_size(self):
+        """Return the scrypt block size."""
+        return settings.SCRYPT_BLOCK_SIZE
+
+    @property
+    def parallelism(self):
+        """Return the scrypt parallelization parameter."""
+        return settings.SCRYPT_PARALLELISM
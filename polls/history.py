@@ -0,0 +1,185 @@
+"""
+Append-only history of vote changes.
+
+Every cast, change and clear of a vote is recorded as a VoteEvent. Events
+are buffered by each worker and written in batches by a background thread
+every HISTORY_FLUSH_INTERVAL seconds, or as soon as HISTORY_BATCH_SIZE
+events are waiting, so requests never wait for the history to be written.
+With HISTORY_FLUSH_INTERVAL = 0 there is no thread and full batches are
+written by the request that filled them. Events still buffered when a
+worker is killed are lost.
+
+The history can be replayed to rebuild the votes at any point in time.
+"""
+import atexit
+import ipaddress
+import logging
+import threading
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import DatabaseError, close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import Choice, Question, Vote, VoteEvent, VoterBitmap
+
+logger = logging.getLogger(__name__)
+
+
+class HistoryBuffer:
+    """The vote events a worker recorded but has not written yet."""
+
+    def __init__(self):
+        """Initialize an empty buffer without a writer thread."""
+        self.lock = threading.Lock()
+        self.events = []
+        self.wakeup = threading.Event()
+        self.writer = None
+
+    def record(self, **fields):
+        """Add an event to the buffer and hand over full batches."""
+        event = VoteEvent(created_at=timezone.now(), **fields)
+        with self.lock:
+            self.events.append(event)
+            full = len(self.events) >= settings.HISTORY_BATCH_SIZE
+            if settings.HISTORY_FLUSH_INTERVAL and self.writer is None:
+                self.writer = threading.Thread(
+                    target=self.write_forever, name="vote-history",
+                    daemon=True)
+                self.writer.start()
+        if not full:
+            return
+        if self.writer is not None:
+            self.wakeup.set()
+        else:
+            self.flush()
+
+    def write_forever(self):
+        """Write the buffered events in the background."""
+        while True:
+            self.wakeup.wait(settings.HISTORY_FLUSH_INTERVAL)
+            self.wakeup.clear()
+            close_old_connections()
+            try:
+                self.flush()
+            except DatabaseError:
+                logger.exception("Could not write the vote history, "
+                                 "retrying with the next batch.")
+
+    def flush(self):
+        """Write the buffered events, they are kept if writing fails."""
+        with self.lock:
+            events, self.events = self.events, []
+        if not events:
+            return
+        try:
+            VoteEvent.objects.bulk_create(events,
+                                          batch_size=settings.HISTORY_BATCH_SIZE)
+        except DatabaseError:
+            with self.lock:
+                self.events[:0] = events
+            raise
+
+
+buffer = HistoryBuffer()
+
+
+def record(user_id, question_id, action, choice_id=None, ranking=(),
+           ip=None):
+    """
+    Add a vote event to this worker's history.
+
+    :param user_id: The id of the user whose vote changed
+    :param question_id: The id of the question voted on
+    :param action: One of VoteEvent.CAST, CHANGE or CLEAR
+    :param choice_id: The id of the selected choice, None for clears
+    :param ranking: The ranked choice ids for ranked choice polls
+    :param ip: The client IP, kept only if it is a valid address
+    """
+    try:
+        ip = str(ipaddress.ip_address(ip.strip())) if ip else None
+    except ValueError:
+        # forwarded-for headers are client supplied
+        ip = None
+    buffer.record(user_id=user_id, question_id=question_id, action=action,
+                  choice_id=choice_id, ranking=list(ranking), ip=ip)
+
+
+@atexit.register
+def flush_on_exit():
+    """Write the buffered events when the worker exits."""
+    try:
+        buffer.flush()
+    except DatabaseError:
+        logger.exception("Could not write the vote history on exit.")
+
+
+def replay(until=None, question_ids=None):
+    """
+    Rebuild the votes at a point in time from the history.
+
+    :param until: Replay the events up to this time, defaults to now
+    :param question_ids: Only replay the events of these questions
+    :return: A dict mapping (user id, question id) to a tuple of the
+    choice id, the ranking, the time the vote was first cast and the time
+    it was last changed.
+    """
+    events = VoteEvent.objects.filter(created_at__lte=until or timezone.now())
+    if question_ids is not None:
+        events = events.filter(question_id__in=question_ids)
+    votes = {}
+    rows = events.order_by("created_at", "id").values_list(
+        "user_id", "question_id", "action", "choice_id", "ranking",
+        "created_at")
+    for user_id, question_id, action, choice_id, ranking, when in (
+            rows.iterator(chunk_size=2000)):
+        key = (user_id, question_id)
+        if action == VoteEvent.CLEAR:
+            votes.pop(key, None)
+        else:
+            cast_at = votes[key][2] if key in votes else when
+            votes[key] = (choice_id, ranking, cast_at, when)
+    return votes
+
+
+def restore_votes(votes, question_ids):
+    """
+    Replace the votes of questions with replayed votes.
+
+    Votes for choices or by users that no longer exist are skipped. So are
+    compacted questions: their votes were folded into vote counts and a
+    voter bitmap, possibly before the history was kept, so restored votes
+    would be counted twice.
+
+    :param votes: Replayed votes as returned by replay()
+    :param question_ids: The questions whose votes are replaced
+    :return: A tuple of the number of restored votes and the list of ids
+    of the skipped compacted questions
+    """
+    question_ids = set(question_ids)
+    compacted = sorted(VoterBitmap.objects.filter(
+        question_id__in=question_ids).values_list("question_id", flat=True))
+    question_ids.difference_update(compacted)
+    choices = set(Choice.objects.filter(question_id__in=question_ids)
+                  .values_list("pk", flat=True))
+    restored = [
+        Vote(user_id=user_id, question_id=question_id, choice_id=choice_id,
+             ranking=ranking, created_at=cast_at, updated_at=changed_at)
+        for (user_id, question_id), (choice_id, ranking, cast_at, changed_at)
+        in votes.items()
+        if question_id in question_ids and choice_id in choices]
+    users = set(User.objects.filter(
+        pk__in={vote.user_id for vote in restored})
+        .values_list("pk", flat=True))
+    restored = [vote for vote in restored if vote.user_id in users]
+    with transaction.atomic():
+        Vote.objects.filter(question_id__in=question_ids).delete()
+        created = Vote.objects.bulk_create(restored, batch_size=1000)
+        # bulk_create sets the automatic timestamps to now
+        for vote in created:
+            original = votes[(vote.user_id, vote.question_id)]
+            vote.created_at, vote.updated_at = original[2], original[3]
+        Vote.objects.bulk_update(created, ["created_at", "updated_at"],
+                                 batch_size=1000)
+        Question.objects.filter(pk__in=question_ids).update(
+            results_version=F("results_version") + 1)
+    return len(created), compacted
@@ -0,0 +1,103 @@
+"""
+Idempotency-Key support for POST views.
+
+A client may send an 'Idempotency-Key' header with a POST. The first
+request with a key claims it in the cache and its response is recorded
+for IDEMPOTENCY_TTL seconds, retries with the same key are answered with
+the recorded response without running the view again. Keys are scoped
+to the session and the request path.
+"""
+import functools
+import hashlib
+import logging
+import time
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse, HttpResponseBadRequest
+
+logger = logging.getLogger(__name__)
+
+HEADER = "HTTP_IDEMPOTENCY_KEY"
+MAX_KEY_LENGTH = 255
+# the value of a claimed key while its first request is still running
+PENDING = "pending"
+# seconds between checks for the response of a running request
+POLL_INTERVAL = 0.05
+# headers replayed with a recorded response
+REPLAYED_HEADERS = ("Content-Type", "Location")
+
+
+def cache_key(request, key):
+    """Return the cache key of an idempotency key of a request."""
+    session = request.COOKIES.get(settings.SESSION_COOKIE_NAME, "")
+    scope = f"{session}:{request.path}:{key}".encode()
+    return f"idempotency:{hashlib.sha256(scope).hexdigest()}"
+
+
+def record(response):
+    """Return the parts of a response that are replayed."""
+    headers = {name: response[name] for name in REPLAYED_HEADERS
+               if name in response}
+    return {"status": response.status_code, "headers": headers,
+            "content": response.content}
+
+
+def replay(recorded):
+    """Build a response from a recorded response."""
+    response = HttpResponse(recorded["content"], status=recorded["status"])
+    for name, value in recorded["headers"].items():
+        response[name] = value
+    response["Idempotent-Replayed"] = "true"
+    return response
+
+
+def wait_for_response(cache, key):
+    """
+    Wait for the first request of a key to record its response.
+
+    :return: The recorded response, or None if it was not recorded within
+    IDEMPOTENCY_WAIT seconds.
+    """
+    deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT
+    while True:
+        recorded = cache.get(key)
+        if recorded != PENDING:
+            return recorded
+        if time.monotonic() >= deadline:
+            return None
+        time.sleep(POLL_INTERVAL)
+
+
+def idempotent(view):
+    """Make a POST view answer retries with the same key only once."""
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        idempotency_key = request.META.get(HEADER)
+        if request.method != "POST" or not idempotency_key:
+            return view(request, *args, **kwargs)
+        if len(idempotency_key) > MAX_KEY_LENGTH:
+            return HttpResponseBadRequest("Idempotency-Key is too long")
+        cache = caches[settings.IDEMPOTENCY_CACHE]
+        key = cache_key(request, idempotency_key)
+        if not cache.add(key, PENDING, settings.IDEMPOTENCY_TTL):
+            recorded = wait_for_response(cache, key)
+            if recorded is not None:
+                logger.info(f"Replayed the response to {request.path} for "
+                            f"Idempotency-Key {idempotency_key}")
+                return replay(recorded)
+            response = HttpResponse("A request with this Idempotency-Key "
+                                    "is still running", status=409)
+            response["Retry-After"] = "1"
+            return response
+        try:
+            response = view(request, *args, **kwargs)
+        except Exception:
+            cache.delete(key)
+            raise
+        if response.status_code >= 500 or response.streaming:
+            # failed requests may be retried with the same key
+            cache.delete(key)
+        else:
+            cache.set(key, record(response), settings.IDEMPOTENCY_TTL)
+        return response
+    return wrapper
@@ -0,0 +1,175 @@
+"""
+Bulk import of poll definitions.
+
+A poll definition is a mapping with a 'question_text', a list of
+'choices' and optionally a 'pub_date' and 'end_date' (ISO 8601 date or
+date and time) and a 'poll_type'. Definitions are read from JSONL (one
+poll per line), JSON (a list of polls) or YAML (a list of polls).
+"""
+import datetime
+import json
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date as parse_day, parse_datetime
+from .models import Choice, Question
+
+FORMATS = ("jsonl", "json", "yaml")
+# number of polls inserted per pair of bulk inserts
+BATCH_SIZE = 500
+
+
+class PollDefinitionError(ValueError):
+    """Raised when poll definitions can not be read or are invalid."""
+
+
+def guess_format(filename):
+    """Return the definition format of a file from its extension."""
+    extension = filename.rsplit(".", 1)[-1].lower()
+    if extension in ("yml", "yaml"):
+        return "yaml"
+    if extension in ("jsonl", "ndjson"):
+        return "jsonl"
+    if extension == "json":
+        return "json"
+    raise PollDefinitionError(f"Unknown poll definition format: {filename}")
+
+
+def parse_definitions(text, format):
+    """
+    Read the poll definitions of a document.
+
+    :param text: The document's text
+    :param format: One of FORMATS
+    :return: A list of poll definitions
+    :raises PollDefinitionError: if the document can not be parsed.
+    """
+    if format == "yaml":
+        try:
+            import yaml
+        except ImportError:
+            raise PollDefinitionError("YAML definitions require PyYAML, "
+                                      "install it with: pip install pyyaml")
+        errors = yaml.YAMLError
+    elif format in FORMATS:
+        errors = json.JSONDecodeError
+    else:
+        raise PollDefinitionError(f"Unknown format: {format}")
+    try:
+        if format == "jsonl":
+            definitions = [json.loads(line) for line in text.splitlines()
+                           if line.strip()]
+        elif format == "json":
+            definitions = json.loads(text)
+        else:
+            definitions = yaml.safe_load(text) or []
+    except errors as error:
+        raise PollDefinitionError(f"Could not read the polls: {error}")
+    if not isinstance(definitions, list):
+        raise PollDefinitionError("The document must be a list of polls")
+    return definitions
+
+
+def to_datetime(value):
+    """
+    Convert a date of a poll definition to a datetime.
+
+    :param value: An ISO 8601 date or date and time, or a date or datetime
+    as loaded from YAML. A date alone is midnight of that day.
+    :return: A datetime, None if the value is not a date
+    :raises ValueError: if the value is well formed but not a valid date.
+    """
+    if isinstance(value, datetime.datetime):
+        return value
+    if isinstance(value, datetime.date):
+        return datetime.datetime.combine(value, datetime.time())
+    if not isinstance(value, str):
+        return None
+    date = parse_datetime(value)
+    if date is None:
+        day = parse_day(value)
+        date = day and datetime.datetime.combine(day, datetime.time())
+    return date
+
+
+def parse_date(value, field, number):
+    """Parse an optional date of a poll definition."""
+    if value is None:
+        return None
+    try:
+        date = to_datetime(value)
+    except ValueError:
+        date = None
+    if date is None:
+        raise PollDefinitionError(f"Poll {number}: invalid {field} "
+                                  f"'{value}'")
+    if timezone.is_naive(date):
+        date = timezone.make_aware(date)
+    return date
+
+
+def build_poll(definition, number):
+    """
+    Validate a poll definition and build its (unsaved) question.
+
+    :param definition: A poll definition
+    :param number: The poll's position in the document, for error messages
+    :return: A tuple of the Question and the list of its choice texts
+    :raises PollDefinitionError: if the definition is invalid.
+    """
+    if not isinstance(definition, dict):
+        raise PollDefinitionError(f"Poll {number}: must be a mapping")
+    text = definition.get("question_text")
+    if not isinstance(text, str) or not text.strip() or len(text) > 200:
+        raise PollDefinitionError(f"Poll {number}: question_text must be "
+                                  f"1 to 200 characters")
+    choices = definition.get("choices")
+    if not isinstance(choices, list) or not choices or not all(
+            isinstance(choice, str) and choice.strip() and len(choice) <= 200
+            for choice in choices):
+        raise PollDefinitionError(f"Poll {number}: choices must be a list "
+                                  f"of texts of 1 to 200 characters")
+    poll_type = definition.get("poll_type", Question.SINGLE)
+    if poll_type not in dict(Question.POLL_TYPES):
+        raise PollDefinitionError(f"Poll {number}: unknown poll_type "
+                                  f"'{poll_type}'")
+    pub_date = (parse_date(definition.get("pub_date"), "pub_date", number)
+                or timezone.now())
+    end_date = parse_date(definition.get("end_date"), "end_date", number)
+    if end_date and end_date < pub_date:
+        raise PollDefinitionError(f"Poll {number}: end_date is before "
+                                  f"pub_date")
+    question = Question(question_text=text, pub_date=pub_date,
+                        end_date=end_date, poll_type=poll_type)
+    # bulk inserts skip save(), which sets the status
+    question.status = question.lifecycle_status()
+    return question, choices
+
+
+def import_polls(definitions, dry_run=False, batch_size=BATCH_SIZE):
+    """
+    Validate poll definitions and insert them.
+
+    Every definition is validated before anything is written. The polls
+    are then inserted in a single transaction, each batch with one bulk
+    insert of questions and one of their choices.
+
+    :param definitions: A list of poll definitions
+    :param dry_run: Only validate the definitions if True
+    :param batch_size: The number of polls inserted per batch
+    :return: The number of polls (to be) imported
+    :raises PollDefinitionError: if a definition is invalid.
+    """
+    polls = [build_poll(definition, number)
+             for number, definition in enumerate(definitions, 1)]
+    if dry_run:
+        return len(polls)
+    with transaction.atomic():
+        for start in range(0, len(polls), batch_size):
+            batch = polls[start:start + batch_size]
+            questions = Question.objects.bulk_create(
+                [question for question, _ in batch])
+            Choice.objects.bulk_create(
+                [Choice(question=question, choice_text=text)
+                 for question, (_, texts) in zip(questions, batch)
+                 for text in texts])
+    return len(polls)
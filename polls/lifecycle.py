@@ -0,0 +1,108 @@
+"""
+Scheduler of the lifecycle status of polls.
+
+Questions store whether they are scheduled, open or closed so listings can
+use the partial indexes on the dates of scheduled and open polls. Saving a
+question sets its status from its dates; the scheduler moves the status
+along when a pub_date or end_date passes. Instead of polling, it sleeps
+until the next of those dates, which it finds with the same indexes.
+"""
+import logging
+import time
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Min
+from django.utils import timezone
+from . import tasks
+from .models import Question
+
+logger = logging.getLogger(__name__)
+
+
+def advance(now=None):
+    """
+    Update the status of the polls whose pub_date or end_date passed.
+
+    Only polls this call moves from open to closed get the email of their
+    results, enqueued in the transaction that closes them. Each poll is
+    closed by its own conditional update, so when another scheduler or a
+    save closed it first the update count is 0 and it is not notified
+    twice. Polls that were published and ended since their status was
+    last set, such as polls loaded from fixtures, are closed without an
+    email since they were never open.
+
+    :param now: The time the dates are compared with, defaults to now
+    :return: A tuple of the pks of the opened polls and of the closed polls
+    """
+    now = now or timezone.now()
+    closed = []
+    with transaction.atomic():
+        ended = list(Question.objects.filter(
+            status=Question.OPEN, end_date__lt=now)
+            .values_list("pk", flat=True))
+        for pk in ended:
+            if Question.objects.filter(pk=pk, status=Question.OPEN).update(
+                    status=Question.CLOSED):
+                tasks.enqueue("notify_poll_closed", question_id=pk)
+                closed.append(pk)
+    due = Question.objects.filter(status=Question.SCHEDULED, pub_date__lte=now)
+    passed = list(due.filter(end_date__lt=now).values_list("pk", flat=True))
+    opened = list(due.exclude(pk__in=passed).values_list("pk", flat=True))
+    Question.objects.filter(pk__in=passed, status=Question.SCHEDULED).update(
+        status=Question.CLOSED)
+    Question.objects.filter(pk__in=opened, status=Question.SCHEDULED).update(
+        status=Question.OPEN)
+    return opened, closed + passed
+
+
+def next_transition():
+    """
+    Return the next date a poll changes status.
+
+    :return: The earliest pub_date of the scheduled polls or end_date of
+    the open polls, None if no poll will change status.
+    """
+    dates = [
+        Question.objects.filter(status=Question.SCHEDULED).aggregate(
+            date=Min("pub_date"))["date"],
+        Question.objects.filter(status=Question.OPEN).aggregate(
+            date=Min("end_date"))["date"],
+    ]
+    return min((date for date in dates if date), default=None)
+
+
+def run(stop=None, once=False, max_sleep=None):
+    """
+    Advance the status of polls at every pub_date and end_date.
+
+    Polls saved while the scheduler sleeps already have the status of
+    their dates, only a new date before the next wake up is noticed late,
+    by at most max_sleep seconds.
+
+    :param stop: A threading.Event that stops the scheduler when set
+    :param once: Advance the statuses once and return
+    :param max_sleep: The longest sleep in seconds, defaults to
+    SCHEDULER_MAX_SLEEP
+    """
+    if max_sleep is None:
+        max_sleep = settings.SCHEDULER_MAX_SLEEP
+    try:
+        while not (stop and stop.is_set()):
+            close_old_connections()
+            opened, closed = advance()
+            if opened or closed:
+                logger.info(f"Opened {len(opened)} and closed {len(closed)} "
+                            f"polls.")
+            if once:
+                break
+            upcoming = next_transition()
+            delay = max_sleep
+            if upcoming is not None:
+                wait = (upcoming - timezone.now()).total_seconds()
+                delay = min(max_sleep, max(wait, 0))
+            if stop:
+                stop.wait(delay)
+            else:
+                time.sleep(delay)
+    finally:
+        close_old_connections()
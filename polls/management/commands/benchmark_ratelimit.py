@@ -0,0 +1,49 @@
+"""Command for measuring the overhead of the rate limiting middleware."""
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.http import HttpResponse
+from django.test import RequestFactory
+from django.urls import resolve, reverse
+from polls.ratelimit import RateLimitMiddleware
+
+
+class Command(BaseCommand):
+    """
+    Time the rate limit check of a request.
+
+    Requests to the vote URL are passed through the middleware's
+    process_view with a fresh client IP each time, the view itself is
+    never called.
+    """
+
+    help = "Measure the per request overhead of the rate limiter."
+
+    def add_arguments(self, parser):
+        """Add the number of requests argument."""
+        parser.add_argument("--count", type=int, default=100000,
+                            help="Number of requests to time "
+                                 "(default 100000).")
+
+    def handle(self, *args, **options):
+        """Time process_view for allowed and limited requests."""
+        count = options["count"]
+        middleware = RateLimitMiddleware(lambda request: HttpResponse())
+        factory = RequestFactory()
+        url = reverse("polls:vote", args=(1,))
+        match = resolve(url)
+        requests = []
+        for n in range(count):
+            request = factory.post(
+                url, REMOTE_ADDR=f"10.{n >> 16 & 255}.{n >> 8 & 255}."
+                                 f"{n & 255}")
+            request.resolver_match = match
+            request.session = {}
+            requests.append(request)
+        start = time.perf_counter()
+        for request in requests:
+            middleware.process_view(request, match.func, (), match.kwargs)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f"Cache: {settings.RATELIMIT_CACHE}")
+        self.stdout.write(f"{count} rate limit checks in {elapsed:.3f}s: "
+                          f"{elapsed / count * 1e6:.1f} µs per request")
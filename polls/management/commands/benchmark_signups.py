@@ -0,0 +1,51 @@
+"""Command for measuring how many users can register per second."""
+import time
+from django.conf import settings
+from django.contrib.auth.hashers import get_hasher
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import Client
+from django.urls import reverse
+
+
+class Command(BaseCommand):
+    """
+    Benchmark the register view on a single core.
+
+    Signups go through the full request path (middleware, form validation,
+    password hashing, login) and are rolled back afterwards.
+    """
+
+    help = "Measure signups per second per core with the current hasher."
+
+    def add_arguments(self, parser):
+        """Add the number of signups argument."""
+        parser.add_argument("--count", type=int, default=20,
+                            help="Number of signups to time (default 20).")
+
+    def handle(self, *args, **options):
+        """Register users in a rolled back transaction and time them."""
+        count = options["count"]
+        client = Client()
+        url = reverse("register")
+        with transaction.atomic():
+            start = time.perf_counter()
+            for n in range(count):
+                response = client.post(url, {
+                    "username": f"signup-{n}",
+                    "password1": "Tr0ub4dor&3-horse",
+                    "password2": "Tr0ub4dor&3-horse"},
+                    # spread the signups over IPs to stay under rate limits
+                    REMOTE_ADDR=f"10.0.{n // 256 % 256}.{n % 256}")
+                if response.status_code != 302:
+                    self.stderr.write(f"Signup {n} failed with status "
+                                      f"{response.status_code}")
+                client.logout()
+            elapsed = time.perf_counter() - start
+            transaction.set_rollback(True)
+        hasher = get_hasher()
+        self.stdout.write(f"Hasher: {hasher.algorithm} "
+                          f"(profile {settings.PASSWORD_HASHER})")
+        self.stdout.write(f"{count} signups in {elapsed:.2f}s: "
+                          f"{count / elapsed:.1f} signups/s per core, "
+                          f"{elapsed / count * 1000:.1f} ms per signup")
@@ -0,0 +1,123 @@
+"""Command for measuring the cold start of a server process."""
+import os
+import statistics
+import subprocess
+import sys
+import time
+from urllib.error import HTTPError, URLError
+from urllib.request import urlopen
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+def fetch(url):
+    """
+    Request a URL.
+
+    :return: The HTTP status, None if the server does not answer yet
+    """
+    try:
+        with urlopen(url, timeout=10) as response:
+            response.read()
+            return response.status
+    except HTTPError as error:
+        return error.code
+    except (URLError, ConnectionError):
+        return None
+
+
+def wait_for(url, status, start, timeout):
+    """
+    Request a URL until it answers with a status.
+
+    :return: The seconds from start until it did
+    """
+    while fetch(url) != status:
+        if time.perf_counter() - start > timeout:
+            raise CommandError(f"{url} did not return {status} within "
+                               f"{timeout}s")
+        time.sleep(0.01)
+    return time.perf_counter() - start
+
+
+def measure(port, path, warm_up, requests, timeout):
+    """
+    Start a server process and time its first requests.
+
+    :return: A dict of the seconds from starting the process until it is
+    alive, ready and answered the first request to path, and of the
+    latency of the first and of later requests to path.
+    """
+    env = dict(os.environ, WARM_UP=str(warm_up),
+               DJANGO_SETTINGS_MODULE=settings.SETTINGS_MODULE)
+    base = f"http://127.0.0.1:{port}"
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "manage.py", "runserver", "--noreload",
+         "--skip-checks", f"127.0.0.1:{port}"],
+        cwd=settings.BASE_DIR, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        result = {"alive": wait_for(f"{base}/healthz", 200, start, timeout)}
+        result["ready"] = wait_for(f"{base}/readyz", 200, start, timeout)
+        request_start = time.perf_counter()
+        fetch(f"{base}{path}")
+        result["first_byte"] = time.perf_counter() - start
+        result["first_request"] = time.perf_counter() - request_start
+        latencies = []
+        for _ in range(requests):
+            request_start = time.perf_counter()
+            fetch(f"{base}{path}")
+            latencies.append(time.perf_counter() - request_start)
+        result["later_requests"] = statistics.median(latencies)
+    finally:
+        server.terminate()
+        server.wait()
+    return result
+
+
+class Command(BaseCommand):
+    """
+    Compare the start of a server process with and without warm-up.
+
+    Each run starts 'manage.py runserver' like entrypoint.sh does, waits
+    until /healthz and /readyz answer, then requests a page. Without
+    warm-up the process is ready as soon as it is alive and the first
+    request pays for loading the views and templates; with warm-up that
+    cost moves before /readyz, so the first request is as fast as later
+    ones. Uses the configured database.
+    """
+
+    help = "Measure cold start to first byte with and without warm-up."
+
+    def add_arguments(self, parser):
+        """Add the runs, port, path and requests arguments."""
+        parser.add_argument("--runs", type=int, default=3,
+                            help="Server starts per mode (default 3).")
+        parser.add_argument("--port", type=int, default=8765,
+                            help="Port of the server (default 8765).")
+        parser.add_argument("--path", default="/polls/",
+                            help="Page requested (default /polls/).")
+        parser.add_argument("--requests", type=int, default=5,
+                            help="Requests timed after the first one "
+                                 "(default 5).")
+        parser.add_argument("--timeout", type=float, default=60,
+                            help="Seconds to wait for the server "
+                                 "(default 60).")
+
+    def handle(self, *args, **options):
+        """Start the servers and report the median timings of each mode."""
+        for warm_up in (False, True):
+            runs = [measure(options["port"], options["path"], warm_up,
+                            options["requests"], options["timeout"])
+                    for _ in range(options["runs"])]
+            timings = {key: statistics.median(run[key] for run in runs) * 1000
+                       for key in runs[0]}
+            self.stdout.write(
+                f"{'warm-up' if warm_up else 'cold'}: "
+                f"alive {timings['alive']:.0f} ms, "
+                f"ready {timings['ready']:.0f} ms, "
+                f"first byte of {options['path']} "
+                f"{timings['first_byte']:.0f} ms, "
+                f"first request {timings['first_request']:.1f} ms, "
+                f"later requests {timings['later_requests']:.1f} ms")
@@ -0,0 +1,76 @@
+"""Command for compacting the votes of long closed polls."""
+import datetime
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Exists, F, OuterRef
+from django.utils import timezone
+from polls.models import Choice, Question, Vote, VoterBitmap
+
+
+def compact_question(question):
+    """
+    Replace the votes of a question by counts and a voter bitmap.
+
+    The vote count of each choice is added to its 'compacted_votes' and the
+    voters are added to the question's voter bitmap, then the votes are
+    deleted. Which choice a user voted for is not kept.
+
+    :param question: A closed single choice question
+    :return: The number of deleted votes
+    """
+    with transaction.atomic():
+        votes = Vote.objects.filter(question=question)
+        counts = votes.order_by().values("choice").annotate(count=Count("id"))
+        for row in counts:
+            Choice.objects.filter(pk=row["choice"]).update(
+                compacted_votes=F("compacted_votes") + row["count"])
+        bitmap, _ = (VoterBitmap.objects.select_for_update()
+                     .get_or_create(question=question))
+        bitmap.add(votes.values_list("user_id", flat=True).iterator())
+        bitmap.save()
+        deleted, _ = votes.delete()
+        question.bump_results_version()
+    return deleted
+
+
+class Command(BaseCommand):
+    """
+    Compact the votes of single choice polls closed a long time ago.
+
+    Per user votes are replaced by vote counts on the choices and a bitmap
+    of the voters, so results and "has this user voted" still work while
+    the vote table only keeps recent polls. Ranked choice polls keep their
+    ballots since the runoff needs them. Only compact polls that will not
+    be reopened.
+    """
+
+    help = "Replace the votes of long closed polls by counts and bitmaps."
+
+    def add_arguments(self, parser):
+        """Add the days and dry run arguments."""
+        parser.add_argument(
+            "--days", type=int, default=settings.VOTE_COMPACT_AFTER_DAYS,
+            help="Compact polls closed at least this many days ago "
+                 "(default VOTE_COMPACT_AFTER_DAYS).")
+        parser.add_argument("--dry-run", action="store_true",
+                            help="Only list the polls to compact.")
+
+    def handle(self, *args, **options):
+        """Compact each eligible poll in its own transaction."""
+        cutoff = timezone.now() - datetime.timedelta(days=options["days"])
+        questions = (Question.objects
+                     .filter(end_date__lt=cutoff, poll_type=Question.SINGLE)
+                     .filter(Exists(Vote.objects.filter(
+                         question=OuterRef("pk")))))
+        polls = votes = 0
+        for question in list(questions):
+            if options["dry_run"]:
+                self.stdout.write(f"Would compact {question.pk}.) {question}")
+            else:
+                votes += compact_question(question)
+            polls += 1
+        if options["dry_run"]:
+            self.stdout.write(f"{polls} polls can be compacted.")
+        else:
+            self.stdout.write(f"Compacted {votes} votes of {polls} polls.")
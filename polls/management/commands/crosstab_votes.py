@@ -0,0 +1,34 @@
+"""Command for cross-tabulating the votes of several polls."""
+from django.core.management.base import BaseCommand, CommandError
+from polls.analytics import CHUNK_SIZE, crosstabs
+
+
+class Command(BaseCommand):
+    """Print how the voters of each pair of questions voted on the other."""
+
+    help = ("Cross-tabulate the votes of every pair of the given questions "
+            "and print association and agreement scores.")
+
+    def add_arguments(self, parser):
+        """Add the question ids and the chunk size arguments."""
+        parser.add_argument("question_ids", nargs="+", type=int)
+        parser.add_argument(
+            "--chunk-size", type=int, default=CHUNK_SIZE,
+            help=f"Votes loaded at a time (default {CHUNK_SIZE}).")
+
+    def handle(self, *args, **options):
+        """Print the cross-tabulation of each pair of questions."""
+        if len(set(options["question_ids"])) < 2:
+            raise CommandError("At least 2 different questions are needed.")
+        tables = crosstabs(options["question_ids"], options["chunk_size"])
+        if not tables:
+            raise CommandError("At least 2 of the questions must exist.")
+        for table in tables:
+            agreement = table.agreement()
+            self.stdout.write(str(table))
+            self.stdout.write(f"Common voters: {table.voters}")
+            self.stdout.write(f"Association (Cramér's V): "
+                              f"{table.association():.3f}")
+            if agreement is not None:
+                self.stdout.write(f"Agreement: {agreement:.1%}")
+            self.stdout.write("")
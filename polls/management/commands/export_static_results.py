@@ -0,0 +1,36 @@
+"""Command for exporting the results of closed polls as static HTML."""
+import os
+import time
+from django.core.management.base import BaseCommand
+from polls.export import export_results
+
+
+class Command(BaseCommand):
+    """
+    Render the results page of every closed poll to a directory tree.
+
+    The tree mirrors the results URLs ('polls/<pk>/results/index.html') so a
+    file server or CDN can serve it. Only polls whose content hash changed
+    since the last export are rendered again.
+    """
+
+    help = "Export the results pages of closed polls as static HTML."
+
+    def add_arguments(self, parser):
+        """Add the directory, jobs and force arguments."""
+        parser.add_argument("directory")
+        parser.add_argument("--jobs", type=int, default=os.cpu_count(),
+                            help="Worker processes used to render pages "
+                                 "(default: the number of CPUs).")
+        parser.add_argument("--force", action="store_true",
+                            help="Render every closed poll, e.g. after the "
+                                 "results template changed.")
+
+    def handle(self, *args, **options):
+        """Export the changed results pages and report the counts."""
+        start = time.perf_counter()
+        rendered, unchanged, removed = export_results(
+            options["directory"], options["jobs"], options["force"])
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f"Rendered {rendered} results pages, {unchanged} "
+                          f"unchanged, {removed} removed in {elapsed:.2f}s.")
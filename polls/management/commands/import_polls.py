@@ -0,0 +1,42 @@
+"""Command for importing many polls from a definition file."""
+import time
+from django.core.management.base import BaseCommand, CommandError
+from polls.importer import (BATCH_SIZE, FORMATS, PollDefinitionError,
+                            guess_format, import_polls, parse_definitions)
+
+
+class Command(BaseCommand):
+    """Import polls and their choices from a JSONL, JSON or YAML file."""
+
+    help = ("Import polls from a JSONL, JSON or YAML file. Each poll has a "
+            "question_text, a list of choices and an optional pub_date, "
+            "end_date and poll_type.")
+
+    def add_arguments(self, parser):
+        """Add the file, format, dry run and batch size arguments."""
+        parser.add_argument("file")
+        parser.add_argument("--format", choices=FORMATS,
+                            help="Definition format (default: guessed from "
+                                 "the file extension).")
+        parser.add_argument("--dry-run", action="store_true",
+                            help="Only validate the definitions.")
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE,
+                            help=f"Polls per bulk insert "
+                                 f"(default {BATCH_SIZE}).")
+
+    def handle(self, *args, **options):
+        """Read, validate and import the polls."""
+        try:
+            format = options["format"] or guess_format(options["file"])
+            with open(options["file"], encoding="utf-8") as file:
+                definitions = parse_definitions(file.read(), format)
+            start = time.perf_counter()
+            count = import_polls(definitions, options["dry_run"],
+                                 options["batch_size"])
+        except (OSError, PollDefinitionError) as error:
+            raise CommandError(error)
+        elapsed = time.perf_counter() - start
+        if options["dry_run"]:
+            self.stdout.write(f"{count} polls are valid.")
+        else:
+            self.stdout.write(f"Imported {count} polls in {elapsed:.2f}s.")
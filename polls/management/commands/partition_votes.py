@@ -0,0 +1,98 @@
+"""Command for maintaining the partitions of the vote table."""
+import re
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+BOUND = re.compile(r"FROM \('?(\d+)'?\) TO \('?(\d+)'?\)")
+
+
+def partition_bounds(cursor):
+    """
+    Return the question id ranges of the vote table's partitions.
+
+    :return: A sorted list of (start, end) tuples, the default partition
+    is left out.
+    """
+    cursor.execute(
+        "SELECT pg_get_expr(child.relpartbound, child.oid) "
+        "FROM pg_inherits JOIN pg_class child ON child.oid = inhrelid "
+        "WHERE inhparent = 'polls_vote'::regclass")
+    bounds = []
+    for expression, in cursor.fetchall():
+        match = BOUND.search(expression)
+        if match:
+            bounds.append((int(match[1]), int(match[2])))
+    return sorted(bounds)
+
+
+def create_partition(cursor, start, end):
+    """
+    Add the partition for the votes of questions start to end - 1.
+
+    Votes of these questions that landed in the default partition are
+    moved into the new partition before it is attached.
+    """
+    name = f"polls_vote_q{start}"
+    cursor.execute(f"CREATE TABLE {name} (LIKE polls_vote INCLUDING DEFAULTS)")
+    cursor.execute(
+        f"WITH moved AS (DELETE FROM polls_vote_default "
+        f"WHERE question_id >= %s AND question_id < %s RETURNING *) "
+        f"INSERT INTO {name} SELECT * FROM moved", [start, end])
+    cursor.execute(f"ALTER TABLE polls_vote ATTACH PARTITION {name} "
+                   f"FOR VALUES FROM ({start}) TO ({end})")
+    return name
+
+
+class Command(BaseCommand):
+    """
+    Create the vote table partitions for upcoming questions.
+
+    polls_vote is partitioned by ranges of question ids on PostgreSQL.
+    Votes of questions above the last range go to the default partition,
+    run this command regularly so new questions get their own partition
+    before they are created.
+    """
+
+    help = "Create vote table partitions ahead of new questions."
+
+    def add_arguments(self, parser):
+        """Add the size and ahead arguments."""
+        parser.add_argument(
+            "--size", type=int, default=settings.VOTE_PARTITION_SIZE,
+            help="Questions per new partition (default "
+                 "VOTE_PARTITION_SIZE).")
+        parser.add_argument(
+            "--ahead", type=int, default=settings.VOTE_PARTITIONS_AHEAD,
+            help="Partitions to keep ready above the newest question "
+                 "(default VOTE_PARTITIONS_AHEAD).")
+
+    def handle(self, *args, **options):
+        """Create the missing partitions and report the default partition."""
+        if connection.vendor != "postgresql":
+            self.stdout.write("Vote partitioning requires PostgreSQL, "
+                              "nothing to do.")
+            return
+        size = options["size"]
+        with transaction.atomic(), connection.cursor() as cursor:
+            bounds = partition_bounds(cursor)
+            if not bounds:
+                raise CommandError("polls_vote is not partitioned, "
+                                   "run migrate first.")
+            cursor.execute("SELECT coalesce(max(id), 0) FROM polls_question")
+            highest = cursor.fetchone()[0]
+            end = bounds[-1][1]
+            target = (highest // size + 1 + options["ahead"]) * size
+            created = []
+            while end < target:
+                created.append(create_partition(cursor, end, end + size))
+                end += size
+            cursor.execute("SELECT count(*) FROM polls_vote_default")
+            leftover = cursor.fetchone()[0]
+        for name in created:
+            self.stdout.write(f"Created partition {name}.")
+        self.stdout.write(f"{len(bounds) + len(created)} partitions cover "
+                          f"questions up to id {end - 1}.")
+        if leftover:
+            self.stderr.write(f"{leftover} votes are in the default "
+                              f"partition.")
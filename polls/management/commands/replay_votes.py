@@ -0,0 +1,102 @@
+"""Command for rebuilding votes from the vote history."""
+from collections import Counter
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from polls import history
+from polls.models import Choice, Question
+
+
+def parse_time(value):
+    """
+    Parse the time to replay up to.
+
+    :param value: An ISO 8601 time, naive times are in the current timezone
+    :return: The aware time, or None if no time was given
+    """
+    if not value:
+        return None
+    until = parse_datetime(value)
+    if until is None:
+        raise CommandError(f"Invalid time: {value}")
+    if timezone.is_naive(until):
+        until = timezone.make_aware(until)
+    return until
+
+
+def check_apply(options):
+    """
+    Refuse to apply a replay that could lose or overwrite votes by mistake.
+
+    :param options: The options of the command
+    """
+    if not options["questions"] and not options["all"]:
+        raise CommandError("--apply needs --question or --all.")
+    if options["questions"] and options["all"]:
+        raise CommandError("--question and --all cannot be combined.")
+    if not options["writers_stopped"]:
+        raise CommandError("Stop the workers that serve votes and pass "
+                           "--writers-stopped, events they have not written "
+                           "yet would be lost.")
+
+
+class Command(BaseCommand):
+    """
+    Replay the vote history up to a point in time.
+
+    Prints the vote counts of each question at that time and with --apply
+    replaces the current votes of the questions with the replayed votes.
+    Compacted questions keep their vote counts and voter bitmaps.
+
+    Every worker buffers its vote events before writing them, and only
+    this command's own buffer can be flushed from here. Applying a replay
+    while workers still serve votes would drop the events they buffered,
+    so --apply requires --writers-stopped: stop the web workers first,
+    they write their buffered events when they exit. --apply also requires
+    the questions to be named with --question, or --all.
+    """
+
+    help = "Rebuild the votes and counts at a point in time from history."
+
+    def add_arguments(self, parser):
+        """Add the time, question and apply arguments."""
+        parser.add_argument("--at", help="ISO 8601 time to replay up to "
+                                         "(default: now).")
+        parser.add_argument("--question", type=int, action="append",
+                            dest="questions",
+                            help="Only replay this question, may be repeated.")
+        parser.add_argument("--apply", action="store_true",
+                            help="Replace the current votes of the questions "
+                                 "with the replayed votes.")
+        parser.add_argument("--all", action="store_true",
+                            help="Apply the replay to all questions.")
+        parser.add_argument("--writers-stopped", action="store_true",
+                            help="Confirm that no worker is serving votes, "
+                                 "required by --apply.")
+
+    def handle(self, *args, **options):
+        """Replay the history and report or restore the votes."""
+        if options["apply"]:
+            check_apply(options)
+        until = parse_time(options["at"])
+        history.buffer.flush()
+        votes = history.replay(until, options["questions"])
+        counts = Counter(choice_id for choice_id, *_ in votes.values())
+        questions = Question.objects.order_by("pk")
+        if options["questions"]:
+            questions = questions.filter(pk__in=options["questions"])
+        choices = Choice.objects.filter(question__in=questions).order_by("pk")
+        by_question = {}
+        for choice in choices:
+            by_question.setdefault(choice.question_id, []).append(choice)
+        for question in questions:
+            self.stdout.write(f"{question.pk}.) {question}")
+            for choice in by_question.get(question.pk, []):
+                self.stdout.write(f"    {choice}: {counts[choice.pk]}")
+        if options["apply"]:
+            restored, skipped = history.restore_votes(
+                votes, questions.values_list("pk", flat=True))
+            self.stdout.write(f"Restored {restored} votes.")
+            if skipped:
+                self.stdout.write(f"Skipped compacted questions: "
+                                  f"{', '.join(map(str, skipped))}")
@@ -0,0 +1,109 @@
+"""Command for incrementally rolling vote changes up into per-minute counts."""
+import datetime
+from collections import Counter
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, OuterRef, Q, Subquery
+from django.db.models.functions import TruncMinute
+from django.utils import timezone
+from polls.models import Choice, RollupWatermark, VoteEvent, VoteRollup
+
+WATERMARK_NAME = "vote_events"
+
+
+def previous_choice():
+    """
+    Return a subquery of the choice of a vote event's previous event.
+
+    The previous event is the latest earlier event of the same user on the
+    same question, its choice is None if it cleared the vote.
+    """
+    earlier = VoteEvent.objects.filter(
+        Q(created_at__lt=OuterRef("created_at"))
+        | Q(created_at=OuterRef("created_at"), id__lt=OuterRef("id")),
+        user_id=OuterRef("user_id"), question_id=OuterRef("question_id"))
+    return Subquery(earlier.order_by("-created_at", "-id")
+                    .values("choice_id")[:1])
+
+
+def vote_deltas(events):
+    """
+    Sum the signed vote changes of events per choice per minute.
+
+    A cast adds 1 to its choice, a change adds 1 to the new choice and
+    takes 1 off the previous one and a clear takes 1 off the previous
+    choice.
+
+    :param events: A queryset of vote events
+    :return: A Counter of (question id, choice id, minute) to the net change
+    """
+    events = events.annotate(minute=TruncMinute("created_at")).order_by()
+    deltas = Counter()
+    added = (events.filter(choice_id__isnull=False)
+             .values("question_id", "choice_id", "minute")
+             .annotate(count=Count("id")))
+    for row in added:
+        deltas[row["question_id"], row["choice_id"], row["minute"]] += (
+            row["count"])
+    removed = (events.annotate(previous=previous_choice())
+               .filter(previous__isnull=False)
+               .values("question_id", "previous", "minute")
+               .annotate(count=Count("id")))
+    for row in removed:
+        deltas[row["question_id"], row["previous"], row["minute"]] -= (
+            row["count"])
+    return deltas
+
+
+class Command(BaseCommand):
+    """
+    Roll up the net vote changes per question per choice per minute.
+
+    The rollups are computed from the vote history, so summing the rollups
+    of a choice up to a minute gives its vote count at that minute: a
+    change moves a vote from the previous choice to the new one and a
+    clear takes it off. Only events created after the stored watermark are
+    scanned. Windows are aligned to whole minutes and lag behind the
+    current time, longer than the history is buffered, so each minute is
+    rolled up exactly once after all of its events were written.
+    """
+
+    help = "Roll up new vote changes into per-minute counts for each choice."
+
+    def add_arguments(self, parser):
+        """Add the command's optional arguments."""
+        parser.add_argument(
+            "--lag", type=int, default=1,
+            help="Minutes to stay behind the current time (default 1).")
+
+    def handle(self, *args, **options):
+        """Aggregate the vote events between the watermark and the cutoff."""
+        cutoff = (timezone.now() - datetime.timedelta(minutes=options["lag"])
+                  ).replace(second=0, microsecond=0)
+        with transaction.atomic():
+            watermark, _ = (RollupWatermark.objects.select_for_update()
+                            .get_or_create(name=WATERMARK_NAME))
+            new_events = VoteEvent.objects.filter(created_at__lt=cutoff)
+            if watermark.position:
+                if watermark.position >= cutoff:
+                    self.stdout.write("Rollups are up to date.")
+                    return
+                new_events = new_events.filter(
+                    created_at__gte=watermark.position)
+            deltas = vote_deltas(new_events)
+            # the history outlives deleted choices, their rollups would too
+            choices = set(Choice.objects.filter(
+                pk__in={choice_id for _, choice_id, _ in deltas})
+                .values_list("pk", flat=True))
+            rollups = [VoteRollup(question_id=question_id,
+                                  choice_id=choice_id, minute=minute,
+                                  votes=votes)
+                       for (question_id, choice_id, minute), votes
+                       in deltas.items() if votes and choice_id in choices]
+            VoteRollup.objects.bulk_create(
+                rollups, batch_size=1000, update_conflicts=True,
+                unique_fields=["choice", "minute"], update_fields=["votes"])
+            watermark.position = cutoff
+            watermark.save()
+        self.stdout.write(f"Rolled up {len(rollups)} minute buckets "
+                          f"up to {cutoff.isoformat()}.")
@@ -0,0 +1,41 @@
+"""Command for moving polls through their lifecycle."""
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from polls.lifecycle import advance, next_transition, run
+
+
+class Command(BaseCommand):
+    """
+    Open and close polls when their pub_date and end_date pass.
+
+    The scheduler sleeps until the next date a poll changes status and
+    runs until it is interrupted. With --once it only brings the stored
+    statuses up to date, e.g. after loading polls from a fixture.
+    """
+
+    help = "Keep the stored status of the polls up to date."
+
+    def add_arguments(self, parser):
+        """Add the once and max sleep arguments."""
+        parser.add_argument("--once", action="store_true",
+                            help="Update the statuses once and exit.")
+        parser.add_argument("--max-sleep", type=float,
+                            default=settings.SCHEDULER_MAX_SLEEP,
+                            help="Longest sleep in seconds between updates "
+                                 "(default SCHEDULER_MAX_SLEEP).")
+
+    def handle(self, *args, **options):
+        """Update the statuses once or run the scheduler."""
+        if options["once"]:
+            opened, closed = advance()
+            self.stdout.write(f"Opened {len(opened)} and closed "
+                              f"{len(closed)} polls.")
+            upcoming = next_transition()
+            if upcoming:
+                self.stdout.write(f"Next change: {upcoming.isoformat()}")
+            return
+        self.stdout.write("Running the poll scheduler.")
+        try:
+            run(max_sleep=options["max_sleep"])
+        except KeyboardInterrupt:
+            self.stdout.write("Stopped the poll scheduler.")
@@ -0,0 +1,71 @@
+"""Command for running the background tasks of the outbox."""
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from polls.export import setup_worker
+from polls.tasks import Metrics, drain
+
+
+class Command(BaseCommand):
+    """
+    Drain the task outbox with a pool of workers.
+
+    Each worker leases batches of due tasks and runs them until the command
+    is interrupted, or with --once until no task is due. Task counts and
+    latencies are reported when the workers stop.
+    """
+
+    help = "Run the background tasks written to the outbox."
+
+    def add_arguments(self, parser):
+        """Add the pool, workers, batch size and once arguments."""
+        parser.add_argument("--workers", type=int, default=4,
+                            help="Number of workers (default 4).")
+        parser.add_argument("--pool", choices=("thread", "process"),
+                            default="thread",
+                            help="Run the workers in threads or processes "
+                                 "(default thread).")
+        parser.add_argument("--batch-size", type=int,
+                            default=settings.TASK_BATCH_SIZE,
+                            help="Tasks leased at a time (default "
+                                 "TASK_BATCH_SIZE).")
+        parser.add_argument("--once", action="store_true",
+                            help="Stop when no task is due.")
+
+    def handle(self, *args, **options):
+        """Start the workers and report their metrics."""
+        workers = options["workers"]
+        batch_size = options["batch_size"]
+        start = time.perf_counter()
+        if options["pool"] == "process":
+            # forked workers must not share this process's connections
+            connections.close_all()
+            pool = ProcessPoolExecutor(
+                max_workers=workers, initializer=setup_worker,
+                initargs=(settings.SETTINGS_MODULE,))
+            stop = None
+        else:
+            pool = ThreadPoolExecutor(max_workers=workers)
+            stop = threading.Event()
+        self.stdout.write(f"Running {workers} {options['pool']} workers.")
+        with pool:
+            futures = [pool.submit(drain, batch_size, stop, options["once"])
+                       for _ in range(workers)]
+            try:
+                results = [future.result() for future in futures]
+            except KeyboardInterrupt:
+                if stop is None:
+                    raise
+                stop.set()
+                results = [future.result() for future in futures]
+        metrics = Metrics()
+        for result in results:
+            metrics.merge(result)
+        elapsed = time.perf_counter() - start
+        done = sum(metrics.done.values()) + sum(metrics.failed.values())
+        self.stdout.write(f"Ran {done} tasks in {elapsed:.2f}s.")
+        for line in metrics.report():
+            self.stdout.write(f"  {line}")
@@ -0,0 +1,261 @@
+"""Command for stress testing concurrent vote, change and clear requests."""
+import random
+import statistics
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count, F
+from django.test import Client, override_settings
+from django.urls import reverse
+from polls.models import Choice, Question, Vote
+
+PREFIX = "stress-"
+
+
+class Command(BaseCommand):
+    """
+    Fire parallel vote/change/clear sequences at the vote and clear views.
+
+    Workers in a thread pool share a small set of users and questions so
+    requests for the same user and question race each other, then the
+    stored votes are checked against the requests that succeeded.
+    Requests go through the full request path with rate limits disabled.
+    Runs against the configured database, SQLite is switched to WAL mode
+    and should be configured with immediate transactions like the test
+    settings.
+    """
+
+    help = "Stress test concurrent votes and check the vote invariants."
+
+    def add_arguments(self, parser):
+        """Add the size of the stress test arguments."""
+        parser.add_argument("--workers", type=int, default=8,
+                            help="Number of concurrent workers (default 8).")
+        parser.add_argument("--requests", type=int, default=50,
+                            help="Requests sent by each worker (default 50).")
+        parser.add_argument("--users", type=int, default=4,
+                            help="Number of voters shared by the workers "
+                                 "(default 4).")
+        parser.add_argument("--questions", type=int, default=2,
+                            help="Number of questions voted on (default 2).")
+        parser.add_argument("--seed", type=int, default=None,
+                            help="Seed for the random request sequences.")
+        parser.add_argument("--keep", action="store_true",
+                            help="Keep the stress test users and questions.")
+
+    def handle(self, *args, **options):
+        """Run the workers, report the results and check the invariants."""
+        if connection.vendor == "sqlite":
+            with connection.cursor() as cursor:
+                cursor.execute("PRAGMA journal_mode=WAL")
+                mode = cursor.fetchone()[0]
+            self.stdout.write(f"SQLite journal mode: {mode}")
+        users, questions = self.setup(options["users"], options["questions"])
+        try:
+            with override_settings(RATELIMITS={}):
+                results, elapsed = self.run(users, questions, options)
+            self.report(results, elapsed)
+            problems = check_invariants(questions, results)
+        finally:
+            if not options["keep"]:
+                Question.objects.filter(pk__in=[q.pk for q in questions]).delete()
+                User.objects.filter(pk__in=[u.pk for u in users]).delete()
+        for problem in problems:
+            self.stderr.write(problem)
+        if problems:
+            raise CommandError("Vote invariants violated")
+        self.stdout.write("Invariants hold: at most 1 vote per user per "
+                          "question, counts equal rows, every vote was cast "
+                          "by a successful request and no vote is lost")
+
+    def setup(self, user_count, question_count):
+        """
+        Create the voters and questions of the stress test.
+
+        :return: a tuple of the list of users and the list of questions.
+        """
+        users = []
+        for n in range(user_count):
+            user, _ = User.objects.get_or_create(username=f"{PREFIX}{n}")
+            users.append(user)
+        questions = []
+        for n in range(question_count):
+            question = Question.objects.create(
+                question_text=f"{PREFIX}question {n}")
+            Choice.objects.bulk_create(
+                Choice(question=question, choice_text=f"Choice {c}")
+                for c in range(3))
+            questions.append(question)
+        return users, questions
+
+    def run(self, users, questions, options):
+        """
+        Send the requests of all workers concurrently.
+
+        :return: a tuple of the list of (action, outcome, seconds, user id,
+        question id, choice id) results and the wall clock time of the run.
+        """
+        seed = options["seed"]
+        if seed is None:
+            seed = random.randrange(2 ** 32)
+        self.stdout.write(f"Seed: {seed}")
+        choices = {q.pk: list(q.choice_set.values_list("pk", flat=True))
+                   for q in questions}
+        start_line = threading.Barrier(options["workers"])
+
+        # log in up front, concurrent logins would race on the sessions
+        logins = []
+        for _ in range(options["workers"]):
+            clients = []
+            for user in users:
+                clients.append(Client(raise_request_exception=False))
+                clients[-1].force_login(user)
+            logins.append(clients)
+
+        def work(index):
+            return worker(random.Random(seed + index),
+                          list(zip(users, logins[index])), choices,
+                          options["requests"], start_line)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options["workers"]) as pool:
+            runs = list(pool.map(work, range(options["workers"])))
+        elapsed = time.perf_counter() - start
+        return [result for run in runs for result in run], elapsed
+
+    def report(self, results, elapsed):
+        """Write the throughput, latency and error rate of each action."""
+        total = len(results)
+        self.stdout.write(f"{total} requests in {elapsed:.2f}s: "
+                          f"{total / elapsed:.1f} requests/s")
+        for action in ("vote", "clear"):
+            done = [r for r in results if r[0] == action]
+            if not done:
+                continue
+            errors = Counter(r[1] for r in done if r[1] != "ok")
+            latencies = [r[2] * 1000 for r in done]
+            p50 = statistics.median(latencies)
+            p95 = (statistics.quantiles(latencies, n=20)[-1]
+                   if len(latencies) > 1 else p50)
+            self.stdout.write(
+                f"  {action}: {len(done)} requests, "
+                f"{sum(errors.values()) / len(done):.1%} errors, "
+                f"p50 {p50:.1f} ms, p95 {p95:.1f} ms")
+            for outcome, count in errors.most_common():
+                self.stdout.write(f"    {count} x {outcome}")
+
+
+def worker(rng, clients, choices, count, start_line):
+    """
+    Send a random sequence of votes, vote changes and clears.
+
+    Each worker has its own logged in client per user, the users are shared
+    with the other workers so their requests race.
+
+    :param clients: A list of (user, logged in client) tuples
+    :return: a list of (action, outcome, seconds, user id, question id,
+    choice id) tuples, the choice id is None for clears.
+    """
+    results = []
+    try:
+        start_line.wait()
+        for _ in range(count):
+            user, client = rng.choice(clients)
+            question_id = rng.choice(list(choices))
+            if rng.random() < 0.75:
+                action, url = "vote", reverse("polls:vote",
+                                              args=(question_id,))
+                choice_id = rng.choice(choices[question_id])
+                data = {"choice": choice_id}
+            else:
+                action, url = "clear", reverse("polls:clear",
+                                               args=(question_id,))
+                choice_id, data = None, {}
+            start = time.perf_counter()
+            try:
+                response = client.post(url, data)
+                if response.status_code == 302:
+                    outcome = "ok"
+                elif getattr(response, "exc_info", None):
+                    outcome = (f"status {response.status_code} "
+                               f"{response.exc_info[0].__name__}: "
+                               f"{response.exc_info[1]}")
+                else:
+                    outcome = f"status {response.status_code}"
+            except Exception as error:
+                outcome = type(error).__name__
+            results.append((action, outcome, time.perf_counter() - start,
+                            user.pk, question_id, choice_id))
+    finally:
+        connection.close()
+    return results
+
+
+def check_requests(votes, results):
+    """
+    Check the stored votes against the requests that succeeded.
+
+    Requests of a user on a question race, so which one wins is unknown,
+    but a stored vote must be for a choice a successful request voted for
+    and a user that voted and never cleared must still have a vote.
+
+    :param votes: A queryset of the stored votes
+    :param results: The (action, outcome, seconds, user id, question id,
+    choice id) results of the workers
+    :return: a list of descriptions of the violated invariants.
+    """
+    problems = []
+    voted = defaultdict(set)
+    cleared = set()
+    for action, outcome, _, user_id, question_id, choice_id in results:
+        if outcome != "ok":
+            continue
+        if action == "vote":
+            voted[user_id, question_id].add(choice_id)
+        else:
+            cleared.add((user_id, question_id))
+    stored = {(user_id, question_id): choice_id
+              for user_id, question_id, choice_id
+              in votes.values_list("user_id", "question_id", "choice_id")}
+    for (user_id, question_id), choice_id in stored.items():
+        if choice_id not in voted.get((user_id, question_id), ()):
+            problems.append(f"User {user_id} has a vote for choice "
+                            f"{choice_id} on question {question_id} that no "
+                            f"successful request cast")
+    for user_id, question_id in set(voted) - cleared - set(stored):
+        problems.append(f"User {user_id} lost their vote on question "
+                        f"{question_id}")
+    return problems
+
+
+def check_invariants(questions, results):
+    """
+    Check the votes of the questions for corruption.
+
+    :param results: The results of the workers, see check_requests()
+    :return: a list of descriptions of the violated invariants.
+    """
+    problems = []
+    votes = Vote.objects.filter(question__in=questions)
+    duplicates = (votes.values("user", "question")
+                  .annotate(rows=Count("id")).filter(rows__gt=1))
+    for row in duplicates:
+        problems.append(f"User {row['user']} has {row['rows']} votes on "
+                        f"question {row['question']}")
+    moved = votes.exclude(choice__question=F("question")).count()
+    if moved:
+        problems.append(f"{moved} votes belong to a choice of another "
+                        f"question")
+    for question in questions:
+        rows = votes.filter(question=question).count()
+        counted = sum(choice.votes for choice in question.choice_set.all())
+        voters = votes.filter(question=question).values("user").distinct()
+        if not rows == counted == voters.count():
+            problems.append(f"Question {question.pk} has {rows} votes but "
+                            f"its choices count {counted} from "
+                            f"{voters.count()} voters")
+    return problems + check_requests(votes, results)
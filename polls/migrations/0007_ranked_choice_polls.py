@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0006_vote_timestamps_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='poll_type',
+            field=models.CharField(choices=[('single', 'Single choice'), ('ranked', 'Ranked choice')], default='single', max_length=10, verbose_name='Poll type'),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='results_version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='vote',
+            name='ranking',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# The votes are backfilled in a migration of their own: on PostgreSQL the
+# updated rows leave pending trigger events that make an ALTER TABLE of
+# polls_vote in the same transaction fail.
+
+from django.db import migrations, models
+
+
+def fill_vote_question(apps, schema_editor):
+    """Copy the question of each vote's choice and drop duplicate votes."""
+    Vote = apps.get_model('polls', 'Vote')
+    Choice = apps.get_model('polls', 'Choice')
+    Vote.objects.update(question_id=models.Subquery(
+        Choice.objects.filter(pk=models.OuterRef('choice_id'))
+        .values('question_id')[:1]))
+    # keep only the latest vote of a user on a question
+    latest = (Vote.objects.values('user_id', 'question_id')
+              .annotate(latest=models.Max('id')).values('latest'))
+    Vote.objects.exclude(id__in=models.Subquery(latest)).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0008_surveys_vote_question'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_vote_question, migrations.RunPython.noop),
+    ]
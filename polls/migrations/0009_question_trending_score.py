@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:56
+
+import datetime
+import math
+from django.db import migrations, models
+
+HALF_LIFE = datetime.timedelta(hours=24)
+EPOCH = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def fill_trending_score(apps, schema_editor):
+    """Compute the trending score of each question from its votes."""
+    Question = apps.get_model('polls', 'Question')
+    Vote = apps.get_model('polls', 'Vote')
+    weights = {}
+    votes = Vote.objects.values_list('question_id', 'updated_at')
+    for question_id, updated_at in votes.iterator():
+        weights.setdefault(question_id, []).append(
+            math.log(2) * ((updated_at - EPOCH) / HALF_LIFE))
+    for question_id, logs in weights.items():
+        high = max(logs)
+        score = high + math.log(sum(math.exp(w - high) for w in logs))
+        Question.objects.filter(pk=question_id).update(trending_score=score)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0008_vote_question_not_null'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='trending_score',
+            field=models.FloatField(db_index=True, default=0, editable=False),
+        ),
+        migrations.RunPython(fill_trending_score, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0009_question_trending_score'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IPVoteWindow',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start', models.DateTimeField(unique=True, verbose_name='Start')),
+                ('sketch', models.BinaryField(default=bytes)),
+                ('votes', models.PositiveBigIntegerField(default=0)),
+                ('suspects', models.JSONField(blank=True, default=dict)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='QuestionSketch',
+            fields=[
+                ('question', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='sketch', serialize=False, to='polls.question')),
+                ('voters', models.BinaryField(default=bytes)),
+                ('ips', models.BinaryField(default=bytes)),
+                ('voter_count', models.PositiveIntegerField(default=0, verbose_name='Unique voters')),
+                ('ip_count', models.PositiveIntegerField(default=0, verbose_name='Unique IPs')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Updated at')),
+            ],
+        ),
+    ]
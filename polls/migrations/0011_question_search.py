@@ -0,0 +1,161 @@
+# Full-text search over question and choice texts.
+#
+# PostgreSQL keeps a weighted tsvector column on polls_question with a GIN
+# index, SQLite keeps an FTS5 table with a row per question. Both are kept
+# in sync with the question and choice tables by triggers.
+
+from django.db import migrations
+
+POSTGRES_FORWARD = [
+    "ALTER TABLE polls_question ADD COLUMN search_vector tsvector",
+    """
+    CREATE FUNCTION polls_question_document(question_id bigint,
+                                            question_text text)
+    RETURNS tsvector AS $$
+        SELECT setweight(to_tsvector('english', question_text), 'A') ||
+               setweight(to_tsvector('english', coalesce(
+                   (SELECT string_agg(choice_text, ' ') FROM polls_choice
+                    WHERE polls_choice.question_id = $1), '')), 'B')
+    $$ LANGUAGE sql STABLE
+    """,
+    """
+    CREATE FUNCTION polls_question_search_trigger() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector := polls_question_document(NEW.id,
+                                                     NEW.question_text);
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER polls_question_search_update
+    BEFORE INSERT OR UPDATE OF question_text ON polls_question
+    FOR EACH ROW EXECUTE FUNCTION polls_question_search_trigger()
+    """,
+    """
+    CREATE FUNCTION polls_choice_search_trigger() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            UPDATE polls_question SET search_vector =
+                polls_question_document(id, question_text)
+            WHERE id = OLD.question_id;
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            UPDATE polls_question SET search_vector =
+                polls_question_document(id, question_text)
+            WHERE id = NEW.question_id;
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER polls_choice_search_update
+    AFTER INSERT OR UPDATE OF choice_text, question_id OR DELETE
+    ON polls_choice
+    FOR EACH ROW EXECUTE FUNCTION polls_choice_search_trigger()
+    """,
+    """
+    UPDATE polls_question
+    SET search_vector = polls_question_document(id, question_text)
+    """,
+    """
+    CREATE INDEX polls_question_search_idx ON polls_question
+    USING GIN (search_vector)
+    """,
+]
+
+POSTGRES_BACKWARD = [
+    "DROP TRIGGER polls_choice_search_update ON polls_choice",
+    "DROP FUNCTION polls_choice_search_trigger()",
+    "DROP TRIGGER polls_question_search_update ON polls_question",
+    "DROP FUNCTION polls_question_search_trigger()",
+    "DROP FUNCTION polls_question_document(bigint, text)",
+    "ALTER TABLE polls_question DROP COLUMN search_vector",
+]
+
+SQLITE_REFRESH = """
+    DELETE FROM polls_question_fts WHERE rowid = {id};
+    INSERT INTO polls_question_fts (rowid, question_text, choices)
+    SELECT id, question_text,
+           (SELECT coalesce(group_concat(choice_text, ' '), '')
+            FROM polls_choice WHERE question_id = polls_question.id)
+    FROM polls_question WHERE id = {id};
+"""
+
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE polls_question_fts
+    USING fts5(question_text, choices, tokenize = 'porter unicode61')
+    """,
+    f"""
+    CREATE TRIGGER polls_question_fts_insert AFTER INSERT ON polls_question
+    BEGIN {SQLITE_REFRESH.format(id='NEW.id')} END
+    """,
+    f"""
+    CREATE TRIGGER polls_question_fts_update
+    AFTER UPDATE OF question_text ON polls_question
+    BEGIN {SQLITE_REFRESH.format(id='NEW.id')} END
+    """,
+    """
+    CREATE TRIGGER polls_question_fts_delete AFTER DELETE ON polls_question
+    BEGIN DELETE FROM polls_question_fts WHERE rowid = OLD.id; END
+    """,
+    f"""
+    CREATE TRIGGER polls_choice_fts_insert AFTER INSERT ON polls_choice
+    BEGIN {SQLITE_REFRESH.format(id='NEW.question_id')} END
+    """,
+    f"""
+    CREATE TRIGGER polls_choice_fts_update
+    AFTER UPDATE OF choice_text, question_id ON polls_choice
+    BEGIN
+    {SQLITE_REFRESH.format(id='OLD.question_id')}
+    {SQLITE_REFRESH.format(id='NEW.question_id')}
+    END
+    """,
+    f"""
+    CREATE TRIGGER polls_choice_fts_delete AFTER DELETE ON polls_choice
+    BEGIN {SQLITE_REFRESH.format(id='OLD.question_id')} END
+    """,
+    """
+    INSERT INTO polls_question_fts (rowid, question_text, choices)
+    SELECT id, question_text,
+           (SELECT coalesce(group_concat(choice_text, ' '), '')
+            FROM polls_choice WHERE question_id = polls_question.id)
+    FROM polls_question
+    """,
+]
+
+SQLITE_BACKWARD = [
+    "DROP TRIGGER polls_choice_fts_delete",
+    "DROP TRIGGER polls_choice_fts_update",
+    "DROP TRIGGER polls_choice_fts_insert",
+    "DROP TRIGGER polls_question_fts_delete",
+    "DROP TRIGGER polls_question_fts_update",
+    "DROP TRIGGER polls_question_fts_insert",
+    "DROP TABLE polls_question_fts",
+]
+
+
+def run_statements(statements):
+    """Return a migration function running the vendor's statements."""
+    def run(apps, schema_editor):
+        vendor = schema_editor.connection.vendor
+        for statement in statements.get(vendor, []):
+            schema_editor.execute(statement, params=None)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0010_participation_sketches'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_statements({'postgresql': POSTGRES_FORWARD,
+                            'sqlite': SQLITE_FORWARD}),
+            run_statements({'postgresql': POSTGRES_BACKWARD,
+                            'sqlite': SQLITE_BACKWARD})),
+    ]
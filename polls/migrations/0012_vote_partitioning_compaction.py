@@ -0,0 +1,134 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:22
+#
+# Adds the models for compacted polls and, on PostgreSQL, rebuilds
+# polls_vote as a table partitioned by ranges of PARTITION_SIZE question
+# ids. A default partition holds the votes of questions above the last
+# range until the partition_votes command gives them their own partition.
+# Unique constraints of a partitioned table must contain the partition key,
+# so the primary key becomes (id, question_id). Ids still come from a
+# single sequence, so they stay unique.
+#
+# SQLite adds a column by rebuilding the table, which breaks the full-text
+# search triggers that reference polls_choice, so they are dropped while
+# the choice table is rebuilt.
+
+from importlib import import_module
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+search = import_module('polls.migrations.0011_question_search')
+
+# the statements creating and dropping the triggers, not the FTS table
+SEARCH_TRIGGERS_CREATE = search.SQLITE_FORWARD[1:-1]
+SEARCH_TRIGGERS_DROP = search.SQLITE_BACKWARD[:-1]
+
+PARTITION_SIZE = 10000
+# empty partitions created for upcoming questions
+PARTITIONS_AHEAD = 2
+
+SEQUENCE = [
+    "CREATE SEQUENCE polls_vote_id_seq OWNED BY polls_vote.id",
+    "ALTER TABLE polls_vote ALTER COLUMN id "
+    "SET DEFAULT nextval('polls_vote_id_seq')",
+    "SELECT setval('polls_vote_id_seq', coalesce(max(id), 0) + 1, false) "
+    "FROM polls_vote",
+]
+
+CONSTRAINTS = [
+    "ALTER TABLE polls_vote ADD CONSTRAINT polls_vote_pkey "
+    "PRIMARY KEY ({primary_key})",
+    "ALTER TABLE polls_vote ADD CONSTRAINT unique_vote_user_question "
+    "UNIQUE (user_id, question_id)",
+    "ALTER TABLE polls_vote ADD CONSTRAINT polls_vote_question_id_fk "
+    "FOREIGN KEY (question_id) REFERENCES polls_question (id) "
+    "DEFERRABLE INITIALLY DEFERRED",
+    "ALTER TABLE polls_vote ADD CONSTRAINT polls_vote_choice_id_fk "
+    "FOREIGN KEY (choice_id) REFERENCES polls_choice (id) "
+    "DEFERRABLE INITIALLY DEFERRED",
+    "ALTER TABLE polls_vote ADD CONSTRAINT polls_vote_user_id_fk "
+    "FOREIGN KEY (user_id) REFERENCES auth_user (id) "
+    "DEFERRABLE INITIALLY DEFERRED",
+    "CREATE INDEX polls_vote_question_id_idx ON polls_vote (question_id)",
+    "CREATE INDEX polls_vote_choice_id_idx ON polls_vote (choice_id)",
+    "CREATE INDEX polls_vote_user_id_idx ON polls_vote (user_id)",
+    "CREATE INDEX polls_vote_updated_at_idx ON polls_vote (updated_at)",
+]
+
+
+def partition_votes(apps, schema_editor):
+    """Rebuild polls_vote as a partitioned table on PostgreSQL."""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    statements = [
+        "ALTER TABLE polls_vote RENAME TO polls_vote_unpartitioned",
+        "CREATE TABLE polls_vote "
+        "(LIKE polls_vote_unpartitioned INCLUDING DEFAULTS) "
+        "PARTITION BY RANGE (question_id)",
+    ]
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT coalesce(max(id), 0) FROM polls_question")
+        highest = cursor.fetchone()[0]
+    end = (highest // PARTITION_SIZE + 1 + PARTITIONS_AHEAD) * PARTITION_SIZE
+    for start in range(0, end, PARTITION_SIZE):
+        statements.append(
+            f"CREATE TABLE polls_vote_q{start} PARTITION OF polls_vote "
+            f"FOR VALUES FROM ({start}) TO ({start + PARTITION_SIZE})")
+    statements += [
+        "CREATE TABLE polls_vote_default PARTITION OF polls_vote DEFAULT",
+        "INSERT INTO polls_vote SELECT * FROM polls_vote_unpartitioned",
+        "DROP TABLE polls_vote_unpartitioned",
+    ]
+    statements += SEQUENCE
+    statements += [sql.format(primary_key="id, question_id")
+                   for sql in CONSTRAINTS]
+    for statement in statements:
+        schema_editor.execute(statement, params=None)
+
+
+def unpartition_votes(apps, schema_editor):
+    """Rebuild polls_vote as a plain table on PostgreSQL."""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    statements = [
+        "ALTER TABLE polls_vote RENAME TO polls_vote_partitioned",
+        "CREATE TABLE polls_vote (LIKE polls_vote_partitioned)",
+        "INSERT INTO polls_vote SELECT * FROM polls_vote_partitioned",
+        # drops the partitions and the id sequence as well
+        "DROP TABLE polls_vote_partitioned",
+    ]
+    statements += SEQUENCE
+    statements += [sql.format(primary_key="id") for sql in CONSTRAINTS]
+    for statement in statements:
+        schema_editor.execute(statement, params=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0011_question_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VoterBitmap',
+            fields=[
+                ('question', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='voter_bitmap', serialize=False, to='polls.question')),
+                ('bitmap', models.BinaryField(default=bytes)),
+                ('voters', models.PositiveIntegerField(default=0, verbose_name='Voters')),
+                ('compacted_at', models.DateTimeField(auto_now=True, verbose_name='Compacted at')),
+            ],
+        ),
+        migrations.RunPython(
+            search.run_statements({'sqlite': SEARCH_TRIGGERS_DROP}),
+            search.run_statements({'sqlite': SEARCH_TRIGGERS_CREATE})),
+        migrations.AddField(
+            model_name='choice',
+            name='compacted_votes',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(
+            search.run_statements({'sqlite': SEARCH_TRIGGERS_CREATE}),
+            search.run_statements({'sqlite': SEARCH_TRIGGERS_DROP})),
+        migrations.RunPython(partition_votes, unpartition_votes),
+    ]
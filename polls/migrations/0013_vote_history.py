@@ -0,0 +1,84 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:25
+#
+# The append-only vote history. Events are inserted in time order, so on
+# PostgreSQL a BRIN index on created_at stays tiny while still letting
+# queries for a time range skip most of the table, SQLite gets a B-tree
+# index. The current votes are recorded as the first events.
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+CREATED_AT_INDEX = {
+    'postgresql': [
+        "CREATE INDEX polls_voteevent_created_at_brin ON polls_voteevent "
+        "USING BRIN (created_at)",
+    ],
+    'sqlite': [
+        "CREATE INDEX polls_voteevent_created_at_idx "
+        "ON polls_voteevent (created_at)",
+    ],
+}
+
+DROP_CREATED_AT_INDEX = {
+    'postgresql': ["DROP INDEX polls_voteevent_created_at_brin"],
+    'sqlite': ["DROP INDEX polls_voteevent_created_at_idx"],
+}
+
+
+def run_statements(statements):
+    """Return a migration function running the vendor's statements."""
+    def run(apps, schema_editor):
+        vendor = schema_editor.connection.vendor
+        for statement in statements.get(vendor, []):
+            schema_editor.execute(statement, params=None)
+    return run
+
+
+def record_current_votes(apps, schema_editor):
+    """Add a cast event for every vote at the time it was last changed."""
+    Vote = apps.get_model('polls', 'Vote')
+    VoteEvent = apps.get_model('polls', 'VoteEvent')
+    events = []
+    votes = Vote.objects.order_by('updated_at', 'id').values_list(
+        'question_id', 'choice_id', 'user_id', 'ranking', 'updated_at')
+    for question_id, choice_id, user_id, ranking, updated_at in (
+            votes.iterator(chunk_size=BATCH_SIZE)):
+        events.append(VoteEvent(question_id=question_id, choice_id=choice_id,
+                                user_id=user_id, action='cast',
+                                ranking=ranking, created_at=updated_at))
+        if len(events) == BATCH_SIZE:
+            VoteEvent.objects.bulk_create(events)
+            events = []
+    VoteEvent.objects.bulk_create(events)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0012_vote_partitioning_compaction'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VoteEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('action', models.CharField(choices=[('cast', 'Cast'), ('change', 'Change'), ('clear', 'Clear')], max_length=10, verbose_name='Action')),
+                ('ranking', models.JSONField(blank=True, default=list)),
+                ('ip', models.GenericIPAddressField(blank=True, null=True, verbose_name='IP')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Created at')),
+                ('choice', models.ForeignKey(blank=True, db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='polls.choice')),
+                ('question', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='polls.question')),
+                ('user', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.RunPython(run_statements(CREATED_AT_INDEX),
+                             run_statements(DROP_CREATED_AT_INDEX)),
+        migrations.RunPython(record_current_votes,
+                             migrations.RunPython.noop),
+    ]
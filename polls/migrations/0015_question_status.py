@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:32
+#
+# Stores the lifecycle status of questions with partial indexes on the
+# dates of scheduled and open questions. As in 0012 the full-text search
+# triggers are dropped while SQLite rebuilds the question table.
+
+from importlib import import_module
+
+from django.db import migrations, models
+from django.utils import timezone
+
+search = import_module('polls.migrations.0011_question_search')
+
+# the statements creating and dropping the triggers, not the FTS table
+SEARCH_TRIGGERS_CREATE = search.SQLITE_FORWARD[1:-1]
+SEARCH_TRIGGERS_DROP = search.SQLITE_BACKWARD[:-1]
+
+
+def set_statuses(apps, schema_editor):
+    """Set the status of the existing questions from their dates."""
+    Question = apps.get_model('polls', 'Question')
+    now = timezone.now()
+    Question.objects.filter(pub_date__lte=now).update(status='open')
+    Question.objects.filter(pub_date__lte=now, end_date__lt=now).update(
+        status='closed')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0014_outbox_tasks'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            search.run_statements({'sqlite': SEARCH_TRIGGERS_DROP}),
+            search.run_statements({'sqlite': SEARCH_TRIGGERS_CREATE})),
+        migrations.AddField(
+            model_name='question',
+            name='status',
+            field=models.CharField(choices=[('scheduled', 'Scheduled'), ('open', 'Open'), ('closed', 'Closed')], default='scheduled', editable=False, max_length=10, verbose_name='Status'),
+        ),
+        migrations.RunPython(
+            search.run_statements({'sqlite': SEARCH_TRIGGERS_CREATE}),
+            search.run_statements({'sqlite': SEARCH_TRIGGERS_DROP})),
+        migrations.RunPython(set_statuses, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(condition=models.Q(('status', 'scheduled')), fields=['pub_date'], name='question_scheduled_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(condition=models.Q(('status', 'open')), fields=['end_date'], name='question_open_idx'),
+        ),
+    ]
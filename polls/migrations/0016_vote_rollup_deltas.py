@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:04
+#
+# Vote rollups become signed net changes computed from the vote history.
+# The rollups counted from Vote.updated_at are dropped, the rollup_votes
+# command rebuilds them from the history under a new watermark.
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def drop_activity_rollups(apps, schema_editor):
+    """Delete the rollups and watermark of the activity counts."""
+    apps.get_model('polls', 'VoteRollup').objects.all().delete()
+    apps.get_model('polls', 'RollupWatermark').objects.filter(
+        name='votes').delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0015_question_status'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_activity_rollups,
+                             migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='voterollup',
+            name='votes',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='voteevent',
+            index=models.Index(fields=['question', 'user', 'created_at'], name='vote_event_user_idx'),
+        ),
+    ]
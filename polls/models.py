@@ -1,9 +1,44 @@
 """Models for the polls application."""
 import datetime
+import math
+import zlib
 from django.contrib.auth.models import User
-from django.db import models
+from django.db import models, transaction
+from django.db.models.functions import Exp, Greatest, Least, Ln
 from django.utils import timezone
 
+# the weight of a vote in the trending score halves every half-life
+TRENDING_HALF_LIFE = datetime.timedelta(hours=24)
+# polls trend while their votes outweigh a single vote cast this long ago
+TRENDING_WINDOW = datetime.timedelta(days=7)
+TRENDING_EPOCH = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def trending_weight(when):
+    """
+    Return the log of the trending weight of a vote cast at 'when'.
+
+    Weights grow exponentially with time instead of decaying, so old
+    scores never have to be updated: the ratio between two scores is the
+    same as if every vote had decayed since it was cast.
+    """
+    return math.log(2) * ((when - TRENDING_EPOCH) / TRENDING_HALF_LIFE)
+
+
+class Survey(models.Model):
+    """
+    A class representing a group of poll questions answered together.
+
+    The questions of a survey are submitted in a single request.
+    """
+
+    title = models.CharField(max_length=200)
+    description = models.TextField(blank=True)
+
+    def __str__(self):
+        """Return the Survey's title for the user."""
+        return self.title
+
 
 class Question(models.Model):
     """
@@ -11,12 +46,52 @@ class Question(models.Model):
 
     Questions have a title represented by 'question_text'
     and a publishing date represented by 'pub_date'.
+    Single choice polls are tallied by plurality, ranked choice polls
+    collect an ordered ballot from each voter.
+    The lifecycle 'status' is stored so open, closing and upcoming polls
+    can be listed from an index. It is set from the dates on save and moved
+    along by the run_scheduler command when a date passes.
     """
 
+    SINGLE = "single"
+    RANKED = "ranked"
+    POLL_TYPES = [
+        (SINGLE, "Single choice"),
+        (RANKED, "Ranked choice"),
+    ]
+    SCHEDULED = "scheduled"
+    OPEN = "open"
+    CLOSED = "closed"
+    STATUSES = [
+        (SCHEDULED, "Scheduled"),
+        (OPEN, "Open"),
+        (CLOSED, "Closed"),
+    ]
+
     question_text = models.CharField(max_length=200)
     pub_date = models.DateTimeField("Date published", default=timezone.now)
     end_date = models.DateTimeField("End date", default=None,
                                     null=True, blank=True)
+    poll_type = models.CharField("Poll type", max_length=10,
+                                 choices=POLL_TYPES, default=SINGLE)
+    results_version = models.PositiveIntegerField(default=0, editable=False)
+    trending_score = models.FloatField(default=0, db_index=True,
+                                       editable=False)
+    survey = models.ForeignKey(Survey, on_delete=models.SET_NULL,
+                               related_name="questions",
+                               null=True, blank=True)
+    status = models.CharField("Status", max_length=10, choices=STATUSES,
+                              default=SCHEDULED, editable=False)
+
+    class Meta:
+        """Index the dates of the polls that will change status next."""
+
+        indexes = [
+            models.Index(fields=["pub_date"], name="question_scheduled_idx",
+                         condition=models.Q(status="scheduled")),
+            models.Index(fields=["end_date"], name="question_open_idx",
+                         condition=models.Q(status="open")),
+        ]
 
     def was_published_recently(self):
         """
@@ -57,6 +132,103 @@ class Question(models.Model):
         else:
             return self.pub_date <= timezone.now()
 
+    def lifecycle_status(self, now=None):
+        """
+        Return the status the poll's dates give it.
+
+        :param now: The time to compare the dates with, defaults to now
+        :return: SCHEDULED before the pub_date, CLOSED after the end_date,
+        OPEN otherwise, the same periods as can_vote().
+        """
+        now = now or timezone.now()
+        if self.pub_date > now:
+            return self.SCHEDULED
+        if self.end_date and self.end_date < now:
+            return self.CLOSED
+        return self.OPEN
+
+    def save(self, *args, **kwargs):
+        """
+        Save the question with the status of its dates.
+
+        Saving an open poll with an end_date in the past closes it and
+        enqueues the email of its results, like the scheduler does.
+        """
+        from .tasks import enqueue
+        self.status = self.lifecycle_status()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            kwargs["update_fields"] = {*update_fields, "status"}
+        with transaction.atomic():
+            # the row stays locked until the save writes the new status, so
+            # the scheduler cannot close the poll and email its results too
+            closing = (self.pk is not None and self.status == self.CLOSED
+                       and Question.objects.select_for_update().filter(
+                           pk=self.pk, status=self.OPEN).exists())
+            super().save(*args, **kwargs)
+            if closing:
+                enqueue("notify_poll_closed", question_id=self.pk)
+
+    def is_ranked(self):
+        """Check if voters rank the choices of this poll."""
+        return self.poll_type == self.RANKED
+
+    def bump_results_version(self):
+        """
+        Mark the poll's results as changed.
+
+        Cached results are keyed by the results version, so bumping it
+        invalidates them without touching the cache.
+        """
+        Question.objects.filter(pk=self.pk).update(
+            results_version=models.F("results_version") + 1)
+        self.refresh_from_db(fields=["results_version"])
+
+    def record_vote(self):
+        """Mark the poll's results as changed and add a trending vote."""
+        Question.record_votes([self.pk])
+        self.refresh_from_db(fields=["results_version", "trending_score"])
+
+    @staticmethod
+    def record_votes(question_ids, when=None, weight=None):
+        """
+        Add a vote to the results version and trending score of questions.
+
+        The trending score is the log of the sum of the weights of all
+        votes, it is updated with a single UPDATE using
+        log(e^a + e^b) = max + log(1 + e^(min - max)).
+
+        :param question_ids: The ids of the questions that were voted on
+        :param when: The time of the votes, defaults to now
+        :param weight: The log of the summed weights of several votes,
+        replaces the weight of a single vote at 'when'
+        """
+        if weight is None:
+            weight = trending_weight(when or timezone.now())
+        weight = models.Value(weight)
+        high = Greatest(models.F("trending_score"), weight)
+        low = Least(models.F("trending_score"), weight)
+        # e^-50 is negligible, the bound stops e^x from underflowing
+        difference = Greatest(low - high, models.Value(-50.0))
+        Question.objects.filter(pk__in=question_ids).update(
+            results_version=models.F("results_version") + 1,
+            trending_score=high + Ln(models.Value(1.0) + Exp(difference)))
+
+    def has_voted(self, user):
+        """
+        Check if a user voted on the poll.
+
+        Votes of compacted polls are looked up in the poll's voter bitmap.
+
+        :return: A boolean, True if the user has a vote or compacted vote.
+        """
+        if self.vote_set.filter(user=user).exists():
+            return True
+        try:
+            return self.voter_bitmap.contains(user.pk)
+        except VoterBitmap.DoesNotExist:
+            return False
+
     def __str__(self):
         """Return the Question's text for the user."""
         return self.question_text
@@ -72,11 +244,12 @@ class Choice(models.Model):
 
     question = models.ForeignKey(Question, on_delete=models.CASCADE)
     choice_text = models.CharField(max_length=200)
+    compacted_votes = models.PositiveIntegerField(default=0, editable=False)
 
     @property
     def votes(self):
-        """Return the vote count of the choice."""
-        return self.vote_set.count()
+        """Return the vote count of the choice, including compacted votes."""
+        return self.vote_set.count() + self.compacted_votes
 
     def __str__(self):
         """Return the Choice's text for the user."""
@@ -89,7 +262,254 @@ class Vote(models.Model):
 
     A vote has 1 associated Choice. This is the choice the vote is for
     A vote has 1 associated User. This is the user that created the vote
+    In ranked choice polls 'ranking' holds the ids of the ranked choices in
+    order of preference and 'choice' is the first preference.
+    A user may only have 1 vote per question, the question is stored with
+    the vote so this can be enforced by the database.
     """
 
+    question = models.ForeignKey(Question, on_delete=models.CASCADE)
     choice = models.ForeignKey(Choice, on_delete=models.CASCADE)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
+    ranking = models.JSONField(default=list, blank=True)
+    created_at = models.DateTimeField("Created at", auto_now_add=True)
+    updated_at = models.DateTimeField("Updated at", auto_now=True,
+                                      db_index=True)
+
+    class Meta:
+        """Allow only 1 vote per user per question."""
+
+        constraints = [
+            models.UniqueConstraint(fields=["user", "question"],
+                                    name="unique_vote_user_question"),
+        ]
+
+    def save(self, *args, **kwargs):
+        """Save the vote with the question of its choice."""
+        if self.choice_id is not None:
+            self.question_id = self.choice.question_id
+        super().save(*args, **kwargs)
+
+    @staticmethod
+    def cast(user, choice, ranking=()):
+        """
+        Create or change the vote of a user on the question of a choice.
+
+        The vote is written with a single upsert on the unique (user, question)
+        constraint, so concurrent requests of one user can never leave two
+        votes behind or fail on the constraint. It does not read before
+        writing, so in a transaction it takes the write lock right away.
+
+        :param user: the user casting the vote.
+        :param choice: the selected choice.
+        :param ranking: ids of the ranked choices for ranked choice polls.
+        """
+        Vote.objects.bulk_create(
+            [Vote(user=user, choice=choice, question_id=choice.question_id,
+                  ranking=list(ranking))],
+            update_conflicts=True, unique_fields=["user", "question"],
+            update_fields=["choice", "ranking", "updated_at"])
+
+
+class VoteRollup(models.Model):
+    """
+    A class representing the net change of a choice's votes in one minute.
+
+    Rollups are maintained incrementally from the vote history by the
+    rollup_votes command so time-series reports never have to scan the
+    Vote table. Casting a vote adds 1 to its choice, changing it also
+    takes 1 off the previous choice and clearing it takes 1 off, so
+    'votes' may be negative and the rollups of a choice up to a minute sum
+    to its vote count at that minute.
+    """
+
+    question = models.ForeignKey(Question, on_delete=models.CASCADE)
+    choice = models.ForeignKey(Choice, on_delete=models.CASCADE)
+    minute = models.DateTimeField("Minute")
+    votes = models.IntegerField(default=0)
+
+    class Meta:
+        """Keep one rollup per choice per minute."""
+
+        constraints = [
+            models.UniqueConstraint(fields=["choice", "minute"],
+                                    name="unique_rollup_choice_minute"),
+        ]
+        indexes = [
+            models.Index(fields=["question", "minute"]),
+        ]
+
+
+class RollupWatermark(models.Model):
+    """
+    A class recording how far an incremental rollup job has progressed.
+
+    The position is the (exclusive) start of the next window to scan.
+    """
+
+    name = models.CharField(max_length=50, unique=True)
+    position = models.DateTimeField("Position", null=True, blank=True)
+
+    def __str__(self):
+        """Return the watermark's name and position."""
+        return f"{self.name} @ {self.position}"
+
+
+class QuestionSketch(models.Model):
+    """
+    A class storing the participation sketches of a question.
+
+    'voters' and 'ips' are HyperLogLog registers of the unique voters and
+    unique voter IPs, their estimated counts are kept in 'voter_count'
+    and 'ip_count' so they can be shown without decoding the sketches.
+    """
+
+    question = models.OneToOneField(Question, on_delete=models.CASCADE,
+                                    primary_key=True, related_name="sketch")
+    voters = models.BinaryField(default=bytes)
+    ips = models.BinaryField(default=bytes)
+    voter_count = models.PositiveIntegerField("Unique voters", default=0)
+    ip_count = models.PositiveIntegerField("Unique IPs", default=0)
+    updated_at = models.DateTimeField("Updated at", auto_now=True)
+
+    def __str__(self):
+        """Return the question the sketch is for."""
+        return f"Participation in {self.question}"
+
+
+class IPVoteWindow(models.Model):
+    """
+    A class storing a Count-Min sketch of the votes per IP in a time bucket.
+
+    The buckets of the last hour form a sliding window, older buckets are
+    deleted. IPs that voted suspiciously often within the window are listed
+    in 'suspects' with their estimated number of votes.
+    """
+
+    start = models.DateTimeField("Start", unique=True)
+    sketch = models.BinaryField(default=bytes)
+    votes = models.PositiveBigIntegerField(default=0)
+    suspects = models.JSONField(default=dict, blank=True)
+
+    def __str__(self):
+        """Return the start of the time bucket."""
+        return f"Votes per IP from {self.start}"
+
+
+class VoterBitmap(models.Model):
+    """
+    A class storing which users voted on a compacted poll.
+
+    Compaction replaces the votes of long closed polls by vote counts on
+    their choices. The voters are kept in a zlib compressed bitmap with bit
+    'user id' set for every user that voted, so it can still be checked if
+    a user voted on the poll.
+    """
+
+    question = models.OneToOneField(Question, on_delete=models.CASCADE,
+                                    primary_key=True,
+                                    related_name="voter_bitmap")
+    bitmap = models.BinaryField(default=bytes)
+    voters = models.PositiveIntegerField("Voters", default=0)
+    compacted_at = models.DateTimeField("Compacted at", auto_now=True)
+
+    def contains(self, user_id):
+        """Check if the bit of a user is set."""
+        bits = zlib.decompress(self.bitmap) if self.bitmap else b""
+        index = user_id >> 3
+        return index < len(bits) and bool(bits[index] >> (user_id & 7) & 1)
+
+    def add(self, user_ids):
+        """Set the bits of the users."""
+        bits = bytearray(zlib.decompress(self.bitmap) if self.bitmap else b"")
+        for user_id in user_ids:
+            index = user_id >> 3
+            if index >= len(bits):
+                bits.extend(bytes(index + 1 - len(bits)))
+            if not bits[index] >> (user_id & 7) & 1:
+                bits[index] |= 1 << (user_id & 7)
+                self.voters += 1
+        self.bitmap = zlib.compress(bytes(bits), 9)
+
+    def __str__(self):
+        """Return the question the voters are for."""
+        return f"Voters of {self.question}"
+
+
+class VoteEvent(models.Model):
+    """
+    A class representing one change to a user's vote, in an append-only log.
+
+    Events are never updated or deleted and their foreign keys are not
+    enforced, so the history outlives deleted votes, choices, questions and
+    users. 'choice' and 'ranking' are empty for cleared votes.
+    """
+
+    CAST = "cast"
+    CHANGE = "change"
+    CLEAR = "clear"
+    ACTIONS = [
+        (CAST, "Cast"),
+        (CHANGE, "Change"),
+        (CLEAR, "Clear"),
+    ]
+
+    question = models.ForeignKey(Question, on_delete=models.DO_NOTHING,
+                                 db_constraint=False, related_name="+")
+    choice = models.ForeignKey(Choice, on_delete=models.DO_NOTHING,
+                               db_constraint=False, db_index=False,
+                               related_name="+", null=True, blank=True)
+    user = models.ForeignKey(User, on_delete=models.DO_NOTHING,
+                             db_constraint=False, db_index=False,
+                             related_name="+")
+    action = models.CharField("Action", max_length=10, choices=ACTIONS)
+    ranking = models.JSONField(default=list, blank=True)
+    ip = models.GenericIPAddressField("IP", null=True, blank=True)
+    # indexed with BRIN on PostgreSQL by migration 0013
+    created_at = models.DateTimeField("Created at", default=timezone.now)
+
+    class Meta:
+        """Index the events of a user's vote, to find the previous event."""
+
+        indexes = [
+            models.Index(fields=["question", "user", "created_at"],
+                         name="vote_event_user_idx"),
+        ]
+
+    def __str__(self):
+        """Return what happened to the vote."""
+        return f"{self.user_id} {self.action} on {self.question_id}"
+
+
+class OutboxTask(models.Model):
+    """
+    A class representing a side effect waiting to be run by a worker.
+
+    Tasks are written in the same transaction as the change that caused
+    them, so a task exists if and only if its change was committed. Workers
+    lease tasks for a while and delete them once they ran; failed tasks are
+    retried after a growing delay and given up on after too many attempts.
+    """
+
+    name = models.CharField("Name", max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField("Created at", default=timezone.now)
+    run_after = models.DateTimeField("Run after", default=timezone.now)
+    leased_until = models.DateTimeField("Leased until", null=True,
+                                        blank=True)
+    lease = models.UUIDField(null=True, blank=True, editable=False)
+    attempts = models.PositiveSmallIntegerField("Attempts", default=0)
+    last_error = models.TextField("Last error", blank=True)
+    failed_at = models.DateTimeField("Failed at", null=True, blank=True)
+
+    class Meta:
+        """Index the tasks that are still to be run."""
+
+        indexes = [
+            models.Index(fields=["run_after"], name="outbox_pending_idx",
+                         condition=models.Q(failed_at__isnull=True)),
+        ]
+
+    def __str__(self):
+        """Return the task's name and id."""
+        return f"{self.name} #{self.pk}"
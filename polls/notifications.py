@@ -0,0 +1,116 @@
+"""
+Email notifications of the results of closed polls.
+
+When a poll closes, every voter with an email address is sent the results
+and the choice they voted for. All voters of a choice get the same text,
+so a message is rendered once per choice rather than once per voter. The
+voters are streamed from the vote table in chunks and sent in batches of
+NOTIFY_BATCH_SIZE messages over a single email backend connection, so
+memory use does not grow with the number of voters. The notify_poll_closed
+task sends NOTIFY_TASK_SIZE messages at most and continues after the last
+notified vote in a new task.
+"""
+import logging
+from itertools import islice
+from django.conf import settings
+from django.core.mail import EmailMessage
+from django.db.models import Count
+from django.template.loader import render_to_string
+from .models import Choice, Vote
+from .tally import tally
+
+logger = logging.getLogger(__name__)
+
+
+def results(question):
+    """
+    Return the final vote counts of a poll.
+
+    The votes of a ranked poll are its first preferences and its winner is
+    the instant runoff winner, as on the results page.
+
+    :return: A tuple of the list of (choice, votes, share) tuples and the
+    list of winning choices, empty if nobody voted.
+    """
+    choices = list(Choice.objects.filter(question=question).order_by("id")
+                   .annotate(vote_count=Count("vote")))
+    counts = [choice.vote_count + choice.compacted_votes for choice in choices]
+    total = sum(counts)
+    rows = [(choice, votes, votes / total if total else 0)
+            for choice, votes in zip(choices, counts)]
+    if question.is_ranked():
+        winner = tally(question)["winner"]
+        return rows, [] if winner is None else [choices[winner]]
+    most = max(counts, default=0)
+    winners = [choice for choice, votes, _ in rows if most and votes == most]
+    return rows, winners
+
+
+def render_messages(question):
+    """
+    Render the subject and body sent to the voters of each choice.
+
+    :return: A dict mapping choice pks to (subject, body) tuples
+    """
+    rows, winners = results(question)
+    messages = {}
+    for choice, _, _ in rows:
+        context = {"question": question, "choice": choice, "rows": rows,
+                   "winners": winners}
+        subject = render_to_string("polls/email/poll_closed_subject.txt",
+                                   context)
+        messages[choice.pk] = (" ".join(subject.split()),
+                               render_to_string("polls/email/poll_closed.txt",
+                                                context))
+    return messages
+
+
+def recipients(question, after, chunk_size):
+    """
+    Stream the (vote pk, choice pk, email) of the voters of a poll.
+
+    The votes are read in pk order with a database iterator in chunks, on
+    PostgreSQL through a server-side cursor, so they are never all in
+    memory. The choice of a ranked ballot is its first preference.
+
+    :param after: Only stream the votes with a greater pk
+    """
+    return (Vote.objects.filter(question=question, pk__gt=after)
+            .exclude(user__email="").order_by("pk")
+            .values_list("pk", "choice_id", "user__email")
+            .iterator(chunk_size=chunk_size))
+
+
+def send_results(question, connection, after=0, limit=None,
+                 batch_size=None):
+    """
+    Email the results of a closed poll to its voters.
+
+    :param question: A closed Question
+    :param connection: An open email backend connection, reused for every
+    batch
+    :param after: Skip the voters up to this vote pk, already notified
+    :param limit: The most messages to send, all if None
+    :param batch_size: Messages sent at a time, defaults to
+    NOTIFY_BATCH_SIZE
+    :return: A tuple of the number of messages sent and the pk of the last
+    notified vote if the limit was reached, else None
+    """
+    batch_size = batch_size or settings.NOTIFY_BATCH_SIZE
+    messages = render_messages(question)
+    voters = recipients(question, after, batch_size)
+    if limit is not None:
+        voters = islice(voters, limit)
+    sent = count = 0
+    last = None
+    while True:
+        batch = []
+        for last, choice_id, email in islice(voters, batch_size):
+            batch.append(EmailMessage(*messages[choice_id], to=[email],
+                                      connection=connection))
+        if not batch:
+            break
+        count += len(batch)
+        sent += connection.send_messages(batch) or 0
+    logger.info(f"Sent {sent} results of poll {question.pk}.")
+    return sent, last if limit is not None and count == limit else None
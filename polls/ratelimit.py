@@ -0,0 +1,127 @@
+"""
+Rate limiting of requests with token buckets.
+
+Every client IP and logged in user has a bucket per rate limited URL name.
+A bucket holds up to 'burst' tokens and refills at the configured rate,
+each request takes one token and requests to an empty bucket get a 429
+response before the view (and any database work) runs.
+Buckets are stored in the cache named by RATELIMIT_CACHE, each bucket is
+updated under a short lock taken with cache.add(). A request that finds
+the lock taken does not wait for it: it passes if the bucket had a token
+when it was last written and is refused otherwise, without taking a
+token. Clients are identified
+by get_client_ip(), which only trusts X-Forwarded-For from configured
+proxies, and users by their session, which the cached_db session engine
+reads from the cache.
+"""
+import logging
+import time
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.core.cache import caches
+from django.http import HttpResponse
+from .views import get_client_ip
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {"s": 1, "m": 60, "h": 60 * 60, "d": 24 * 60 * 60}
+# seconds a bucket lock is held at most, e.g. by a crashed process
+LOCK_TIMEOUT = 1
+
+
+def parse_rate(rate):
+    """
+    Parse a rate such as '30/m' into tokens per second and a burst size.
+
+    :param rate: A string '<requests>/<s|m|h|d>'
+    :return: A tuple of the refill rate in tokens per second and the
+    bucket capacity.
+    """
+    count, period = rate.split("/")
+    return int(count) / PERIODS[period], int(count)
+
+
+def take_token(cache, key, rate, capacity, now=None):
+    """
+    Take a token from a bucket.
+
+    :param cache: The cache the bucket is stored in
+    :param key: The cache key of the bucket
+    :param rate: The refill rate in tokens per second
+    :param capacity: The maximum number of tokens in the bucket
+    :param now: The current time in seconds, defaults to time.time()
+    :return: 0 if a token was taken, otherwise the seconds until the next
+    token is available.
+    """
+    now = time.time() if now is None else now
+    # cache.add() is atomic, so only one request at a time updates a bucket
+    lock = f"{key}:lock"
+    if not cache.add(lock, 1, LOCK_TIMEOUT):
+        # fail open rather than wait, but keep an empty bucket closed
+        tokens, updated = cache.get(key, (capacity, now))
+        return 0 if tokens >= 1 else (1 - tokens) / rate
+    try:
+        tokens, updated = cache.get(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated) * rate)
+        # a bucket that expired from the cache would have refilled anyway
+        timeout = capacity / rate + 1
+        if tokens < 1:
+            cache.set(key, (tokens, now), timeout)
+            return (1 - tokens) / rate
+        cache.set(key, (tokens - 1, now), timeout)
+        return 0
+    finally:
+        cache.delete(lock)
+
+
+class RateLimitMiddleware:
+    """
+    Middleware limiting requests to the URL names listed in RATELIMITS.
+
+    RATELIMITS maps a URL name to the rate per client 'ip' and per logged
+    in 'user', e.g. {'polls:vote': {'ip': '300/m', 'user': '30/m'}}.
+    Only requests with a method in RATELIMIT_METHODS are limited.
+    """
+
+    def __init__(self, get_response):
+        """Parse the configured rates once."""
+        self.get_response = get_response
+        self.cache = caches[settings.RATELIMIT_CACHE]
+        self.methods = set(settings.RATELIMIT_METHODS)
+        self.limits = {
+            view_name: {scope: parse_rate(rate)
+                        for scope, rate in rates.items()}
+            for view_name, rates in settings.RATELIMITS.items()}
+
+    def __call__(self, request):
+        """Pass the request on, limits are checked in process_view."""
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        """Return a 429 response if the request's bucket is empty."""
+        if request.method not in self.methods:
+            return None
+        view_name = request.resolver_match.view_name
+        limits = self.limits.get(view_name)
+        if not limits:
+            return None
+        client_ip = get_client_ip(request)
+        for scope, (rate, capacity) in limits.items():
+            if scope == "ip":
+                identity = client_ip
+            else:
+                identity = request.session.get(SESSION_KEY)
+                if identity is None:
+                    continue
+            wait = take_token(self.cache,
+                              f"ratelimit:{view_name}:{scope}:{identity}",
+                              rate, capacity)
+            if wait:
+                logger.warning(f"IP: {client_ip} was rate limited on "
+                               f"{view_name} ({scope}: {identity}).")
+                response = HttpResponse("Too many requests, "
+                                        "please try again later.",
+                                        status=429)
+                response["Retry-After"] = str(int(wait) + 1)
+                return response
+        return None
@@ -0,0 +1,83 @@
+"""
+Ranked full-text search over question and choice texts.
+
+PostgreSQL searches the GIN indexed 'search_vector' column of
+polls_question and SQLite searches the polls_question_fts FTS5 table,
+both are maintained by database triggers (see migration 0011).
+Other databases fall back to a case insensitive substring match.
+"""
+import re
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+from .models import Question
+
+POSTGRES_QUERY = """
+    SELECT id FROM polls_question,
+           websearch_to_tsquery('english', %s) AS query
+    WHERE search_vector @@ query AND pub_date <= %s
+    ORDER BY ts_rank(search_vector, query) DESC, pub_date DESC
+    LIMIT %s OFFSET %s
+"""
+
+# bm25() is lower for better matches, question text weighs twice as much
+SQLITE_QUERY = """
+    SELECT polls_question.id FROM polls_question_fts
+    JOIN polls_question ON polls_question.id = polls_question_fts.rowid
+    WHERE polls_question_fts MATCH %s AND polls_question.pub_date <= %s
+    ORDER BY bm25(polls_question_fts, 2.0, 1.0), polls_question.pub_date DESC
+    LIMIT %s OFFSET %s
+"""
+
+
+def fts5_query(text):
+    """
+    Convert user input into an FTS5 query matching all of its words.
+
+    Every word is quoted so FTS5 operators in the input are searched
+    as plain text.
+    """
+    words = re.findall(r"\w+", text)
+    return " ".join(f'"{word}"' for word in words)
+
+
+def search_question_ids(text, limit, offset):
+    """Return the ids of the published questions matching the text."""
+    now = timezone.now()
+    if connection.vendor == "postgresql":
+        sql, query = POSTGRES_QUERY, text
+    elif connection.vendor == "sqlite":
+        sql, query = SQLITE_QUERY, fts5_query(text)
+        if not query:
+            return []
+    else:
+        matches = Question.objects.filter(
+            Q(question_text__icontains=text)
+            | Q(choice__choice_text__icontains=text),
+            pub_date__lte=now).distinct().order_by("-pub_date")
+        return list(matches.values_list("id", flat=True)
+                    [offset:offset + limit])
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [query,
+                             connection.ops.adapt_datetimefield_value(now),
+                             limit, offset])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def search_questions(text, page=1, per_page=10):
+    """
+    Search the published questions for the given text.
+
+    :param text: The words to search for
+    :param page: The page of results to return, starting at 1
+    :param per_page: The number of results on a page
+    :return: A tuple of the questions on the page, best match first, and
+    whether there is a next page.
+    """
+    text = text.strip()
+    if not text:
+        return [], False
+    # one extra result tells if there is a next page without counting
+    ids = search_question_ids(text, per_page + 1, (page - 1) * per_page)
+    questions = Question.objects.in_bulk(ids[:per_page])
+    return [questions[pk] for pk in ids[:per_page]], len(ids) > per_page
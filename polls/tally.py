@@ -0,0 +1,196 @@
+"""
+Tally engine for ranked choice polls.
+
+Ballots are stored as a 2D integer array with one row per ballot and one
+column per rank. Each cell holds the index of the ranked choice, or -1 for
+unused ranks, so every round of counting is a handful of vectorized NumPy
+operations instead of a loop over ORM objects.
+"""
+import itertools
+import numpy as np
+from django.core.cache import cache
+from .models import Vote
+
+# seconds a tally stays cached, a new vote changes the version key anyway
+TALLY_CACHE_TIMEOUT = 60 * 60
+# number of ballots fetched from the database cursor at a time
+CHUNK_SIZE = 50000
+
+
+def fill_ballots(ballots, rankings, choice_ids):
+    """
+    Write a chunk of ranked ballots into rows of a ballot array.
+
+    The chunk is flattened into one array of choice ids, so unknown and
+    repeated choices are dropped and the ranks numbered with array
+    operations instead of a loop over every ballot.
+
+    :param ballots: The rows to fill, one per ranking, filled with -1
+    :param rankings: A list of lists of choice ids in preference order
+    :param choice_ids: A sorted int64 array of the poll's choice ids
+    """
+    lengths = np.fromiter(map(len, rankings), dtype=np.int64,
+                          count=len(rankings))
+    flat = np.fromiter(itertools.chain.from_iterable(rankings),
+                       dtype=np.int64, count=int(lengths.sum()))
+    rows = np.repeat(np.arange(len(rankings)), lengths)
+    choices = np.searchsorted(choice_ids, flat)
+    known = choices < len(choice_ids)
+    known[known] = choice_ids[choices[known]] == flat[known]
+    rows, choices = rows[known], choices[known]
+    # keep the first ranking of each choice on a ballot, in ballot order
+    _, first = np.unique(rows * len(choice_ids) + choices, return_index=True)
+    first.sort()
+    rows, choices = rows[first], choices[first]
+    ranks = np.arange(len(rows)) - np.searchsorted(rows, rows)
+    ballots[rows, ranks] = choices
+
+
+def ballots_to_array(rankings, choice_ids, count=None, chunk_size=CHUNK_SIZE):
+    """
+    Convert ranked ballots of choice ids into a compact ballot array.
+
+    Unknown choice ids are dropped from a ballot and so are repeated
+    rankings of the same choice. The array is allocated once from the
+    number of ballots and filled chunk_size ballots at a time.
+
+    :param rankings: An iterable of lists of choice ids in preference order
+    :param choice_ids: The ids of the poll's choices, in display order
+    :param count: The expected number of ballots, rankings is read into a
+    list to count them if None
+    :param chunk_size: The number of ballots converted at a time
+    :return: An int32 array of shape (ballots, ranks) padded with -1
+    """
+    if count is None:
+        rankings = list(rankings)
+        count = len(rankings)
+    order = np.argsort(np.array(choice_ids, dtype=np.int64), kind="stable")
+    sorted_ids = np.array(choice_ids, dtype=np.int64)[order]
+    ballots = np.full((count, len(choice_ids)), -1, dtype=np.int32)
+    rankings = iter(rankings)
+    filled = 0
+    while chunk := list(itertools.islice(rankings, chunk_size)):
+        end = filled + len(chunk)
+        if end > len(ballots):
+            # ballots cast after they were counted
+            ballots = np.vstack([ballots, np.full(
+                (end - len(ballots), len(choice_ids)), -1, dtype=np.int32)])
+        fill_ballots(ballots[filled:end], chunk, sorted_ids)
+        filled = end
+    ballots = ballots[:filled]
+    # map positions in sorted_ids back to display order indexes
+    ranked = ballots >= 0
+    ballots[ranked] = order[ballots[ranked]]
+    width = int(ranked.sum(axis=1).max(initial=0))
+    return ballots[:, :width]
+
+
+def first_preferences(ballots, active):
+    """
+    Find the highest ranked active choice of every ballot.
+
+    :param ballots: A ballot array padded with -1
+    :param active: A boolean array of the choices still in the count
+    :return: An array of choice indexes of the non-exhausted ballots
+    """
+    if not ballots.size:
+        return np.empty(0, dtype=ballots.dtype)
+    # -1 indexes the extra False entry, so unused ranks are never active
+    usable = np.append(active, False)[ballots]
+    rank = usable.argmax(axis=1)
+    rows = np.arange(len(ballots))
+    counted = usable[rows, rank]
+    return ballots[rows, rank][counted]
+
+
+def instant_runoff(ballots, choices):
+    """
+    Tally ballots by instant runoff voting.
+
+    Each round every ballot counts for its highest ranked remaining choice.
+    A choice with more than half of the counted ballots wins, otherwise the
+    choice with the fewest votes is eliminated (ties are broken by the
+    fewest first round votes, then by the last listed choice).
+
+    :param ballots: A ballot array padded with -1
+    :param choices: The number of choices in the poll
+    :return: A tuple of the list of rounds and the winning choice index
+    (None if no ballot ranks any choice). Each round is a dict with the
+    vote 'counts' of every choice, the 'exhausted' ballots and the
+    'eliminated' choice index.
+    """
+    active = np.ones(choices, dtype=bool)
+    first_round = None
+    rounds = []
+    while active.any():
+        top = first_preferences(ballots, active)
+        counts = np.bincount(top, minlength=choices)
+        if first_round is None:
+            first_round = counts
+        current = {"counts": counts.tolist(),
+                   "exhausted": len(ballots) - len(top),
+                   "eliminated": None}
+        rounds.append(current)
+        if not len(top):
+            return rounds, None
+        leader = int(counts.argmax())
+        if counts[leader] * 2 > len(top) or active.sum() == 1:
+            return rounds, leader
+        remaining = np.flatnonzero(active)
+        # lexsort sorts by the last key first
+        loser = remaining[np.lexsort((-remaining,
+                                      first_round[remaining],
+                                      counts[remaining]))[0]]
+        active[loser] = False
+        current["eliminated"] = int(loser)
+    return rounds, None
+
+
+def borda(ballots, choices):
+    """
+    Tally ballots by Borda count.
+
+    A choice ranked at position p (starting at 0) scores choices - 1 - p
+    points, unranked choices score nothing.
+
+    :param ballots: A ballot array padded with -1
+    :param choices: The number of choices in the poll
+    :return: A list of the Borda score of every choice
+    """
+    ranked = ballots >= 0
+    points = (choices - 1 - np.arange(ballots.shape[1]))[np.newaxis, :]
+    points = np.broadcast_to(points, ballots.shape)
+    scores = np.bincount(ballots[ranked], weights=points[ranked],
+                         minlength=choices)
+    return scores.astype(int).tolist()
+
+
+def tally(question):
+    """
+    Tally the ranked ballots of a question.
+
+    Results are cached per results version of the question, so they are
+    only recomputed after the votes of the poll have changed.
+
+    :param question: A ranked choice Question
+    :return: A dict with the 'choices' texts, the instant runoff 'rounds',
+    the runoff 'winner' index and the 'borda' scores
+    """
+    key = f"polls:tally:{question.pk}:{question.results_version}"
+    result = cache.get(key)
+    if result is not None:
+        return result
+    choices = list(question.choice_set.order_by("id")
+                   .values_list("id", "choice_text"))
+    votes = Vote.objects.filter(question=question)
+    rankings = votes.values_list("ranking", flat=True).iterator(
+        chunk_size=CHUNK_SIZE)
+    ballots = ballots_to_array(rankings, [pk for pk, _ in choices],
+                               count=votes.count())
+    rounds, winner = instant_runoff(ballots, len(choices))
+    result = {"choices": [text for _, text in choices],
+              "rounds": rounds,
+              "winner": winner,
+              "borda": borda(ballots, len(choices))}
+    cache.set(key, result, TALLY_CACHE_TIMEOUT)
+    return result
@@ -0,0 +1,312 @@
+"""
+Background tasks for the side effects of votes.
+
+Views enqueue tasks with enqueue() inside the transaction that writes the
+vote, so requests only pay for one extra INSERT. The run_workers command
+drains the outbox: workers lease a batch of due tasks, run the handler of
+each task name once for the whole batch, or once per task for handlers
+registered with batch=False, and delete the tasks that succeeded. A
+handler's writes commit in the same transaction as the deletion of its
+tasks, and only while the worker still holds their lease: a task whose
+lease expired and was taken by another worker is skipped, so its writes
+are committed once. Side effects outside the database, such as emails,
+are repeated if the worker fails after the handler ran.
+
+With TASKS_EAGER the handler runs immediately instead, e.g. for tests.
+"""
+import datetime
+import logging
+import math
+import random
+import statistics
+import time
+import uuid
+from collections import deque
+from django.conf import settings
+from django.core.mail import get_connection
+from django.db import close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .models import OutboxTask, Question, trending_weight
+from .notifications import send_results
+
+logger = logging.getLogger(__name__)
+
+# handlers by task name, each takes the list of payloads of a batch
+handlers = {}
+# names of the tasks run one at a time, in a transaction of their own
+unbatched = set()
+
+
+def task(name, batch=True):
+    """
+    Register a function as the handler of a task name.
+
+    The handler is called with the payloads of all due tasks of that name
+    in a batch, so it can merge their work into a few queries. With batch
+    False it is called for one task at a time, so a failing task does not
+    retry the others.
+    """
+    def register(handler):
+        handlers[name] = handler
+        if not batch:
+            unbatched.add(name)
+        return handler
+    return register
+
+
+def enqueue(name, **payload):
+    """
+    Add a task to the outbox in the current transaction.
+
+    :param name: The name of a registered task
+    :param payload: JSON serializable arguments of the task
+    """
+    if name not in handlers:
+        raise KeyError(f"Unknown task: {name}")
+    if settings.TASKS_EAGER:
+        handlers[name]([payload])
+    else:
+        OutboxTask.objects.create(name=name, payload=payload)
+
+
+def lease_tasks(batch_size, lease_seconds):
+    """
+    Lease up to batch_size due tasks for this worker.
+
+    The lease is taken with a single UPDATE, the lease condition is
+    repeated outside the subquery so concurrent workers never lease the
+    same task.
+
+    :return: A list of the leased tasks
+    """
+    now = timezone.now()
+    free = Q(leased_until__isnull=True) | Q(leased_until__lt=now)
+    due = (OutboxTask.objects.filter(free, failed_at__isnull=True,
+                                     run_after__lte=now)
+           .order_by("run_after", "id")
+           .values_list("id", flat=True)[:batch_size])
+    lease = uuid.uuid4()
+    leased = OutboxTask.objects.filter(free, id__in=list(due)).update(
+        lease=lease,
+        leased_until=now + datetime.timedelta(seconds=lease_seconds))
+    if not leased:
+        return []
+    return list(OutboxTask.objects.filter(lease=lease).order_by("id"))
+
+
+def retry_delay(attempts):
+    """Return the seconds to wait before the next attempt, with jitter."""
+    return min(2 ** attempts, 300) * random.uniform(0.5, 1.5)
+
+
+def run_batch(tasks, metrics):
+    """
+    Run leased tasks grouped by name and record their metrics.
+
+    A failing handler fails all tasks of its name in the batch, or only its
+    task if it is unbatched. They are retried later or marked failed after
+    TASK_MAX_ATTEMPTS attempts.
+    """
+    groups = {}
+    for outbox_task in tasks:
+        key = (outbox_task.name,
+               outbox_task.id if outbox_task.name in unbatched else None)
+        groups.setdefault(key, []).append(outbox_task)
+    for (name, _), group in groups.items():
+        start = time.perf_counter()
+        started = timezone.now()
+        try:
+            with transaction.atomic():
+                group = claim(group)
+                if not group:
+                    continue
+                handlers[name]([outbox_task.payload for outbox_task in group])
+                OutboxTask.objects.filter(
+                    id__in=[outbox_task.id for outbox_task in group]).delete()
+        except Exception as error:
+            logger.exception(f"Task {name} failed for {len(group)} tasks.")
+            fail(group, error)
+            metrics.record(name, group, started, time.perf_counter() - start,
+                           failed=True)
+        else:
+            metrics.record(name, group, started, time.perf_counter() - start)
+
+
+def claim(tasks):
+    """
+    Lock the tasks this worker still holds the lease of.
+
+    A task whose lease ran out may have been leased and run by another
+    worker, running it again would e.g. count its votes twice.
+
+    :param tasks: Tasks leased by this worker, in a transaction
+    :return: The tasks that are still leased by this worker
+    """
+    held = set(OutboxTask.objects.select_for_update().filter(
+        id__in=[outbox_task.id for outbox_task in tasks],
+        lease__in={outbox_task.lease for outbox_task in tasks},
+    ).values_list("id", "lease"))
+    lost = [outbox_task for outbox_task in tasks
+            if (outbox_task.id, outbox_task.lease) not in held]
+    if lost:
+        logger.warning(f"Skipped {len(lost)} {lost[0].name} tasks, their "
+                       f"lease expired before they ran.")
+    return [outbox_task for outbox_task in tasks
+            if (outbox_task.id, outbox_task.lease) in held]
+
+
+def fail(tasks, error):
+    """Schedule failed tasks for a retry or give up on them."""
+    now = timezone.now()
+    for outbox_task in tasks:
+        outbox_task.attempts += 1
+        outbox_task.last_error = f"{type(error).__name__}: {error}"
+        outbox_task.lease = outbox_task.leased_until = None
+        if outbox_task.attempts >= settings.TASK_MAX_ATTEMPTS:
+            outbox_task.failed_at = now
+        else:
+            outbox_task.run_after = now + datetime.timedelta(
+                seconds=retry_delay(outbox_task.attempts))
+    OutboxTask.objects.bulk_update(
+        tasks, ["attempts", "last_error", "lease", "leased_until",
+                "failed_at", "run_after"])
+
+
+class Metrics:
+    """Counts and latencies of the tasks run by the workers."""
+
+    # number of latency samples kept per task name
+    SAMPLES = 10000
+
+    def __init__(self):
+        """Initialize empty metrics."""
+        self.done = {}
+        self.failed = {}
+        self.waits = {}
+        self.runs = {}
+
+    def record(self, name, tasks, started, seconds, failed=False):
+        """
+        Add a batch of tasks of one name.
+
+        The wait of a task is the time from enqueueing to the start of its
+        batch, the run time of the batch is shared by its tasks.
+        """
+        counts = self.failed if failed else self.done
+        counts[name] = counts.get(name, 0) + len(tasks)
+        waits = self.waits.setdefault(name, deque(maxlen=self.SAMPLES))
+        runs = self.runs.setdefault(name, deque(maxlen=self.SAMPLES))
+        for outbox_task in tasks:
+            waits.append((started - outbox_task.created_at).total_seconds())
+            runs.append(seconds / len(tasks))
+
+    def merge(self, other):
+        """Add the metrics of another worker."""
+        for name in set(other.done) | set(other.failed):
+            for counts, others in ((self.done, other.done),
+                                   (self.failed, other.failed)):
+                counts[name] = counts.get(name, 0) + others.get(name, 0)
+            self.waits.setdefault(name, deque(maxlen=self.SAMPLES)).extend(
+                other.waits.get(name, ()))
+            self.runs.setdefault(name, deque(maxlen=self.SAMPLES)).extend(
+                other.runs.get(name, ()))
+
+    def report(self):
+        """Return a line of counts and latencies per task name."""
+        lines = []
+        for name in sorted(self.waits):
+            waits = sorted(self.waits[name])
+            runs = self.runs[name]
+            p95 = waits[min(len(waits) - 1, math.ceil(len(waits) * 0.95) - 1)]
+            lines.append(
+                f"{name}: {self.done.get(name, 0)} done, "
+                f"{self.failed.get(name, 0)} failed, "
+                f"wait p50 {statistics.median(waits) * 1000:.1f} ms "
+                f"p95 {p95 * 1000:.1f} ms, "
+                f"run {statistics.mean(runs) * 1000:.2f} ms per task")
+        return lines
+
+
+def drain(batch_size, stop=None, once=False, poll_interval=1.0):
+    """
+    Run due tasks until stopped.
+
+    :param batch_size: The number of tasks leased at a time
+    :param stop: A threading.Event that stops the worker when set
+    :param once: Stop as soon as no task is due
+    :param poll_interval: Seconds to sleep while no task is due
+    :return: The Metrics of the tasks this worker ran
+    """
+    metrics = Metrics()
+    try:
+        while not (stop and stop.is_set()):
+            close_old_connections()
+            tasks = lease_tasks(batch_size, settings.TASK_LEASE_SECONDS)
+            if tasks:
+                run_batch(tasks, metrics)
+            elif once:
+                break
+            elif stop:
+                stop.wait(poll_interval)
+            else:
+                time.sleep(poll_interval)
+    finally:
+        close_old_connections()
+    return metrics
+
+
+@task("record_votes")
+def record_votes(payloads):
+    """
+    Add votes to the trending scores and results versions of questions.
+
+    The votes of a batch are merged so every question is updated once, and
+    questions whose votes weigh the same (e.g. a survey) share an UPDATE.
+    """
+    weights = {}
+    for payload in payloads:
+        weight = trending_weight(parse_datetime(payload["when"]))
+        for question_id in payload["question_ids"]:
+            weights.setdefault(question_id, []).append(weight)
+    questions = {}
+    for question_id, logs in weights.items():
+        high = max(logs)
+        total = high + math.log(sum(math.exp(w - high) for w in logs))
+        questions.setdefault(total, []).append(question_id)
+    for total, question_ids in questions.items():
+        Question.record_votes(question_ids, weight=total)
+
+
+@task("bump_results_version")
+def bump_results_version(payloads):
+    """Mark the results of questions as changed."""
+    Question.objects.filter(
+        pk__in={payload["question_id"] for payload in payloads}).update(
+        results_version=F("results_version") + 1)
+
+
+@task("notify_poll_closed", batch=False)
+def notify_poll_closed(payloads):
+    """
+    Email the results of closed polls to their voters.
+
+    Each task runs on its own and sends at most NOTIFY_TASK_SIZE messages
+    of one poll, leaving the rest of the voters to a new task, so it ends
+    well within its lease and a retry only sends its own part again.
+    Reopened polls are skipped.
+    """
+    questions = Question.objects.filter(status=Question.CLOSED).in_bulk(
+        {payload["question_id"] for payload in payloads})
+    with get_connection() as connection:
+        for payload in payloads:
+            question = questions.get(payload["question_id"])
+            if question is None:
+                continue
+            _, last = send_results(question, connection,
+                                   after=payload.get("after", 0),
+                                   limit=settings.NOTIFY_TASK_SIZE)
+            if last is not None:
+                enqueue("notify_poll_closed", question_id=question.pk,
+                        after=last)
@@ -2,7 +2,7 @@
 import datetime
 from django.utils import timezone
 from django.urls import reverse
-from polls.models import Question, Choice
+from polls.models import Question, Choice, Vote
 from django.contrib.auth.models import User
 
 
@@ -44,9 +44,7 @@ def create_user(username="dummy", password="password"):
     :param password: The user's password
     :return: A user with the given username and password
     """
-    user = User.objects.create(username=username, password=password)
-    user.save()
-    return user
+    return User.objects.create(username=username, password=password)
 
 
 def vote(choice, user):
@@ -59,3 +57,65 @@ def vote(choice, user):
     response = user.post(reverse('polls:vote', args=(choice.question.id,)),
                          {"choice": choice.id})
     return response
+
+
+def create_questions(texts, days, end_date=None):
+    """
+    Creates a Question object for each of the given "texts" with a
+    single query. See create_question for the "days" and "end_date".
+    :param texts: The questions' texts
+    :param days: The publishing date of the questions offset from now
+    :param end_date: The end_date for the questions offset from now
+    :return: A list of the created Question objects in the order of texts
+    """
+    now = timezone.now()
+    start_time = now + datetime.timedelta(days=days)
+    end_time = now + datetime.timedelta(days=end_date) if end_date else None
+    questions = [Question(question_text=text, pub_date=start_time,
+                          end_date=end_time) for text in texts]
+    for question in questions:
+        # bulk_create does not call save(), which sets the status
+        question.status = question.lifecycle_status()
+    return Question.objects.bulk_create(questions)
+
+
+def create_choices(texts, questions):
+    """
+    Creates a Choice object for each of the given "texts" on every one of
+    the "questions" with a single query.
+    :param texts: The choices' texts
+    :param questions: The questions the choices belong to
+    :return: A list with a list of the created choices for each question
+    """
+    choices = Choice.objects.bulk_create(
+        Choice(question=question, choice_text=text)
+        for question in questions for text in texts)
+    return [choices[n:n + len(texts)]
+            for n in range(0, len(choices), len(texts))]
+
+
+def create_users(count, prefix="dummy", password="password"):
+    """
+    Creates "count" users for testing with a single query
+    :param count: The number of users
+    :param prefix: The users are named prefix0, prefix1, ...
+    :param password: The users' password
+    :return: A list of the created users
+    """
+    return User.objects.bulk_create(
+        User(username=f"{prefix}{n}", password=password)
+        for n in range(count))
+
+
+def create_votes(choices, users):
+    """
+    Creates a Vote object for each pair of "choices" and "users" with
+    a single query, every choice must belong to a different question
+    or every user must be different.
+    :param choices: The choices that are voted for
+    :param users: The users that are voting
+    :return: A list of the created votes
+    """
+    return Vote.objects.bulk_create(
+        Vote(choice=choice, question_id=choice.question_id, user=user)
+        for choice, user in zip(choices, users))
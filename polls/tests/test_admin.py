@@ -0,0 +1,55 @@
+"""Test cases for the admin pages"""
+from .functions import (create_question, create_choice, create_user,
+                        create_users, create_votes)
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.urls import reverse
+from polls.admin import EstimatedCountPaginator
+from polls.models import Question, Vote
+
+
+class AdminTestCase(TestCase):
+    """Test cases for the poll admin pages"""
+    def setUp(self):
+        self.question = create_question("Do you use the admin?", -1)
+        self.yes = create_choice("yes", self.question)
+        self.no = create_choice("no", self.question)
+        create_votes([self.yes] * 3, create_users(3, "u"))
+        admin = User.objects.create_superuser("admin", password="admin")
+        self.client.force_login(admin)
+
+    def test_question_list_vote_counts(self):
+        """The question list shows annotated vote counts."""
+        response = self.client.get(reverse("admin:polls_question_changelist"))
+        self.assertEqual(response.status_code, 200)
+        question = response.context["cl"].result_list[0]
+        self.assertEqual(question.vote_count, 3)
+
+    def test_choice_list_queries(self):
+        """The choice list does not query each row's question or votes."""
+        url = reverse("admin:polls_choice_changelist")
+        self.client.get(url)
+        for n in range(5):
+            create_choice(f"maybe {n}", self.question)
+        # user, count and choices, the session is read from the cache
+        with self.assertNumQueries(3):
+            response = self.client.get(url)
+        counts = {choice.choice_text: choice.vote_count
+                  for choice in response.context["cl"].result_list}
+        self.assertEqual(counts["yes"], 3)
+        self.assertEqual(counts["no"], 0)
+
+    def test_vote_pages(self):
+        """Votes are listed and editable with a user autocomplete."""
+        response = self.client.get(reverse("admin:polls_vote_changelist"))
+        self.assertContains(response, "u0")
+        vote = Vote.objects.first()
+        response = self.client.get(reverse("admin:polls_vote_change",
+                                           args=(vote.id,)))
+        self.assertContains(response, "admin-autocomplete")
+        self.assertNotContains(response, "u2</option>")
+
+    def test_paginator_counts_small_tables(self):
+        """Small or non PostgreSQL tables are counted exactly."""
+        paginator = EstimatedCountPaginator(Question.objects.order_by("id"), 10)
+        self.assertEqual(paginator.count, 1)
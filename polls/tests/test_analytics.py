@@ -0,0 +1,61 @@
+"""Test cases for cross-tabulation analytics"""
+from .functions import create_question, create_choice, create_user
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from io import StringIO
+from polls.analytics import crosstabs
+from polls.models import Vote
+
+
+class CrossTabTestCase(TestCase):
+    """Test cases for cross-tabulating the votes of two questions"""
+    def setUp(self):
+        self.q1 = create_question("Do you like cats?", -1)
+        self.q2 = create_question("Do you like dogs?", -1)
+        self.yes1 = create_choice("yes", self.q1)
+        self.no1 = create_choice("no", self.q1)
+        self.yes2 = create_choice("yes", self.q2)
+        self.no2 = create_choice("no", self.q2)
+        ballots = [(self.yes1, self.yes2), (self.yes1, self.yes2),
+                   (self.yes1, self.no2), (self.no1, self.no2),
+                   (self.no1, None)]
+        for n, (c1, c2) in enumerate(ballots):
+            user = create_user(f"user{n}")
+            Vote.objects.create(choice=c1, user=user)
+            if c2:
+                Vote.objects.create(choice=c2, user=user)
+
+    def test_crosstab_matrix(self):
+        """Only users who voted on both questions are counted."""
+        table, = crosstabs([self.q1.id, self.q2.id], chunk_size=2)
+        self.assertEqual(table.rows, ["yes", "no"])
+        self.assertEqual(table.matrix.tolist(), [[2, 1], [0, 1]])
+        self.assertEqual(table.voters, 4)
+
+    def test_agreement_and_association(self):
+        """Agreement matches choices by text, association is Cramér's V."""
+        table, = crosstabs([self.q1.id, self.q2.id])
+        self.assertAlmostEqual(table.agreement(), 0.75)
+        self.assertGreater(table.association(), 0)
+        self.assertLessEqual(table.association(), 1)
+
+    def test_command_output(self):
+        """The crosstab_votes command prints each table."""
+        out = StringIO()
+        call_command("crosstab_votes", self.q1.id, self.q2.id, stdout=out)
+        self.assertIn("Common voters: 4", out.getvalue())
+        self.assertIn("Agreement: 75.0%", out.getvalue())
+
+    def test_view_is_admin_only(self):
+        """Only staff members can view the analytics page."""
+        url = reverse("polls:analytics") + f"?questions={self.q1.id},{self.q2.id}"
+        self.client.force_login(create_user("visitor"))
+        self.assertEqual(self.client.get(url).status_code, 302)
+        admin = User.objects.create_user("admin", is_staff=True)
+        self.client.force_login(admin)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Common voters: 4")
+        self.assertContains(response, "Agreement: 75.0%")
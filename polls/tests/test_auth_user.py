@@ -1,6 +1,8 @@
 """Tests of user authentication."""
 import logging
+from unittest import mock
 import django.test
+from django.test import override_settings
 from django.urls import reverse
 from django.contrib.auth.models import User
 from django.contrib.auth import authenticate
@@ -85,3 +87,35 @@ class UserAuthTest(django.test.TestCase):
         self.assertEqual(response.status_code, 302)
         login_with_next = f"{reverse('login')}?next={vote_url}"
         self.assertRedirects(response, login_with_next )
+
+    @override_settings(PASSWORD_HASHERS=[
+        "django.contrib.auth.hashers.MD5PasswordHasher"])
+    def test_register_logs_in_new_user(self):
+        """Registering logs the new user in without checking the password.
+
+        The password was just hashed by the form, so it is not verified
+        a second time.
+        """
+        form_data = {"username": "newcomer",
+                     "password1": "Tr0ub4dor&3-horse",
+                     "password2": "Tr0ub4dor&3-horse"}
+        with mock.patch.object(User, "check_password") as check_password:
+            response = self.client.post(reverse("register"), form_data)
+        self.assertRedirects(response, reverse("polls:index"))
+        check_password.assert_not_called()
+        user = User.objects.get(username="newcomer")
+        self.assertEqual(int(self.client.session["_auth_user_id"]), user.id)
+
+    @override_settings(SCRYPT_WORK_FACTOR=2 ** 4, PASSWORD_HASHERS=[
+        "polls.hashers.TunedScryptPasswordHasher",
+        "django.contrib.auth.hashers.MD5PasswordHasher"])
+    def test_password_rehashed_on_login(self):
+        """Passwords are re-hashed with the preferred hasher on login."""
+        with override_settings(PASSWORD_HASHERS=[
+                "django.contrib.auth.hashers.MD5PasswordHasher"]):
+            User.objects.create_user(username="olduser",
+                                     password="Tr0ub4dor&3-horse")
+        self.assertTrue(self.client.login(username="olduser",
+                                          password="Tr0ub4dor&3-horse"))
+        user = User.objects.get(username="olduser")
+        self.assertTrue(user.password.startswith("scrypt$"))
@@ -0,0 +1,76 @@
+"""Test cases for the SVG charts of poll results"""
+from .functions import (create_question, create_choices, create_users,
+                        create_votes)
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+
+class ResultsChartTestCase(TestCase):
+    """Test cases for the results_chart view"""
+    def setUp(self):
+        cache.clear()
+        self.question = create_question("Favourite <colour>?", -1)
+        self.red, self.blue = create_choices(["red & pink", "blue"],
+                                             [self.question])[0]
+        create_votes([self.red, self.red, self.blue], create_users(3))
+        self.url = reverse("polls:results_chart", args=(self.question.id,))
+
+    def test_bar_chart(self):
+        """The bar chart is an SVG image with the escaped choice texts."""
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "image/svg+xml")
+        content = response.content.decode()
+        self.assertTrue(content.startswith("<svg"))
+        self.assertIn("<title>Favourite &lt;colour&gt;?</title>", content)
+        self.assertIn("red &amp; pink", content)
+        self.assertEqual(content.count("<rect"), 3)
+
+    def test_pie_chart(self):
+        """The pie chart has a slice per voted choice and a legend."""
+        response = self.client.get(self.url, {"type": "pie"})
+        content = response.content.decode()
+        self.assertEqual(content.count("<path"), 2)
+        self.assertIn("red &amp; pink: 2 (67%)", content)
+
+    def test_unknown_chart_type(self):
+        """Unknown chart types are rejected."""
+        response = self.client.get(self.url, {"type": "radar"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_unpublished_poll(self):
+        """Charts of unpublished polls are not found."""
+        question = create_question("Future poll", 5)
+        response = self.client.get(
+            reverse("polls:results_chart", args=(question.id,)))
+        self.assertEqual(response.status_code, 404)
+
+    def test_not_modified(self):
+        """A request with the current ETag gets a 304 and no vote count."""
+        etag = self.client.get(self.url)["ETag"]
+        self.assertFalse(etag.startswith("W/"))
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+
+    def test_cached_per_results_version(self):
+        """Charts are cached until the results version changes."""
+        first = self.client.get(self.url)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(self.url).content, first.content)
+        self.question.bump_results_version()
+        second = self.client.get(self.url, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(second.status_code, 200)
+        self.assertNotEqual(second["ETag"], first["ETag"])
+
+    def test_cache_control(self):
+        """Charts of open polls are revalidated, closed ones cached long."""
+        response = self.client.get(self.url)
+        self.assertIn("no-cache", response["Cache-Control"])
+        closed = create_question("Closed poll", -5, -1)
+        response = self.client.get(
+            reverse("polls:results_chart", args=(closed.id,)))
+        self.assertIn("max-age=2592000", response["Cache-Control"])
+        self.assertIn("public", response["Cache-Control"])
@@ -0,0 +1,73 @@
+"""Test cases for compacting the votes of closed polls"""
+from io import StringIO
+from .functions import (create_question, create_choices, create_users,
+                        create_votes)
+from django.core.management import call_command
+from django.test import TestCase
+from polls.models import Question, Vote, VoterBitmap
+
+
+class CompactVotesTestCase(TestCase):
+    """Test cases for the compact_votes command"""
+    def setUp(self):
+        self.old = create_question("Last year's poll?", -800, -400)
+        self.yes, self.no = create_choices(["yes", "no"], [self.old])[0]
+        self.users = create_users(4, "voter")
+        create_votes([self.yes, self.yes, self.no], self.users[:3])
+
+    def compact(self, **options):
+        """Run the compaction and return its report."""
+        out = StringIO()
+        call_command("compact_votes", stdout=out, **options)
+        return out.getvalue()
+
+    def test_counts_are_kept(self):
+        """Compacted votes still count in the results."""
+        self.assertIn("Compacted 3 votes of 1 polls", self.compact())
+        self.assertFalse(Vote.objects.filter(question=self.old).exists())
+        self.yes.refresh_from_db()
+        self.no.refresh_from_db()
+        self.assertEqual(self.yes.votes, 2)
+        self.assertEqual(self.no.votes, 1)
+
+    def test_has_voted(self):
+        """The voter bitmap answers if a user voted on the poll."""
+        self.compact()
+        self.assertEqual(self.old.voter_bitmap.voters, 3)
+        for user in self.users[:3]:
+            self.assertTrue(self.old.has_voted(user))
+        self.assertFalse(self.old.has_voted(self.users[3]))
+
+    def test_recent_and_ranked_polls_are_kept(self):
+        """Recently closed polls and ranked polls are not compacted."""
+        recent = create_question("Last week's poll?", -10, -5)
+        ranked = create_question("Rank last year's polls", -800, -400)
+        ranked.poll_type = Question.RANKED
+        ranked.save()
+        choices = create_choices(["a"], [recent, ranked])
+        create_votes([choices[0][0], choices[1][0]], self.users[:1] * 2)
+        self.compact()
+        self.assertEqual(Vote.objects.count(), 2)
+
+    def test_dry_run(self):
+        """A dry run only lists the polls."""
+        self.assertIn("1 polls can be compacted", self.compact(dry_run=True))
+        self.assertEqual(Vote.objects.count(), 3)
+
+    def test_bitmap_add_is_idempotent(self):
+        """Adding a voter twice counts them once."""
+        bitmap = VoterBitmap(question=self.old)
+        bitmap.add([5, 100000, 5])
+        self.assertEqual(bitmap.voters, 2)
+        self.assertTrue(bitmap.contains(100000))
+        self.assertFalse(bitmap.contains(6))
+        self.assertFalse(bitmap.contains(10 ** 7))
+
+
+class PartitionVotesTestCase(TestCase):
+    """Test cases for the partition_votes command"""
+    def test_requires_postgres(self):
+        """Partitioning is skipped on other databases."""
+        out = StringIO()
+        call_command("partition_votes", stdout=out)
+        self.assertIn("requires PostgreSQL", out.getvalue())
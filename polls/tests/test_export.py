@@ -0,0 +1,66 @@
+"""Test cases for the static export of closed poll results"""
+import os
+import shutil
+import tempfile
+from io import StringIO
+from .functions import create_question, create_choice, create_user
+from django.core.management import call_command
+from django.test import TestCase
+from polls.export import results_path
+from polls.models import Vote
+
+
+class ExportStaticResultsTestCase(TestCase):
+    """Test cases for the export_static_results command"""
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.closed = create_question("Was the exam hard?", -5, -1)
+        self.yes = create_choice("yes", self.closed)
+        create_choice("no", self.closed)
+        self.open = create_question("Is the exam hard?", -1)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def export(self):
+        """Run the export and return its report."""
+        out = StringIO()
+        call_command("export_static_results", self.directory, jobs=1,
+                     stdout=out)
+        return out.getvalue()
+
+    def test_exports_closed_polls(self):
+        """Only closed polls are exported, at the path of their URL."""
+        self.assertIn("Rendered 1 results pages", self.export())
+        path = results_path(self.directory, self.closed.pk)
+        self.assertTrue(path.endswith(
+            os.path.join("polls", str(self.closed.pk), "results",
+                         "index.html")))
+        with open(path, encoding="utf-8") as file:
+            page = file.read()
+        self.assertIn("Was the exam hard?", page)
+        self.assertIn('<img src="chart.svg"', page)
+        chart = os.path.join(os.path.dirname(path), "chart.svg")
+        with open(chart, encoding="utf-8") as file:
+            self.assertIn("<svg", file.read())
+        self.assertFalse(os.path.exists(
+            results_path(self.directory, self.open.pk)))
+
+    def test_renders_changed_polls_only(self):
+        """A poll is only rendered again when its results change."""
+        self.export()
+        self.assertIn("Rendered 0 results pages, 1 unchanged", self.export())
+        Vote.objects.create(choice=self.yes, user=create_user())
+        self.closed.bump_results_version()
+        self.assertIn("Rendered 1 results pages, 0 unchanged", self.export())
+
+    def test_removes_reopened_polls(self):
+        """The page of a poll that is no longer closed is removed."""
+        self.export()
+        self.closed.end_date = None
+        self.closed.save()
+        self.assertIn("1 removed", self.export())
+        path = results_path(self.directory, self.closed.pk)
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(os.path.exists(
+            os.path.join(os.path.dirname(path), "chart.svg")))
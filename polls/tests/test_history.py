@@ -0,0 +1,125 @@
+"""Test cases for the vote history"""
+import datetime
+from io import StringIO
+from .functions import (create_question, create_choices, create_user,
+                        create_users, create_votes, vote)
+from django.core.management import CommandError, call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from polls import history
+from polls.models import Vote, VoteEvent
+
+
+class VoteHistoryTestCase(TestCase):
+    """Test cases for recording vote events"""
+    def setUp(self):
+        history.buffer = history.HistoryBuffer()
+        self.question = create_question("Tea or coffee?", -1)
+        self.tea, self.coffee = create_choices(["tea", "coffee"],
+                                               [self.question])[0]
+        self.user = create_user()
+        self.client.force_login(self.user)
+
+    def test_vote_change_clear(self):
+        """Casting, changing and clearing a vote are recorded in order."""
+        vote(self.tea, self.client)
+        vote(self.coffee, self.client)
+        self.client.post(reverse("polls:clear", args=(self.question.id,)))
+        self.assertFalse(VoteEvent.objects.exists())
+        history.buffer.flush()
+        events = VoteEvent.objects.order_by("id")
+        self.assertEqual([e.action for e in events],
+                         [VoteEvent.CAST, VoteEvent.CHANGE, VoteEvent.CLEAR])
+        self.assertEqual([e.choice_id for e in events],
+                         [self.tea.id, self.coffee.id, None])
+        self.assertEqual(events[0].ip, "127.0.0.1")
+
+    @override_settings(HISTORY_BATCH_SIZE=2)
+    def test_full_batches_are_written(self):
+        """A full batch is written without waiting for a flush."""
+        vote(self.tea, self.client)
+        self.assertEqual(VoteEvent.objects.count(), 0)
+        vote(self.coffee, self.client)
+        self.assertEqual(VoteEvent.objects.count(), 2)
+
+    @override_settings(TRUSTED_PROXY_COUNT=1)
+    def test_invalid_ip_is_dropped(self):
+        """A forged forwarded-for header does not break the batch."""
+        self.client.post(reverse("polls:vote", args=(self.question.id,)),
+                         {"choice": self.tea.id},
+                         HTTP_X_FORWARDED_FOR="999.0.0.1")
+        history.buffer.flush()
+        self.assertIsNone(VoteEvent.objects.get().ip)
+
+
+class ReplayVotesTestCase(TestCase):
+    """Test cases for replaying the vote history"""
+    def setUp(self):
+        self.question = create_question("Tea or coffee?", -10)
+        self.tea, self.coffee = create_choices(["tea", "coffee"],
+                                               [self.question])[0]
+        self.users = create_users(2, "drinker")
+        self.start = timezone.now() - datetime.timedelta(days=3)
+        day = datetime.timedelta(days=1)
+        events = [
+            (self.users[0], VoteEvent.CAST, self.tea, self.start),
+            (self.users[1], VoteEvent.CAST, self.tea, self.start),
+            (self.users[0], VoteEvent.CHANGE, self.coffee, self.start + day),
+            (self.users[1], VoteEvent.CLEAR, None, self.start + 2 * day),
+        ]
+        VoteEvent.objects.bulk_create(
+            VoteEvent(user=user, question=self.question, action=action,
+                      choice=choice, created_at=when)
+            for user, action, choice, when in events)
+
+    def test_replay_counts(self):
+        """The counts are those at the requested time."""
+        at = self.start + datetime.timedelta(hours=1)
+        votes = history.replay(at)
+        self.assertEqual(len(votes), 2)
+        out = StringIO()
+        call_command("replay_votes", at=at.isoformat(), stdout=out)
+        self.assertIn("tea: 2", out.getvalue())
+        self.assertIn("coffee: 0", out.getvalue())
+
+    def test_apply_restores_votes(self):
+        """Applying a replay replaces the current votes."""
+        at = self.start + datetime.timedelta(days=1, hours=1)
+        call_command("replay_votes", at=at.isoformat(), apply=True,
+                     question=[self.question.id], writers_stopped=True,
+                     stdout=StringIO())
+        votes = {vote.user_id: vote.choice_id for vote in Vote.objects.all()}
+        self.assertEqual(votes, {self.users[0].id: self.coffee.id,
+                                 self.users[1].id: self.tea.id})
+        restored = Vote.objects.get(user=self.users[0])
+        self.assertEqual(restored.created_at, self.start)
+        call_command("replay_votes", apply=True, all=True,
+                     writers_stopped=True, stdout=StringIO())
+        self.assertEqual(Vote.objects.count(), 1)
+
+    def test_apply_needs_scope_and_stopped_writers(self):
+        """An unscoped apply or one with running writers is refused."""
+        create_votes([self.tea], self.users[:1])
+        for options in [{"writers_stopped": True}, {"all": True},
+                        {"question": [self.question.id]}]:
+            with self.assertRaises(CommandError):
+                call_command("replay_votes", apply=True, stdout=StringIO(),
+                             **options)
+        self.assertEqual(Vote.objects.get().choice, self.tea)
+
+    def test_apply_skips_compacted_polls(self):
+        """Replaying a compacted poll does not count its votes twice."""
+        self.question.end_date = self.start + datetime.timedelta(hours=1)
+        self.question.save()
+        create_votes([self.coffee], self.users[:1])
+        call_command("compact_votes", days=0, stdout=StringIO())
+        out = StringIO()
+        call_command("replay_votes", apply=True, all=True,
+                     writers_stopped=True, stdout=out)
+        self.assertIn(f"Skipped compacted questions: {self.question.id}",
+                      out.getvalue())
+        self.assertFalse(Vote.objects.exists())
+        self.coffee.refresh_from_db()
+        self.assertEqual(self.coffee.votes, 1)
+        self.assertTrue(self.question.has_voted(self.users[0]))
@@ -0,0 +1,90 @@
+"""Test cases for Idempotency-Key support"""
+import threading
+from .functions import create_question, create_choice, create_user
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase, TransactionTestCase
+from django.urls import reverse
+from polls.models import Question, Vote
+
+
+class IdempotencyTestCase(TestCase):
+    """Test cases for replaying responses of retried requests"""
+    def setUp(self):
+        cache.clear()
+        self.question = create_question("Retry?", -1)
+        self.c1 = create_choice("yes", self.question)
+        self.c2 = create_choice("no", self.question)
+        self.client.force_login(create_user())
+        self.url = reverse("polls:vote", args=(self.question.id,))
+
+    def post(self, choice, key):
+        """Vote for a choice with an Idempotency-Key."""
+        return self.client.post(self.url, {"choice": choice.id},
+                                HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_is_replayed(self):
+        """A retry gets the first response without voting again."""
+        first = self.post(self.c1, "key-1")
+        with self.assertNumQueries(0):  # the session is read from the cache
+            retry = self.post(self.c1, "key-1")
+        self.assertEqual(retry.status_code, first.status_code)
+        self.assertEqual(retry["Location"], first["Location"])
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.question.refresh_from_db()
+        self.assertEqual(self.question.results_version, 1)
+
+    def test_new_key_runs_view(self):
+        """Requests with different keys are both handled."""
+        self.post(self.c1, "key-1")
+        self.post(self.c2, "key-2")
+        self.assertEqual(Vote.objects.get().choice, self.c2)
+
+    def test_requests_without_key(self):
+        """Requests without a key are always handled."""
+        self.client.post(self.url, {"choice": self.c1.id})
+        self.client.post(self.url, {"choice": self.c2.id})
+        self.assertEqual(Vote.objects.get().choice, self.c2)
+
+    def test_keys_are_scoped_to_the_session(self):
+        """Another user's request with the same key is handled."""
+        self.post(self.c1, "key-1")
+        other = Client()
+        other.force_login(create_user("other"))
+        other.post(self.url, {"choice": self.c2.id},
+                   HTTP_IDEMPOTENCY_KEY="key-1")
+        self.assertEqual(Vote.objects.count(), 2)
+
+
+class ConcurrentIdempotencyTestCase(TransactionTestCase):
+    """Test cases for concurrent requests with the same key"""
+    def setUp(self):
+        cache.clear()
+        self.question = create_question("Concurrent retry?", -1)
+        self.choice = create_choice("yes", self.question)
+        self.user = create_user()
+
+    def test_one_write_per_key(self):
+        """Parallel requests with one key write the vote only once."""
+        client = Client()
+        client.force_login(self.user)
+        url = reverse("polls:vote", args=(self.question.id,))
+        start = threading.Barrier(8)
+        statuses = []
+
+        def post():
+            start.wait()
+            response = client.post(url, {"choice": self.choice.id},
+                                   HTTP_IDEMPOTENCY_KEY="same-key")
+            statuses.append(response.status_code)
+            connection.close()
+
+        threads = [threading.Thread(target=post) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(statuses, [302] * 8)
+        self.assertEqual(Vote.objects.count(), 1)
+        self.question.refresh_from_db()
+        self.assertEqual(self.question.results_version, 1)
@@ -0,0 +1,103 @@
+"""Test cases for importing polls"""
+import json
+import tempfile
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+from django.urls import reverse
+from io import StringIO
+from polls.importer import (PollDefinitionError, import_polls,
+                            parse_definitions)
+from polls.models import Choice, Question
+
+
+def jsonl(polls):
+    """Return poll definitions as JSONL text."""
+    return "\n".join(json.dumps(poll) for poll in polls)
+
+
+POLLS = [{"question_text": f"Imported poll {n}?",
+          "choices": ["yes", "no", "maybe"],
+          "pub_date": "2024-08-01T00:00:00+00:00",
+          "end_date": "2024-09-01T00:00:00+00:00"} for n in range(5)]
+
+
+class ImportPollsTestCase(TestCase):
+    """Test cases for the poll importer"""
+    def test_import_in_batches(self):
+        """Polls are imported with two bulk inserts per batch."""
+        with self.assertNumQueries(2 * 3 + 2):  # 3 batches and a savepoint
+            self.assertEqual(import_polls(POLLS, batch_size=2), 5)
+        self.assertEqual(Question.objects.count(), 5)
+        question = Question.objects.get(question_text="Imported poll 4?")
+        self.assertEqual(
+            list(question.choice_set.values_list("choice_text", flat=True)),
+            ["yes", "no", "maybe"])
+        self.assertFalse(question.can_vote())
+
+    def test_invalid_poll_imports_nothing(self):
+        """A single invalid poll stops the whole import."""
+        polls = POLLS + [{"question_text": "No choices?", "choices": []}]
+        with self.assertRaisesMessage(PollDefinitionError, "Poll 6"):
+            import_polls(polls)
+        self.assertFalse(Question.objects.exists())
+
+    def test_end_date_before_pub_date(self):
+        """The end date of a poll can not be before its pub date."""
+        poll = dict(POLLS[0], end_date="2024-07-01T00:00:00")
+        with self.assertRaises(PollDefinitionError):
+            import_polls([poll])
+
+    def test_invalid_date(self):
+        """Well formed but impossible dates are invalid definitions."""
+        poll = dict(POLLS[0], pub_date="2024-13-45T00:00:00")
+        with self.assertRaisesMessage(PollDefinitionError,
+                                      "Poll 2: invalid pub_date"):
+            import_polls([POLLS[1], poll])
+
+    def test_yaml_dates(self):
+        """Dates and date-only values loaded from YAML are accepted."""
+        polls = parse_definitions(
+            "- question_text: Dated poll?\n"
+            "  choices: [tea, coffee]\n"
+            "  pub_date: 2024-08-01\n"
+            "  end_date: 2024-09-01 12:00:00\n", "yaml")
+        import_polls(polls)
+        question = Question.objects.get()
+        self.assertEqual((question.pub_date.day, question.pub_date.hour),
+                         (1, 0))
+        self.assertEqual(question.end_date.hour, 12)
+
+    def test_command_dry_run(self):
+        """The dry run only validates the polls."""
+        with tempfile.NamedTemporaryFile("w", suffix=".jsonl") as file:
+            file.write(jsonl(POLLS))
+            file.flush()
+            out = StringIO()
+            call_command("import_polls", file.name, dry_run=True, stdout=out)
+            self.assertIn("5 polls are valid", out.getvalue())
+            self.assertFalse(Question.objects.exists())
+            call_command("import_polls", file.name, stdout=out)
+        self.assertEqual(Choice.objects.count(), 15)
+
+    def test_command_invalid_file(self):
+        """Unreadable files are reported as command errors."""
+        with tempfile.NamedTemporaryFile("w", suffix=".json") as file:
+            file.write("{not json")
+            file.flush()
+            with self.assertRaises(CommandError):
+                call_command("import_polls", file.name, stdout=StringIO())
+
+    def test_import_view_is_staff_only(self):
+        """Only staff members can upload polls."""
+        upload = SimpleUploadedFile("polls.jsonl", jsonl(POLLS).encode())
+        response = self.client.post(reverse("polls:import_polls"),
+                                    {"file": upload})
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(Question.objects.exists())
+        staff = User.objects.create_user("staff", is_staff=True)
+        self.client.force_login(staff)
+        upload.seek(0)
+        self.client.post(reverse("polls:import_polls"), {"file": upload})
+        self.assertEqual(Question.objects.count(), 5)
@@ -0,0 +1,114 @@
+"""Test cases for the lifecycle status of polls and its scheduler"""
+import datetime
+import threading
+from io import StringIO
+from .functions import create_question, create_questions
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from polls import lifecycle
+from polls.models import Question
+
+
+class QuestionStatusTestCase(TestCase):
+    """Test cases for the status set when saving a question"""
+    def test_status_from_dates(self):
+        """The status matches the dates of the question."""
+        self.assertEqual(create_question("Future?", 2).status,
+                         Question.SCHEDULED)
+        self.assertEqual(create_question("Now?", -1).status, Question.OPEN)
+        self.assertEqual(create_question("Past?", -5, -1).status,
+                         Question.CLOSED)
+        self.assertEqual(create_questions(["Bulk?"], -5, -1)[0].status,
+                         Question.CLOSED)
+
+    def test_status_saved_with_update_fields(self):
+        """Saving only the dates also saves the new status."""
+        question = create_question("Reopened?", -5, -1)
+        question.end_date = timezone.now() + datetime.timedelta(days=1)
+        question.save(update_fields=["end_date"])
+        question.refresh_from_db()
+        self.assertEqual(question.status, Question.OPEN)
+
+
+class SchedulerTestCase(TestCase):
+    """Test cases for advancing the statuses when dates pass"""
+    def setUp(self):
+        self.soon = create_question("Opening soon?", 1, 3)
+        self.later = create_question("Opening later?", 2)
+        self.closing = create_question("Closing soon?", -1, 2)
+        self.brief = create_question("Brief poll?", 1, 1.5)
+
+    def test_advance(self):
+        """Due polls are opened and ended polls are closed."""
+        now = timezone.now() + datetime.timedelta(days=2.5)
+        opened, closed = lifecycle.advance(now)
+        self.assertEqual(opened, [self.soon.pk, self.later.pk])
+        self.assertCountEqual(closed, [self.closing.pk, self.brief.pk])
+        self.assertEqual(lifecycle.advance(now), ([], []))
+        self.soon.refresh_from_db()
+        self.assertEqual(self.soon.status, Question.OPEN)
+
+    def test_next_transition(self):
+        """The next change is the earliest pub_date or end_date to come."""
+        self.assertEqual(lifecycle.next_transition(), self.soon.pub_date)
+        lifecycle.advance(timezone.now() + datetime.timedelta(days=1.2))
+        self.assertEqual(lifecycle.next_transition(), self.brief.end_date)
+
+    def test_run_stops(self):
+        """The scheduler returns once stopped."""
+        stop = threading.Event()
+        stop.set()
+        lifecycle.run(stop=stop)
+        lifecycle.run(once=True)
+
+    def test_command_once(self):
+        """The command reports the changes and the next change."""
+        Question.objects.filter(pk=self.closing.pk).update(
+            status=Question.SCHEDULED)
+        out = StringIO()
+        call_command("run_scheduler", once=True, stdout=out)
+        self.assertIn("Opened 1 and closed 0 polls.", out.getvalue())
+        self.assertIn(self.soon.pub_date.isoformat(), out.getvalue())
+
+
+class LifecycleListingTestCase(TestCase):
+    """Test cases for the closing soon and upcoming listings"""
+    def setUp(self):
+        self.late = create_question("Closing tonight?", -1, 0.5)
+        self.early = create_question("Closing in an hour?", -1, 0.05)
+        create_question("Closing next week?", -1, 7)
+        create_question("Closed?", -5, -1)
+        self.next = create_question("Opening tomorrow?", 1)
+        self.after = create_question("Opening next week?", 7)
+
+    def test_closing_soon(self):
+        """Open polls closing within a day are listed, closing first."""
+        response = self.client.get(reverse("polls:closing_soon"))
+        self.assertQuerySetEqual(response.context["latest_question_list"],
+                                 [self.early, self.late])
+        self.assertContains(response, "Closing soon")
+
+    def test_upcoming(self):
+        """Scheduled polls are listed, opening first."""
+        response = self.client.get(reverse("polls:upcoming"))
+        self.assertQuerySetEqual(response.context["latest_question_list"],
+                                 [self.next, self.after])
+        self.assertNotContains(
+            response, reverse("polls:results", args=(self.next.id,)))
+
+    def test_listings_use_partial_indexes(self):
+        """Both listings are range scans of a partial index."""
+        if connection.vendor != "sqlite":
+            self.skipTest("Query plans are checked on SQLite")
+        now = timezone.now()
+        plan = Question.objects.filter(
+            status=Question.OPEN, end_date__gte=now).order_by(
+            "end_date").explain()
+        self.assertIn("question_open_idx", plan)
+        plan = Question.objects.filter(
+            status=Question.SCHEDULED, pub_date__gt=now).order_by(
+            "pub_date").explain()
+        self.assertIn("question_scheduled_idx", plan)
@@ -1,10 +1,11 @@
 """Test cases for classes used in the voting process"""
 import datetime
+import math
 import time
 from .functions import create_question, create_choice
 from django.test import TestCase
 from django.utils import timezone
-from polls.models import Question
+from polls.models import Question, trending_weight
 
 
 class QuestionModelTestcase(TestCase):
@@ -101,6 +102,19 @@ class QuestionModelTestcase(TestCase):
         self.assertTrue(question1.is_published())
         self.assertFalse(question2.is_published())
 
+    def test_record_votes_sums_trending_weights(self):
+        """
+        The trending score is the log of the sum of the vote weights.
+        """
+        question = create_question("Is this trending?", -1)
+        when = timezone.now()
+        Question.record_votes([question.id], when=when)
+        Question.record_votes([question.id], when=when)
+        question.refresh_from_db()
+        self.assertAlmostEqual(question.trending_score,
+                               trending_weight(when) + math.log(2))
+        self.assertEqual(question.results_version, 2)
+
 
 class ChoiceModelTestcase(TestCase):
     """Tests for the choice class"""
@@ -0,0 +1,135 @@
+"""Test cases for the email notifications of closed polls"""
+import datetime
+from unittest import mock
+from .functions import (create_question, create_choices, create_users,
+                        create_votes)
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from polls import lifecycle, notifications
+from polls.models import OutboxTask, Question, Vote
+from polls.tasks import notify_poll_closed
+
+
+class CountingBackend(EmailBackend):
+    """Locmem email backend that records its connections and batches."""
+
+    connections = []
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.batches = []
+        self.connections.append(self)
+
+    def send_messages(self, messages):
+        self.batches.append(len(messages))
+        return super().send_messages(messages)
+
+
+class PollClosedNotificationTestCase(TestCase):
+    """Test cases for emailing the results when a poll closes"""
+    def setUp(self):
+        CountingBackend.connections.clear()
+        self.question = create_question("Tea or coffee?", -1, 1)
+        self.tea, self.coffee = create_choices(["Tea", "Coffee"],
+                                               [self.question])[0]
+        self.users = create_users(5)
+        for user in self.users:
+            user.email = f"{user.username}@example.com"
+        self.users[4].email = ""
+        User.objects.bulk_update(self.users, ["email"])
+        create_votes([self.tea] * 3 + [self.coffee] * 2, self.users)
+
+    def close(self):
+        """Run the scheduler after the poll's end date."""
+        lifecycle.advance(timezone.now() + datetime.timedelta(days=2))
+
+    def test_voters_get_results(self):
+        """Every voter with an email gets the results and their choice."""
+        self.close()
+        self.assertEqual(len(mail.outbox), 4)
+        self.assertCountEqual([message.to[0] for message in mail.outbox],
+                              [f"dummy{n}@example.com" for n in range(4)])
+        message = mail.outbox[3]
+        self.assertEqual(message.to, ["dummy3@example.com"])
+        self.assertEqual(message.subject,
+                         'KU polls: "Tea or coffee?" has closed')
+        self.assertIn("You voted for: Coffee", message.body)
+        self.assertIn("Most votes: Tea", message.body)
+        self.assertIn("Tea: 3 votes (60%)", message.body)
+
+    def test_rendered_once_per_choice(self):
+        """Messages are rendered per choice, not per voter."""
+        with mock.patch("polls.notifications.render_to_string",
+                        wraps=notifications.render_to_string) as render:
+            self.close()
+        self.assertEqual(render.call_count, 4)
+
+    @override_settings(
+        EMAIL_BACKEND="polls.tests.test_notifications.CountingBackend",
+        NOTIFY_BATCH_SIZE=2, NOTIFY_TASK_SIZE=3)
+    def test_batches_over_one_connection(self):
+        """Each task reuses one connection and sends in batches."""
+        self.close()
+        self.assertEqual(len(mail.outbox), 4)
+        self.assertEqual([backend.batches
+                          for backend in CountingBackend.connections],
+                         [[2, 1], [1]])
+
+    def test_reopened_poll_skipped(self):
+        """Polls reopened before the task runs are not notified."""
+        with override_settings(TASKS_EAGER=False):
+            self.close()
+        task = OutboxTask.objects.get(name="notify_poll_closed")
+        self.assertEqual(task.payload, {"question_id": self.question.pk})
+        self.question.end_date = timezone.now() + datetime.timedelta(days=5)
+        self.question.save()
+        notify_poll_closed([task.payload])
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(Question.objects.get(pk=self.question.pk).status,
+                         Question.OPEN)
+
+    def test_closed_by_save(self):
+        """Moving the end date of an open poll into the past notifies."""
+        self.question.end_date = timezone.now() - datetime.timedelta(hours=1)
+        with CaptureQueriesContext(connection) as queries:
+            self.question.save()
+        self.assertEqual(len(mail.outbox), 4)
+        updates = [query for query in queries.captured_queries
+                   if query["sql"].startswith("UPDATE")]
+        self.assertEqual(len(updates), 1)
+        self.close()
+        self.question.save()
+        self.assertEqual(len(mail.outbox), 4)
+
+    def test_stale_poll_not_notified(self):
+        """Polls that were never open, like loaded fixtures, get no email."""
+        Question.objects.filter(pk=self.question.pk).update(
+            status=Question.SCHEDULED)
+        _, closed = lifecycle.advance(
+            timezone.now() + datetime.timedelta(days=2))
+        self.assertEqual(closed, [self.question.pk])
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(Question.objects.get(pk=self.question.pk).status,
+                         Question.CLOSED)
+
+    def test_ranked_winner(self):
+        """Ranked polls name the instant runoff winner."""
+        self.question.poll_type = Question.RANKED
+        self.question.save()
+        ballots = {0: [self.tea.pk], 1: [self.tea.pk]}
+        for n, user in enumerate(self.users):
+            ranking = ballots.get(n, [self.coffee.pk, self.tea.pk])
+            Vote.objects.filter(user=user).update(
+                choice_id=ranking[0], ranking=ranking)
+        milk = self.question.choice_set.create(choice_text="Milk")
+        Vote.objects.filter(user=self.users[4]).update(
+            choice=milk, ranking=[milk.pk, self.tea.pk])
+        self.close()
+        body = mail.outbox[0].body
+        self.assertIn("Winner after the instant runoff: Tea", body)
+        self.assertIn("Coffee: 2 votes", body)
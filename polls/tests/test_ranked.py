@@ -0,0 +1,104 @@
+"""Test cases for ranked choice polls"""
+import numpy as np
+from .functions import create_question, create_choice, create_user
+from django.test import TestCase
+from django.urls import reverse
+from polls.models import Question, Vote
+from polls.tally import ballots_to_array, borda, instant_runoff, tally
+
+
+class TallyEngineTestCase(TestCase):
+    """Test cases for the instant runoff and Borda tally engine"""
+    def test_ballots_to_array(self):
+        """Ballots are padded with -1 and unknown or repeated ids dropped."""
+        ballots = ballots_to_array([[12, 10], [11, 11, 99], []],
+                                   [10, 11, 12])
+        self.assertEqual(ballots.tolist(), [[2, 0], [1, -1], [-1, -1]])
+
+    def test_ballots_to_array_in_chunks(self):
+        """Chunks fill the counted rows and rows are added for late votes."""
+        ballots = ballots_to_array(iter([[12, 10], [11, 11], [10, 12, 11]]),
+                                   [12, 10, 11], count=2, chunk_size=2)
+        self.assertEqual(ballots.dtype, np.int32)
+        self.assertEqual(ballots.tolist(),
+                         [[0, 1, -1], [2, -1, -1], [1, 0, 2]])
+
+    def test_majority_wins_first_round(self):
+        """A choice with a majority of first preferences wins at once."""
+        ballots = np.array([[0, 1], [0, 2], [1, 0]])
+        rounds, winner = instant_runoff(ballots, 3)
+        self.assertEqual(winner, 0)
+        self.assertEqual(len(rounds), 1)
+
+    def test_votes_transfer_after_elimination(self):
+        """Ballots of an eliminated choice count for their next choice."""
+        ballots = np.array([[0, -1]] * 4 + [[1, -1]] * 3 + [[2, 1]] * 2)
+        rounds, winner = instant_runoff(ballots, 3)
+        self.assertEqual([r["counts"] for r in rounds],
+                         [[4, 3, 2], [4, 5, 0]])
+        self.assertEqual(rounds[0]["eliminated"], 2)
+        self.assertEqual(winner, 1)
+
+    def test_exhausted_ballots(self):
+        """Ballots without remaining choices are exhausted."""
+        ballots = np.array([[0], [0], [1], [1], [2]])
+        rounds, winner = instant_runoff(ballots, 3)
+        self.assertEqual(rounds[1]["exhausted"], 1)
+        self.assertIn(winner, (0, 1))
+
+    def test_borda(self):
+        """Borda scores choices by the position they are ranked at."""
+        ballots = np.array([[0, 1, 2], [1, 0, -1]])
+        self.assertEqual(borda(ballots, 3), [3, 3, 0])
+
+
+class RankedVotingTestCase(TestCase):
+    """Test cases for voting on ranked choice polls"""
+    def setUp(self):
+        self.question = create_question("Best fruit?", -1)
+        self.question.poll_type = Question.RANKED
+        self.question.save()
+        self.c1 = create_choice("apple", self.question)
+        self.c2 = create_choice("banana", self.question)
+        self.c3 = create_choice("cherry", self.question)
+        self.client.force_login(create_user())
+
+    def rank(self, **ranks):
+        """Submit a ranked ballot."""
+        return self.client.post(
+            reverse("polls:vote", args=(self.question.id,)),
+            {f"rank_{getattr(self, name).id}": rank
+             for name, rank in ranks.items()})
+
+    def test_ranked_vote_stores_ballot(self):
+        """The vote stores the ranking and its first preference."""
+        self.rank(c1=2, c2="", c3=1)
+        vote = Vote.objects.get()
+        self.assertEqual(vote.choice, self.c3)
+        self.assertEqual(vote.ranking, [self.c3.id, self.c1.id])
+
+    def test_empty_ballot_is_rejected(self):
+        """A ballot has to rank at least one choice."""
+        response = self.rank(c1="", c2="")
+        self.assertRedirects(response, reverse("polls:detail",
+                                               args=(self.question.id,)))
+        self.assertFalse(Vote.objects.exists())
+
+    def test_tally_is_cached_per_version(self):
+        """Tallies are recomputed only after a vote changes."""
+        self.rank(c1=1)
+        self.question.refresh_from_db()
+        self.assertEqual(tally(self.question)["winner"], 0)
+        with self.assertNumQueries(0):
+            tally(self.question)
+        self.rank(c2=1)
+        self.question.refresh_from_db()
+        self.assertEqual(tally(self.question)["winner"], 1)
+
+    def test_results_show_rounds(self):
+        """The results page renders the runoff rounds."""
+        self.rank(c1=1, c2=2)
+        response = self.client.get(reverse("polls:results",
+                                           args=(self.question.id,)))
+        self.assertContains(response, "Round 1")
+        self.assertContains(response, "Winner: apple")
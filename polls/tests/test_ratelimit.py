@@ -0,0 +1,118 @@
+"""Test cases for rate limiting"""
+import threading
+from .functions import create_question, create_choice, create_user, vote
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from polls.models import Vote
+from polls.ratelimit import parse_rate, take_token
+
+
+class TokenBucketTestCase(TestCase):
+    """Test cases for the token bucket"""
+    def setUp(self):
+        cache.clear()
+
+    def test_parse_rate(self):
+        """Rates are parsed into tokens per second and a burst size."""
+        self.assertEqual(parse_rate("30/m"), (0.5, 30))
+        self.assertEqual(parse_rate("2/s"), (2, 2))
+
+    def test_bucket_empties_and_refills(self):
+        """A bucket allows a burst and refills at the given rate."""
+        for _ in range(3):
+            self.assertEqual(take_token(cache, "bucket", 1, 3, now=100), 0)
+        self.assertAlmostEqual(take_token(cache, "bucket", 1, 3, now=100), 1)
+        self.assertEqual(take_token(cache, "bucket", 1, 3, now=101.5), 0)
+
+    def test_locked_bucket_fails_open(self):
+        """A request finding the bucket locked does not wait for it."""
+        take_token(cache, "bucket", 1, 3, now=100)
+        cache.add("bucket:lock", 1)
+        self.assertEqual(take_token(cache, "bucket", 1, 3, now=100), 0)
+        cache.set("bucket", (0.5, 100))
+        self.assertAlmostEqual(take_token(cache, "bucket", 1, 3, now=100), 0.5)
+        # requests passed while the bucket was locked take no token
+        self.assertEqual(cache.get("bucket"), (0.5, 100))
+
+    def test_concurrent_requests_share_a_bucket(self):
+        """Concurrent requests cannot get through an empty bucket."""
+        taken = []
+        start_line = threading.Barrier(8)
+
+        def take():
+            start_line.wait()
+            for _ in range(5):
+                taken.append(take_token(cache, "shared", 0.001, 10) == 0)
+
+        threads = [threading.Thread(target=take) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertGreaterEqual(taken.count(True), 10)
+        self.assertFalse(all(taken))
+        self.assertNotEqual(take_token(cache, "shared", 0.001, 10), 0)
+
+
+@override_settings(RATELIMITS={"polls:vote": {"ip": "5/m", "user": "2/m"}})
+class RateLimitMiddlewareTestCase(TestCase):
+    """Test cases for the rate limiting middleware"""
+    def setUp(self):
+        cache.clear()
+        self.question = create_question("Are you a bot?", -1)
+        self.choice = create_choice("no", self.question)
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_user_is_limited(self):
+        """A user gets a 429 response after using up their bucket."""
+        self.client.force_login(create_user())
+        self.assertEqual(vote(self.choice, self.client).status_code, 302)
+        self.assertEqual(vote(self.choice, self.client).status_code, 302)
+        # the session is read from the cache
+        with self.assertNumQueries(0):
+            response = vote(self.choice, self.client)
+        self.assertEqual(response.status_code, 429)
+        self.assertIn("Retry-After", response)
+        self.assertEqual(Vote.objects.count(), 1)
+
+    def test_ip_is_limited(self):
+        """Anonymous requests are limited per client IP without queries."""
+        url = reverse("polls:vote", args=(self.question.id,))
+        for _ in range(5):
+            self.client.post(url, {"choice": self.choice.id})
+        with self.assertNumQueries(0):
+            response = self.client.post(url, {"choice": self.choice.id})
+        self.assertEqual(response.status_code, 429)
+        other_ip = self.client.post(url, {"choice": self.choice.id},
+                                    REMOTE_ADDR="10.0.0.2")
+        self.assertEqual(other_ip.status_code, 302)
+
+    def test_forwarded_for_is_not_trusted(self):
+        """A client cannot get fresh buckets by forging X-Forwarded-For."""
+        url = reverse("polls:vote", args=(self.question.id,))
+        statuses = [self.client.post(url, {"choice": self.choice.id},
+                                     HTTP_X_FORWARDED_FOR=f"10.1.0.{n}")
+                    .status_code for n in range(6)]
+        self.assertEqual(statuses[-1], 429)
+
+    @override_settings(TRUSTED_PROXY_COUNT=1)
+    def test_forwarded_for_from_trusted_proxy(self):
+        """Behind a proxy the address it appended identifies the client."""
+        url = reverse("polls:vote", args=(self.question.id,))
+        for n in range(6):
+            response = self.client.post(
+                url, {"choice": self.choice.id},
+                HTTP_X_FORWARDED_FOR=f"10.1.0.{n}, 10.2.0.1")
+        self.assertEqual(response.status_code, 429)
+        response = self.client.post(url, {"choice": self.choice.id},
+                                    HTTP_X_FORWARDED_FOR="10.1.0.1, 10.2.0.2")
+        self.assertEqual(response.status_code, 302)
+
+    def test_get_requests_are_not_limited(self):
+        """Only POST requests are rate limited."""
+        url = reverse("polls:vote", args=(self.question.id,))
+        for _ in range(10):
+            self.assertNotEqual(self.client.get(url).status_code, 429)
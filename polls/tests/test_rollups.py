@@ -0,0 +1,115 @@
+"""Test cases for vote timestamps and per-minute rollups"""
+import datetime
+from .functions import create_question, create_choice, create_user
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from io import StringIO
+from polls.models import Vote, VoteEvent, VoteRollup, RollupWatermark
+
+
+def rollup(lag=0):
+    """Run the rollup_votes command, without a lag by default."""
+    call_command("rollup_votes", lag=lag, stdout=StringIO())
+
+
+class VoteRollupTestCase(TestCase):
+    """Test cases for the rollup_votes command and timeline endpoint"""
+    def setUp(self):
+        self.question = create_question("Do you like rollups?", -1)
+        self.c1 = create_choice("yes", self.question)
+        self.c2 = create_choice("no", self.question)
+        self.users = {}
+        self.minute = (timezone.now() - datetime.timedelta(minutes=5)
+                       ).replace(second=0, microsecond=0)
+
+    def add_event(self, action, username, choice=None, minutes_after=0,
+                  seconds=10):
+        """Record a vote event of a user at a time in the past."""
+        if username not in self.users:
+            self.users[username] = create_user(username)
+        when = self.minute + datetime.timedelta(minutes=minutes_after,
+                                                seconds=seconds)
+        return VoteEvent.objects.create(
+            user=self.users[username], question=self.question,
+            action=action, choice=choice, created_at=when)
+
+    def counts(self):
+        """Return the rollups as a dict of (choice pk, minute) to votes."""
+        return {(r.choice_id, r.minute): r.votes
+                for r in VoteRollup.objects.all()}
+
+    def test_vote_has_timestamps(self):
+        """Votes record when they were created and last updated."""
+        vote = Vote.objects.create(choice=self.c1, user=create_user())
+        self.assertIsNotNone(vote.created_at)
+        self.assertIsNotNone(vote.updated_at)
+
+    def test_rollup_counts_votes_per_minute(self):
+        """Votes are counted per choice in the minute they were cast."""
+        self.add_event(VoteEvent.CAST, "a", self.c1)
+        self.add_event(VoteEvent.CAST, "b", self.c1, seconds=50)
+        self.add_event(VoteEvent.CAST, "c", self.c2)
+        self.add_event(VoteEvent.CAST, "d", self.c1, minutes_after=1)
+        rollup()
+        next_minute = self.minute + datetime.timedelta(minutes=1)
+        self.assertEqual(self.counts(), {(self.c1.id, self.minute): 2,
+                                         (self.c2.id, self.minute): 1,
+                                         (self.c1.id, next_minute): 1})
+
+    def test_changes_and_clears_are_deltas(self):
+        """A change moves a vote between choices and a clear removes it."""
+        self.add_event(VoteEvent.CAST, "a", self.c1)
+        self.add_event(VoteEvent.CAST, "b", self.c1)
+        # rolled up before the changes, they are found across windows
+        rollup(lag=4)
+        self.add_event(VoteEvent.CHANGE, "a", self.c2, minutes_after=3)
+        self.add_event(VoteEvent.CLEAR, "b", minutes_after=3)
+        self.add_event(VoteEvent.CAST, "b", self.c1, minutes_after=3,
+                       seconds=20)
+        rollup()
+        later = self.minute + datetime.timedelta(minutes=3)
+        self.assertEqual(self.counts(), {(self.c1.id, self.minute): 2,
+                                         (self.c1.id, later): -1,
+                                         (self.c2.id, later): 1})
+
+    def test_rollup_only_scans_new_events(self):
+        """Running the rollup again only adds events after the watermark."""
+        self.add_event(VoteEvent.CAST, "a", self.c1)
+        rollup()
+        watermark = RollupWatermark.objects.get()
+        # an event behind the watermark is not scanned again
+        self.add_event(VoteEvent.CAST, "b", self.c1)
+        rollup()
+        self.assertEqual(VoteRollup.objects.get().votes, 1)
+        self.assertGreaterEqual(RollupWatermark.objects.get().position,
+                                watermark.position)
+
+    def test_timeline_reads_rollups(self):
+        """The timeline returns the changes and running totals as JSON."""
+        self.add_event(VoteEvent.CAST, "a", self.c1)
+        self.add_event(VoteEvent.CAST, "b", self.c1)
+        self.add_event(VoteEvent.CHANGE, "a", self.c2, minutes_after=1)
+        rollup()
+        url = reverse("polls:timeline", args=(self.question.id,))
+        data = self.client.get(url).json()
+        next_minute = self.minute + datetime.timedelta(minutes=1)
+        self.assertEqual(data["series"], [
+            {"minute": self.minute.isoformat(), "choice": self.c1.id,
+             "votes": 2, "total": 2},
+            {"minute": next_minute.isoformat(), "choice": self.c1.id,
+             "votes": -1, "total": 1},
+            {"minute": next_minute.isoformat(), "choice": self.c2.id,
+             "votes": 1, "total": 1}])
+        self.assertEqual(data["choices"][str(self.c2.id)], "no")
+        data = self.client.get(url, {"since": next_minute.isoformat()}).json()
+        self.assertEqual([entry["total"] for entry in data["series"]],
+                         [1, 1])
+
+    def test_timeline_of_unpublished_question(self):
+        """Unpublished questions have no timeline."""
+        question = create_question("Not yet?", 5)
+        response = self.client.get(reverse("polls:timeline",
+                                           args=(question.id,)))
+        self.assertEqual(response.status_code, 404)
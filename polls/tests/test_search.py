@@ -0,0 +1,58 @@
+"""Test cases for searching polls"""
+from .functions import create_question, create_choice
+from django.test import TestCase
+from django.urls import reverse
+from polls.search import search_questions
+
+
+class SearchTestCase(TestCase):
+    """Test cases for the full-text search of questions and choices"""
+    def test_search_question_text(self):
+        """Questions are found by the words of their text."""
+        question = create_question("Which programming language is best?", -1)
+        create_question("What is your favorite food?", -1)
+        questions, has_next = search_questions("programming languages")
+        self.assertEqual(questions, [question])
+        self.assertFalse(has_next)
+
+    def test_search_choice_text(self):
+        """Questions are found by the text of their choices."""
+        question = create_question("Best snack?", -1)
+        choice = create_choice("Durian chips", question)
+        self.assertEqual(search_questions("durian")[0], [question])
+        choice.choice_text = "Mango sticky rice"
+        choice.save()
+        self.assertEqual(search_questions("durian")[0], [])
+        choice.delete()
+        self.assertEqual(search_questions("mango")[0], [])
+
+    def test_question_matches_rank_first(self):
+        """Matches in the question text rank above matches in choices."""
+        by_choice = create_question("Best pet?", -2)
+        create_choice("cats", by_choice)
+        by_question = create_question("Do you like cats?", -1)
+        self.assertEqual(search_questions("cats")[0],
+                         [by_question, by_choice])
+
+    def test_unpublished_questions_are_not_found(self):
+        """Questions that are not published are never found."""
+        create_question("Secret future poll?", 5)
+        self.assertEqual(search_questions("secret")[0], [])
+
+    def test_search_pages(self):
+        """Results are split into pages."""
+        for n in range(3):
+            create_question(f"Pagination poll {n}?", -1)
+        questions, has_next = search_questions("pagination", 1, 2)
+        self.assertEqual(len(questions), 2)
+        self.assertTrue(has_next)
+        questions, has_next = search_questions("pagination", 2, 2)
+        self.assertEqual(len(questions), 1)
+        self.assertFalse(has_next)
+
+    def test_search_view(self):
+        """The search page lists the matching questions."""
+        create_question('Is "quoted" AND text searchable?', -1)
+        response = self.client.get(reverse("polls:search"),
+                                   {"q": 'quoted AND "text'})
+        self.assertContains(response, "searchable?")
@@ -0,0 +1,119 @@
+"""Test cases for participation sketches"""
+import datetime
+from unittest import mock
+from .functions import create_question, create_choice, create_user, vote
+from django.db import DatabaseError
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from polls import sketches
+from polls.models import IPVoteWindow, QuestionSketch
+from polls.sketches import CountMinSketch, HyperLogLog
+
+
+class SketchTestCase(TestCase):
+    """Test cases for the HyperLogLog and Count-Min sketches"""
+    def test_hyperloglog_estimate(self):
+        """HyperLogLog estimates distinct values within a few percent."""
+        counter = HyperLogLog()
+        for n in range(20000):
+            counter.add(n % 10000)
+        self.assertAlmostEqual(counter.count(), 10000, delta=500)
+        self.assertEqual(HyperLogLog().count(), 0)
+
+    def test_hyperloglog_merge_and_bytes(self):
+        """Merged counters count the union of their values."""
+        first, second = HyperLogLog(), HyperLogLog()
+        for n in range(100):
+            first.add(n)
+            second.add(n + 50)
+        stored = HyperLogLog.from_bytes(first.to_bytes())
+        stored.merge(second)
+        self.assertAlmostEqual(stored.count(), 150, delta=5)
+
+    def test_count_min_sketch(self):
+        """Count-Min estimates never undercount and merge by adding."""
+        sketch = CountMinSketch()
+        for n in range(1000):
+            sketch.add(f"10.0.0.{n % 10}")
+        stored = CountMinSketch.from_bytes(sketch.to_bytes())
+        stored.merge(sketch)
+        self.assertGreaterEqual(stored.estimate("10.0.0.1"), 200)
+        self.assertLess(stored.estimate("10.0.0.1"), 210)
+        self.assertEqual(stored.total(), 2000)
+
+
+@override_settings(SKETCH_FLUSH_INTERVAL=0, SKETCH_SUSPICIOUS_VOTES=2)
+class VoteSketchTestCase(TestCase):
+    """Test cases for updating sketches when voting"""
+    def setUp(self):
+        sketches.buffer = sketches.SketchBuffer()
+        self.question = create_question("Is this a sketchy poll?", -1)
+        self.choice = create_choice("yes", self.question)
+
+    def test_vote_updates_sketches(self):
+        """Votes update the unique voter and IP counts of the question."""
+        for n in range(3):
+            self.client.force_login(create_user(f"user{n}"))
+            vote(self.choice, self.client)
+        sketch = QuestionSketch.objects.get(question=self.question)
+        self.assertEqual(sketch.voter_count, 3)
+        self.assertEqual(sketch.ip_count, 1)
+        response = self.client.get(reverse("polls:index"))
+        self.assertContains(response, "About 3 participants from 1 IPs")
+
+    def test_suspicious_ip(self):
+        """An IP voting for many accounts is recorded as a suspect."""
+        for n in range(3):
+            self.client.force_login(create_user(f"user{n}"))
+            vote(self.choice, self.client)
+        window = IPVoteWindow.objects.get()
+        self.assertEqual(window.votes, 3)
+        self.assertEqual(window.suspects, {"127.0.0.1": 3})
+
+    def test_failed_flush_keeps_vote(self):
+        """Sketches that cannot be written do not fail the vote."""
+        self.client.force_login(create_user("user0"))
+        with mock.patch("polls.sketches.merge_ip_window",
+                        side_effect=DatabaseError):
+            response = vote(self.choice, self.client)
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(QuestionSketch.objects.exists())
+        self.client.force_login(create_user("user1"))
+        vote(self.choice, self.client)
+        sketch = QuestionSketch.objects.get(question=self.question)
+        self.assertEqual(sketch.voter_count, 2)
+        self.assertEqual(IPVoteWindow.objects.get().votes, 2)
+
+    def test_window_is_an_hour(self):
+        """Only the buckets of the last hour count and older ones go."""
+        now = timezone.now()
+        for minutes in (10, 50, 60, 70):
+            old = CountMinSketch()
+            old.add("10.0.0.1")
+            IPVoteWindow.objects.create(
+                start=sketches.window_start(
+                    now - datetime.timedelta(minutes=minutes)),
+                sketch=old.to_bytes())
+        ips = CountMinSketch()
+        ips.add("10.0.0.1")
+        sketches.merge_ip_window(now, ips, {"10.0.0.1"})
+        self.assertEqual(IPVoteWindow.objects.count(), 3)
+        current = IPVoteWindow.objects.get(start=sketches.window_start(now))
+        self.assertEqual(current.suspects, {"10.0.0.1": 3})
+
+    def test_flush_queries_do_not_grow(self):
+        """Merging the sketches of many questions takes a few queries."""
+        questions = [self.question] + [create_question(f"Poll {n}?", -1)
+                                       for n in range(20)]
+        counts = []
+        for size in (1, len(questions)):
+            merged = {question.pk: (HyperLogLog(), HyperLogLog())
+                      for question in questions[:size]}
+            with CaptureQueriesContext(connection) as queries:
+                sketches.merge_question_sketches(merged)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+        self.assertEqual(QuestionSketch.objects.count(), len(questions))
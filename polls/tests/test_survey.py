@@ -0,0 +1,79 @@
+"""Test cases for submitting surveys"""
+from unittest import mock
+from .functions import (create_question, create_choice, create_user,
+                        create_questions, create_choices)
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from polls import sketches
+from polls.models import Question, Survey, Vote
+
+
+class SurveyTestCase(TestCase):
+    """Test cases for answering all questions of a survey at once"""
+    def setUp(self):
+        self.survey = Survey.objects.create(title="Campus survey")
+        self.questions = create_questions(
+            [f"Question {n}?" for n in range(20)], -1)
+        Question.objects.filter(pk__in=[q.pk for q in self.questions]).update(
+            survey=self.survey)
+        self.choices = create_choices(["yes", "no"], self.questions)
+        self.user = create_user()
+        self.client.force_login(self.user)
+        self.url = reverse("polls:submit_survey", args=(self.survey.id,))
+
+    def answers(self, index):
+        """Build the form data answering every question with a choice."""
+        return {f"question_{question.id}": choices[index].id
+                for question, choices in zip(self.questions, self.choices)}
+
+    def test_submit_all_answers(self):
+        """A survey submission creates one vote per answered question."""
+        response = self.client.post(self.url, self.answers(0))
+        self.assertRedirects(response, reverse("polls:survey",
+                                               args=(self.survey.id,)))
+        self.assertEqual(Vote.objects.filter(user=self.user).count(), 20)
+        self.assertTrue(all(choices[0].vote_set.count() == 1
+                            for choices in self.choices))
+
+    def test_resubmit_replaces_answers(self):
+        """Submitting a survey again changes the previous votes."""
+        self.client.post(self.url, self.answers(0))
+        self.client.post(self.url, self.answers(1))
+        self.assertEqual(Vote.objects.count(), 20)
+        self.assertTrue(all(choices[1].vote_set.count() == 1
+                            for choices in self.choices))
+
+    def test_submit_uses_few_queries(self):
+        """The number of queries does not grow with the question count."""
+        # sketches are written by a background thread outside of tests,
+        # test_sketches checks their queries
+        with CaptureQueriesContext(connection) as queries, \
+                mock.patch.object(sketches.buffer, "flush"):
+            self.client.post(self.url, self.answers(0))
+        self.assertLessEqual(len(queries), 10)
+
+    def test_invalid_choice_rejects_survey(self):
+        """A choice of another question rejects the whole submission."""
+        answers = self.answers(0)
+        answers[f"question_{self.questions[0].id}"] = self.choices[1][0].id
+        self.client.post(self.url, answers)
+        self.assertFalse(Vote.objects.exists())
+
+    def test_closed_question_rejects_survey(self):
+        """Closed questions can not be answered."""
+        closed = create_question("Closed?", -5, -1)
+        closed.survey = self.survey
+        closed.save()
+        choice = create_choice("yes", closed)
+        self.client.post(self.url, {f"question_{closed.id}": choice.id})
+        self.assertFalse(Vote.objects.exists())
+
+    def test_survey_page_shows_previous_answers(self):
+        """The survey page checks the user's previous answers."""
+        self.client.post(self.url, self.answers(1))
+        response = self.client.get(reverse("polls:survey",
+                                           args=(self.survey.id,)))
+        self.assertContains(response, "Question 19?")
+        self.assertContains(response, " checked", count=20)
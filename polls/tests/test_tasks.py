@@ -0,0 +1,126 @@
+"""Test cases for the background task outbox"""
+import datetime
+import math
+from io import StringIO
+from .functions import create_question, create_choices, create_user, vote
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from polls import tasks
+from polls.models import OutboxTask, trending_weight
+
+
+@tasks.task("test_fail")
+def fail_always(payloads):
+    """A task that never succeeds."""
+    raise RuntimeError("nope")
+
+
+@tasks.task("test_fail_some", batch=False)
+def fail_some(payloads):
+    """A task that fails for the payloads asking for it."""
+    for payload in payloads:
+        if payload["fail"]:
+            raise RuntimeError("nope")
+
+
+@override_settings(TASKS_EAGER=False)
+class OutboxTestCase(TestCase):
+    """Test cases for enqueueing and running tasks"""
+    def setUp(self):
+        self.question = create_question("Cats or dogs?", -1)
+        self.cats, self.dogs = create_choices(["cats", "dogs"],
+                                              [self.question])[0]
+        self.client.force_login(create_user())
+
+    def test_vote_enqueues_side_effects(self):
+        """A vote only writes the vote and a task in the request."""
+        vote(self.cats, self.client)
+        self.question.refresh_from_db()
+        self.assertEqual(self.question.results_version, 0)
+        task = OutboxTask.objects.get()
+        self.assertEqual(task.name, "record_votes")
+        tasks.drain(10, once=True)
+        self.assertFalse(OutboxTask.objects.exists())
+        self.question.refresh_from_db()
+        self.assertEqual(self.question.results_version, 1)
+
+    def test_batch_is_merged(self):
+        """Votes in one batch update a question once with summed weights."""
+        when = timezone.now()
+        for _ in range(2):
+            tasks.enqueue("record_votes", question_ids=[self.question.id],
+                          when=when.isoformat())
+        metrics = tasks.drain(10, once=True)
+        self.assertEqual(metrics.done, {"record_votes": 2})
+        self.question.refresh_from_db()
+        self.assertEqual(self.question.results_version, 1)
+        self.assertAlmostEqual(self.question.trending_score,
+                               trending_weight(when) + math.log(2))
+
+    def test_lease_is_exclusive(self):
+        """A leased task is not leased again until its lease expires."""
+        tasks.enqueue("bump_results_version", question_id=self.question.id)
+        self.assertEqual(len(tasks.lease_tasks(10, 60)), 1)
+        self.assertEqual(tasks.lease_tasks(10, 60), [])
+        OutboxTask.objects.update(
+            leased_until=timezone.now() - datetime.timedelta(seconds=1))
+        self.assertEqual(len(tasks.lease_tasks(10, 60)), 1)
+
+    def test_expired_lease_is_not_run_twice(self):
+        """A task leased again by another worker is only counted once."""
+        tasks.enqueue("record_votes", question_ids=[self.question.id],
+                      when=timezone.now().isoformat())
+        stale = tasks.lease_tasks(10, 60)
+        OutboxTask.objects.update(
+            leased_until=timezone.now() - datetime.timedelta(seconds=1))
+        tasks.run_batch(tasks.lease_tasks(10, 60), tasks.Metrics())
+        metrics = tasks.Metrics()
+        tasks.run_batch(stale, metrics)
+        self.assertEqual(metrics.done, {})
+        self.question.refresh_from_db()
+        self.assertEqual(self.question.results_version, 1)
+
+    @override_settings(TASK_MAX_ATTEMPTS=2)
+    def test_failed_tasks_are_retried(self):
+        """Failing tasks are retried later and given up on eventually."""
+        tasks.enqueue("test_fail")
+        metrics = tasks.drain(10, once=True)
+        self.assertEqual(metrics.failed, {"test_fail": 1})
+        task = OutboxTask.objects.get()
+        self.assertEqual(task.attempts, 1)
+        self.assertIsNone(task.failed_at)
+        self.assertGreater(task.run_after, timezone.now())
+        self.assertIn("nope", task.last_error)
+        OutboxTask.objects.update(run_after=timezone.now())
+        tasks.drain(10, once=True)
+        task.refresh_from_db()
+        self.assertEqual(task.attempts, 2)
+        self.assertIsNotNone(task.failed_at)
+        self.assertEqual(tasks.lease_tasks(10, 60), [])
+
+    def test_unbatched_tasks_fail_alone(self):
+        """A failing unbatched task does not fail the others."""
+        tasks.enqueue("test_fail_some", fail=True)
+        tasks.enqueue("test_fail_some", fail=False)
+        metrics = tasks.drain(10, once=True)
+        self.assertEqual(metrics.done, {"test_fail_some": 1})
+        self.assertEqual(metrics.failed, {"test_fail_some": 1})
+        self.assertEqual(OutboxTask.objects.get().payload, {"fail": True})
+
+
+@override_settings(TASKS_EAGER=False)
+class RunWorkersTestCase(TransactionTestCase):
+    """Test cases for the run_workers command"""
+    def test_workers_drain_outbox(self):
+        """The workers run every task and report their metrics."""
+        question = create_question("Cats or dogs?", -1)
+        for _ in range(30):
+            tasks.enqueue("bump_results_version", question_id=question.id)
+        out = StringIO()
+        call_command("run_workers", workers=1, batch_size=5, once=True,
+                     stdout=out)
+        self.assertFalse(OutboxTask.objects.exists())
+        self.assertIn("Ran 30 tasks", out.getvalue())
+        self.assertIn("bump_results_version: 30 done, 0 failed",
+                      out.getvalue())
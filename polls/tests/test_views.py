@@ -1,7 +1,13 @@
 """Test cases for poll views"""
-from .functions import create_question
+import datetime
+from .functions import (create_question, create_choice, create_user,
+                        create_questions, create_votes)
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
+from polls.models import Question, Vote
 
 
 class QuestionIndexViewTests(TestCase):
@@ -96,3 +102,89 @@ class QuestionDetailViewTest(TestCase):
         response = self.client.get(url)
         self.assertEqual(response.status_code, 302)
         self.assertRedirects(response, reverse("polls:index"))
+
+
+class TrendingViewTests(TestCase):
+    """Tests for the Trending View"""
+    def test_trending_order(self):
+        """
+        Questions with more recent votes are listed first, unpublished
+        questions and questions without votes are not listed.
+        """
+        q1 = create_question("Is this poll popular?", -3)
+        q2 = create_question("Is this poll more popular?", -2)
+        q3 = create_question("Is this poll the newest?", -1)
+        future = create_question("Is this poll published?", 3)
+        Question.record_votes([q2.id, future.id])
+        Question.record_votes([q2.id, q1.id])
+        response = self.client.get(reverse("polls:trending"))
+        self.assertQuerySetEqual(response.context["latest_question_list"],
+                                 [q2, q1])
+
+    def test_recent_votes_outweigh_old_votes(self):
+        """
+        A vote cast now is worth more than several votes cast days ago.
+        """
+        old = create_question("Was this poll popular?", -10)
+        new = create_question("Is this poll popular now?", -1)
+        week_ago = timezone.now() - datetime.timedelta(days=7)
+        for _ in range(10):
+            Question.record_votes([old.id], when=week_ago)
+        Question.record_votes([new.id])
+        response = self.client.get(reverse("polls:trending"))
+        self.assertEqual(response.context["latest_question_list"][0], new)
+
+
+    def test_old_votes_stop_trending(self):
+        """A poll without votes in the trending window is not listed."""
+        old = create_question("Was this poll popular?", -30)
+        month_ago = timezone.now() - datetime.timedelta(days=30)
+        for _ in range(100):
+            Question.record_votes([old.id], when=month_ago)
+        response = self.client.get(reverse("polls:trending"))
+        self.assertNotIn(old, response.context["latest_question_list"])
+        Question.record_votes([old.id])
+        response = self.client.get(reverse("polls:trending"))
+        self.assertIn(old, response.context["latest_question_list"])
+
+
+class UserVotesViewTests(TestCase):
+    """Tests for showing the user's votes"""
+    def setUp(self):
+        self.user = create_user()
+        self.questions = create_questions(
+            [f"Question {n}?" for n in range(5)], -1)
+        choices = [create_choice(f"Answer to {question}", question)
+                   for question in self.questions[:3]]
+        create_votes(choices, [self.user] * 3)
+        self.client.force_login(self.user)
+
+    def test_index_voted_badges(self):
+        """
+        The index page shows the user's choice on the polls they voted on
+        without a query per poll.
+        """
+        self.client.get(reverse("polls:index"))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("polls:index"))
+        for question in self.questions:
+            create_question(f"Another {question}", -1)
+        with self.assertNumQueries(len(queries)):
+            self.client.get(reverse("polls:index"))
+        self.assertContains(response, "You voted: Answer to Question 0?")
+        self.assertContains(response, "You voted:", count=3)
+
+    def test_my_votes_page(self):
+        """The my votes page lists only the user's votes."""
+        other = create_user("other")
+        Vote.objects.create(choice=create_choice("no", self.questions[4]),
+                            user=other)
+        response = self.client.get(reverse("polls:my_votes"))
+        self.assertEqual(len(response.context["votes"]), 3)
+        self.assertContains(response, "Answer to Question 2?")
+
+    def test_my_votes_requires_login(self):
+        """Anonymous visitors are redirected to the login page."""
+        self.client.logout()
+        response = self.client.get(reverse("polls:my_votes"))
+        self.assertEqual(response.status_code, 302)
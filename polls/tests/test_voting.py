@@ -1,7 +1,10 @@
 """Test cases for voting"""
 from .functions import create_question, create_choice, create_user, vote
 from polls.models import Vote
-from django.test import TestCase
+from io import StringIO
+from django.core.management import call_command
+from polls.management.commands.stress_votes import check_invariants
+from django.test import TestCase, TransactionTestCase
 
 
 class VoteTestCase(TestCase):
@@ -84,3 +87,69 @@ class VoteTestCase(TestCase):
         self.assertEqual(c2.vote_set.count(), 1)
         self.assertEqual(c3.vote_set.count(), 0)
         self.assertEqual(c4.vote_set.count(), 1)
+
+    def test_cast_keeps_one_vote(self):
+        """
+        Casting a vote again changes the existing vote instead of adding
+        a second vote.
+        """
+        question = create_question("Do you hate roaches?", -1)
+        c1 = create_choice("yes", question)
+        c2 = create_choice("no", question)
+        user = create_user("John McGregor", "Roaches123")
+        Vote.cast(user, c1)
+        Vote.cast(user, c2)
+        self.assertEqual(Vote.objects.filter(user=user).count(), 1)
+        self.assertEqual(c2.vote_set.count(), 1)
+
+
+class ConcurrentVoteTestCase(TransactionTestCase):
+    """Test cases for concurrent votes of the same users"""
+    def test_stress_votes_keeps_invariants(self):
+        """
+        Parallel vote, change and clear requests never leave a user with
+        more than 1 vote per question.
+        """
+        out = StringIO()
+        call_command("stress_votes", workers=4, requests=10, users=2,
+                     questions=1, seed=1, stdout=out)
+        self.assertIn("Invariants hold", out.getvalue())
+        # the test settings take the SQLite write lock up front
+        self.assertNotIn("database is locked", out.getvalue())
+        self.assertFalse(Vote.objects.exists())
+
+
+class StressInvariantTestCase(TestCase):
+    """Test cases for checking the votes against the stress test requests"""
+    def setUp(self):
+        self.question = create_question("Tea or coffee?", -1)
+        self.tea = create_choice("tea", self.question)
+        self.coffee = create_choice("coffee", self.question)
+        self.user = create_user("racer")
+
+    def result(self, action, choice=None, outcome="ok"):
+        """Return a worker result of the user on the question."""
+        return (action, outcome, 0.01, self.user.pk, self.question.pk,
+                choice.pk if choice else None)
+
+    def test_vote_matches_requests(self):
+        """A vote cast by a successful request is no problem."""
+        Vote.objects.create(user=self.user, choice=self.tea)
+        results = [self.result("vote", self.coffee), self.result("clear"),
+                   self.result("vote", self.tea)]
+        self.assertEqual(check_invariants([self.question], results), [])
+
+    def test_vote_without_request(self):
+        """A vote no successful request cast is reported."""
+        Vote.objects.create(user=self.user, choice=self.tea)
+        results = [self.result("vote", self.tea, outcome="status 500"),
+                   self.result("vote", self.coffee)]
+        self.assertEqual(len(check_invariants([self.question], results)), 1)
+
+    def test_lost_vote(self):
+        """A vote that was never cleared must still be stored."""
+        self.assertEqual(len(check_invariants(
+            [self.question], [self.result("vote", self.tea)])), 1)
+        self.assertEqual(check_invariants(
+            [self.question], [self.result("vote", self.tea),
+                              self.result("clear")]), [])
@@ -0,0 +1,74 @@
+"""Test cases for the warm-up and the health check endpoints"""
+from unittest import mock
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from polls import warmup
+
+
+class WarmUpTestCase(TestCase):
+    """Test cases for warming up a server process"""
+    def setUp(self):
+        warmup.ready.clear()
+        warmup.timings.clear()
+
+    def tearDown(self):
+        warmup.ready.clear()
+        warmup.timings.clear()
+
+    def test_healthz(self):
+        """The process is alive before it is warmed up."""
+        response = self.client.get(reverse("healthz"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b"ok")
+
+    def test_readyz(self):
+        """The process is only ready once it warmed up."""
+        response = self.client.get(reverse("readyz"))
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(response.json()["ready"])
+        warmup.warm_up()
+        response = self.client.get(reverse("readyz"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.json()["timings"]),
+                         {"load_urls", "compile_templates",
+                          "open_connections", "warm_up"})
+        self.assertIn("no-cache", response["Cache-Control"])
+
+    def test_steps(self):
+        """The steps load the URLs, templates and database connections."""
+        self.assertGreater(warmup.load_urls(), 20)
+        self.assertGreater(warmup.compile_templates(), 10)
+        self.assertEqual(warmup.open_connections(), 1)
+
+    @override_settings(WARM_UP=False)
+    def test_without_warm_up(self):
+        """Without warm-up the process is ready right away."""
+        warmup.start()
+        self.assertTrue(warmup.ready.is_set())
+
+    def test_time_first_byte(self):
+        """Only the first response is timed."""
+        calls = []
+
+        def application(environ, start_response):
+            start_response("200 OK", [])
+            return [b""]
+
+        timed = warmup.time_first_byte(application, 0)
+        timed({"PATH_INFO": "/healthz"}, lambda *args: calls.append(args))
+        self.assertNotIn("first_byte", warmup.timings)
+        timed({}, lambda *args: calls.append(args))
+        first_byte = warmup.timings["first_byte"]
+        timed({}, lambda *args: calls.append(args))
+        self.assertEqual(warmup.timings["first_byte"], first_byte)
+        self.assertEqual(len(calls), 3)
+
+    def test_retry_warm_up(self):
+        """A failed warm-up is retried with a growing delay."""
+        with mock.patch("polls.warmup.warm_up",
+                        side_effect=[OSError, OSError, OSError, None]) as step, \
+                mock.patch("polls.warmup.time.sleep") as sleep:
+            warmup.retry_warm_up(delay=1, max_delay=3)
+        self.assertEqual(step.call_count, 4)
+        self.assertEqual([call.args[0] for call in sleep.call_args_list],
+                         [1, 2, 3])
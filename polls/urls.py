@@ -6,8 +6,22 @@ from . import views
 app_name = "polls"
 urlpatterns = [
     path("", views.IndexView.as_view(), name="index"),
+    path("trending/", views.TrendingView.as_view(), name="trending"),
+    path("closing-soon/", views.ClosingSoonView.as_view(),
+         name="closing_soon"),
+    path("upcoming/", views.UpcomingView.as_view(), name="upcoming"),
+    path("search/", views.search, name="search"),
+    path("my-votes/", views.MyVotesView.as_view(), name="my_votes"),
+    path("analytics/", views.analytics, name="analytics"),
+    path("import/", views.bulk_import, name="import_polls"),
     path("<int:pk>/", views.DetailView.as_view(), name="detail"),
     path("<int:pk>/results/", views.ResultsView.as_view(), name="results"),
+    path("<int:pk>/results/chart.svg", views.results_chart,
+         name="results_chart"),
+    path("<int:pk>/results/timeline/", views.timeline, name="timeline"),
     path("<int:question_id>/vote/", views.vote, name="vote"),
-    path("<int:question_id>/clear/", views.clear, name="clear")
+    path("<int:question_id>/clear/", views.clear, name="clear"),
+    path("survey/<int:pk>/", views.SurveyView.as_view(), name="survey"),
+    path("survey/<int:survey_id>/submit/", views.submit_survey,
+         name="submit_survey"),
 ]
@@ -1,24 +1,61 @@
 """Module for all view classes for pages in the poll app."""
+import datetime
 import logging
 
 from django.contrib.auth import (user_logged_in, user_logged_out,
                                  user_login_failed)
-from django.contrib.auth import login, authenticate
+from django.contrib.auth import login
 from django.contrib.auth.forms import UserCreationForm
 from django.dispatch import receiver
 from django.urls import reverse
 from django.contrib import messages
-from django.http import HttpResponseRedirect
+from django.db import transaction
+from django.db.models import OuterRef, Subquery, Sum
+from django.conf import settings
+from django.http import (HttpResponse, HttpResponseBadRequest,
+                         HttpResponseRedirect, JsonResponse)
 from django.shortcuts import render, get_object_or_404, redirect
 from django.views import generic
+from django.views.decorators.cache import never_cache
 from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.dateparse import parse_datetime
 from django.contrib.auth.decorators import login_required
-from .models import Choice, Question, Vote
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.contrib.admin.views.decorators import staff_member_required
+from . import charts, history, sketches, tasks, warmup
+from .analytics import crosstabs
+from .idempotency import idempotent
+from .importer import (FORMATS, PollDefinitionError, guess_format,
+                       import_polls, parse_definitions)
+from .models import (Choice, Question, Survey, Vote, VoteEvent, VoteRollup,
+                     TRENDING_WINDOW, trending_weight)
+from .search import search_questions
+from .tally import tally
 
 # get a logger instance for the polls app
 logger = logging.getLogger(__name__)
 
 
+def with_user_votes(questions, user):
+    """
+    Annotate questions with the text of the choice the user voted for.
+
+    The choice is fetched by a subquery, so listing questions with the
+    user's votes takes no extra queries.
+
+    :param questions: A queryset of questions
+    :param user: The user viewing the questions
+    :return: The queryset with a 'user_choice' attribute on each question,
+    None for questions the user has not voted on.
+    """
+    if not user.is_authenticated:
+        return questions
+    return questions.annotate(user_choice=Subquery(
+        Vote.objects.filter(user=user, question=OuterRef('pk'))
+        .values('choice__choice_text')[:1]))
+
+
 class IndexView(generic.ListView):
     """
     View that displays all active poll questions.
@@ -31,8 +68,103 @@ class IndexView(generic.ListView):
 
     def get_queryset(self):
         """Return all published questions."""
+        return with_user_votes(Question.objects.filter(
+            pub_date__lte=timezone.now()).select_related(
+            "sketch").order_by("-pub_date"), self.request.user)
+
+
+class TrendingView(IndexView):
+    """
+    View that displays the polls with the most recent voting activity.
+
+    returns: A rendered template of the top trending poll questions.
+    """
+
+    trending_limit = 10
+
+    def get_queryset(self):
+        """
+        Return the published questions with the highest trending score.
+
+        Scores never decrease, so polls whose votes have decayed below the
+        weight of one vote cast TRENDING_WINDOW ago are left out.
+        """
+        now = timezone.now()
+        return with_user_votes(Question.objects.filter(
+            pub_date__lte=now,
+            trending_score__gte=trending_weight(now - TRENDING_WINDOW),
+        ).select_related("sketch").order_by(
+            "-trending_score", "-pub_date"),
+            self.request.user)[:self.trending_limit]
+
+    def get_context_data(self, **kwargs):
+        """Add a title for the trending list."""
+        context = super().get_context_data(**kwargs)
+        context['trending'] = True
+        return context
+
+
+class ClosingSoonView(IndexView):
+    """
+    View that displays the open polls that close soonest.
+
+    returns: A rendered template of the polls closing within a day.
+    """
+
+    closing_window = datetime.timedelta(days=1)
+
+    def get_queryset(self):
+        """Return the open questions by end date, read from its index."""
+        now = timezone.now()
+        return with_user_votes(Question.objects.filter(
+            status=Question.OPEN, end_date__gte=now,
+            end_date__lte=now + self.closing_window).select_related(
+            "sketch").order_by("end_date"), self.request.user)
+
+    def get_context_data(self, **kwargs):
+        """Add a title for the closing soon list."""
+        context = super().get_context_data(**kwargs)
+        context['listing'] = "Closing soon"
+        return context
+
+
+class UpcomingView(IndexView):
+    """
+    View that displays the polls that open next.
+
+    returns: A rendered template of the next scheduled poll questions.
+    """
+
+    upcoming_limit = 10
+
+    def get_queryset(self):
+        """Return the scheduled questions by pub date, read from its index."""
         return Question.objects.filter(
-            pub_date__lte=timezone.now()).order_by("-pub_date")
+            status=Question.SCHEDULED, pub_date__gt=timezone.now()).order_by(
+            "pub_date")[:self.upcoming_limit]
+
+    def get_context_data(self, **kwargs):
+        """Add a title for the upcoming list."""
+        context = super().get_context_data(**kwargs)
+        context['listing'] = "Upcoming polls"
+        return context
+
+
+class MyVotesView(LoginRequiredMixin, generic.ListView):
+    """
+    View that displays the polls the user has voted on.
+
+    returns: A rendered template of the user's votes, latest first.
+    """
+
+    template_name = "polls/my_votes.html"
+    context_object_name = "votes"
+    paginate_by = 20
+
+    def get_queryset(self):
+        """Return the user's votes with their question and choice."""
+        return Vote.objects.filter(user=self.request.user).select_related(
+            'question', 'choice').order_by('-updated_at')
 
 
 class DetailView(generic.DetailView):
@@ -69,11 +201,18 @@ class DetailView(generic.DetailView):
                     user=self.request.user,
                     choice__question=self.question)
                 context['prev_vote'] = vote.choice.id
-                return context
+                prev_ranking = vote.ranking
             # user has not voted yet for this question
             except Vote.DoesNotExist:
                 context['prev_vote'] = None
-                return context
+                prev_ranking = []
+        else:
+            prev_ranking = []
+        if self.question.is_ranked():
+            ranks = {pk: rank for rank, pk in enumerate(prev_ranking, 1)}
+            context['ranked_choices'] = [
+                (choice, ranks.get(choice.id, ''))
+                for choice in self.object.choice_set.all()]
         return context
 
     def get(self, request, *args, **kwargs):
@@ -137,7 +276,207 @@ class ResultsView(generic.DetailView):
             return HttpResponseRedirect(reverse("polls:index"))
         return super().get(request, *args, **kwargs)
 
+    def get_context_data(self, **kwargs):
+        """
+        Get the context data of the results page.
+
+        For ranked choice polls add the round by round instant runoff
+        breakdown and the Borda scores.
+        """
+        context = super().get_context_data(**kwargs)
+        if self.object.is_ranked():
+            result = tally(self.object)
+            rows = []
+            for i, text in enumerate(result['choices']):
+                # eliminated choices have no count in the later rounds
+                counts = []
+                eliminated = False
+                for runoff_round in result['rounds']:
+                    counts.append(None if eliminated
+                                  else runoff_round['counts'][i])
+                    eliminated |= runoff_round['eliminated'] == i
+                rows.append((text, counts, result['borda'][i]))
+            context['runoff_rounds'] = range(1, len(result['rounds']) + 1)
+            context['runoff_rows'] = rows
+            if result['winner'] is not None:
+                context['runoff_winner'] = result['choices'][result['winner']]
+        return context
+
 
+def search(request):
+    """
+    Display the published polls matching a search, best match first.
+
+    The search words are given in the 'q' query parameter and the page
+    of results in 'page'.
+    """
+    text = request.GET.get('q', '')
+    try:
+        page = max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        page = 1
+    questions, has_next = search_questions(text, page)
+    return render(request, 'polls/search.html',
+                  {'query': text, 'questions': questions, 'page': page,
+                   'has_next': has_next})
+
+
+def timeline(request, pk):
+    """
+    Return the votes per choice per minute of a poll as JSON.
+
+    The series is read only from the vote rollups maintained by the
+    rollup_votes command, so it never scans the Vote table. Each entry
+    holds the net change of a choice's 'votes' in that minute and its
+    running 'total' after it.
+    An optional 'since' query parameter (ISO 8601) limits the series, the
+    totals still include the votes before it.
+    """
+    question = get_object_or_404(Question, pk=pk,
+                                 pub_date__lte=timezone.now())
+    rollups = VoteRollup.objects.filter(question=question)
+    totals = {}
+    since = request.GET.get('since')
+    if since:
+        since_date = parse_datetime(since)
+        if since_date is None:
+            return JsonResponse({"error": "Invalid 'since' date"},
+                                status=400)
+        totals = dict(rollups.filter(minute__lt=since_date)
+                      .values('choice_id').annotate(total=Sum('votes'))
+                      .values_list('choice_id', 'total'))
+        rollups = rollups.filter(minute__gte=since_date)
+    choices = dict(question.choice_set.values_list('id', 'choice_text'))
+    series = []
+    for minute, choice_id, votes in rollups.order_by(
+            'minute', 'choice_id').values_list('minute', 'choice_id',
+                                               'votes'):
+        totals[choice_id] = totals.get(choice_id, 0) + votes
+        series.append({"minute": minute.isoformat(), "choice": choice_id,
+                       "votes": votes, "total": totals[choice_id]})
+    return JsonResponse({"question": question.id,
+                         "question_text": question.question_text,
+                         "choices": choices,
+                         "series": series})
+
+
+def results_chart(request, pk):
+    """
+    Return an SVG bar or pie chart of the results of a poll.
+
+    The chart type is given by the 'type' query parameter, 'bar' by default.
+    The strong ETag changes with the results version of the poll, so
+    clients revalidate open polls with a 304 and no vote is counted again.
+    Closed polls no longer change and may be cached for
+    CHART_CLOSED_MAX_AGE seconds.
+    """
+    kind = request.GET.get('type', 'bar')
+    if kind not in charts.KINDS:
+        return HttpResponseBadRequest(f"Unknown chart type: {kind}")
+    question = get_object_or_404(
+        Question.objects.only('question_text', 'end_date', 'results_version'),
+        pk=pk, pub_date__lte=timezone.now())
+    etag = charts.etag(question, kind)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(charts.render_chart(question, kind),
+                                content_type="image/svg+xml")
+    response["ETag"] = etag
+    if question.end_date and question.end_date < timezone.now():
+        patch_cache_control(response, public=True,
+                            max_age=settings.CHART_CLOSED_MAX_AGE)
+    else:
+        patch_cache_control(response, public=True, no_cache=True)
+    return response
+
+
+@staff_member_required
+def analytics(request):
+    """
+    Display the cross-tabulation of the votes of several polls.
+
+    The polls are given as a comma separated list of question ids in the
+    'questions' query parameter. Only staff members can view this page.
+    """
+    raw_ids = request.GET.get('questions', '')
+    try:
+        question_ids = [int(pk) for pk in raw_ids.split(',') if pk.strip()]
+    except ValueError:
+        messages.error(request, "Questions must be a list of poll ids")
+        question_ids = []
+    tables = []
+    for table in crosstabs(question_ids):
+        agreement = table.agreement()
+        tables.append({
+            "table": table,
+            "rows": list(zip(table.rows, table.matrix.tolist())),
+            "association": table.association(),
+            # shown as a percentage like the crosstab_votes command
+            "agreement": None if agreement is None else agreement * 100})
+    return render(request, 'polls/analytics.html',
+                  {'questions': raw_ids, 'tables': tables})
+
+
+def get_selection(request, question):
+    """
+    Get the choice and ranking a user submitted for a question.
+
+    Single choice polls submit a 'choice' id, ranked choice polls submit
+    a 'rank_<choice id>' number for every choice the user ranked.
+
+    :return: A tuple of the selected (first preference) choice and the list
+    of ranked choice ids, the list is empty for single choice polls.
+    :raises KeyError: if no choice was submitted.
+    :raises ValueError: if a rank is not a number.
+    :raises Choice.DoesNotExist: if a choice is not part of the question.
+    """
+    if not question.is_ranked():
+        return question.choice_set.get(pk=request.POST['choice']), []
+    ranks = {int(key[len('rank_'):]): int(value)
+             for key, value in request.POST.items()
+             if key.startswith('rank_') and value}
+    ranking = sorted(ranks, key=ranks.get)
+    if not ranking:
+        raise KeyError('rank')
+    choices = question.choice_set.in_bulk(ranking)
+    if len(choices) != len(ranking):
+        raise Choice.DoesNotExist
+    return choices[ranking[0]], ranking
+
+
+@staff_member_required
+def bulk_import(request):
+    """
+    Handle requests for importing many polls from an uploaded file.
+
+    The file holds JSONL, JSON or YAML poll definitions. With 'dry_run'
+    the definitions are only validated. Only staff members can import.
+    """
+    if request.method == 'POST':
+        upload = request.FILES.get('file')
+        format = request.POST.get('format')
+        try:
+            if upload is None:
+                raise PollDefinitionError("Please choose a file to import")
+            definitions = parse_definitions(
+                upload.read().decode('utf-8'),
+                format or guess_format(upload.name))
+            dry_run = bool(request.POST.get('dry_run'))
+            count = import_polls(definitions, dry_run)
+        except (UnicodeDecodeError, PollDefinitionError) as error:
+            messages.error(request, f"Error: {error}")
+        else:
+            if dry_run:
+                messages.info(request, f"{count} polls are valid")
+            else:
+                messages.success(request, f"Imported {count} polls")
+                logger.info(f"{request.user} imported {count} polls "
+                            f"from {upload.name}")
+        return HttpResponseRedirect(reverse("polls:import_polls"))
+    return render(request, 'polls/import.html', {'formats': FORMATS})
+
+
+@idempotent
 @login_required
 def vote(request, question_id):
     """Handle requests for submitting a vote."""
@@ -149,40 +488,47 @@ def vote(request, question_id):
         return HttpResponseRedirect(
             reverse("polls:index"))
     try:
-        selected_choice = question.choice_set.get(pk=request.POST['choice'])
-    except (KeyError, Choice.DoesNotExist):
+        selected_choice, ranking = get_selection(request, question)
+    except (KeyError, ValueError, Choice.DoesNotExist):
         messages.error(request, "You didn't select a choice!, "
                                 "please select a choice before voting.")
         logger.error(f"{request.user} tried to vote on an invalid choice in "
                      f"question {question_id}.) {question.question_text}")
         return HttpResponseRedirect(
             reverse("polls:detail", args=(question_id,)))
-    try:
-        vote = Vote.objects.get(user=request.user, choice__question=question)
-        prev_choice = vote.choice
-        vote.choice = selected_choice
-        vote.save()
+    with transaction.atomic():
+        # lock the previous vote, not its choice, so a concurrent change
+        # of this vote waits for this one
+        previous = (Vote.objects.select_for_update(of=("self",))
+                    .filter(user=request.user, question=question)
+                    .select_related("choice").first())
+        prev_choice = previous.choice if previous else None
+        Vote.cast(request.user, selected_choice, ranking)
+        tasks.enqueue("record_votes", question_ids=[question.id],
+                      when=timezone.now().isoformat())
+    client_ip = get_client_ip(request)
+    sketches.record_votes([question.id], request.user.id, client_ip)
+    history.record(request.user.id, question.id,
+                   VoteEvent.CHANGE if prev_choice else VoteEvent.CAST,
+                   selected_choice.id, ranking, client_ip)
+    if prev_choice is not None:
         messages.success(request,
                          f"Your vote has changed to '{selected_choice}' "
                          f"from '{prev_choice}'")
         logger.info(f"{request.user} changed their vote from "
                     f"'{prev_choice}' to '{selected_choice}' in "
                     f"question {question_id}.) {question.question_text}")
-        return HttpResponseRedirect(
-            reverse("polls:results", args=(question_id,)))
-    except Vote.DoesNotExist:
-        new_vote = Vote.objects.create(choice=selected_choice,
-                                       user=request.user)
-        new_vote.save()
+    else:
         messages.success(request,
                          f"Your vote for '{selected_choice}' has been "
                          f"recorded")
         logger.info(f"{request.user} voted for '{selected_choice}' in "
                     f"question {question_id}.) {question.question_text}")
-        return HttpResponseRedirect(
-            reverse("polls:results", args=(question_id,)))
+    return HttpResponseRedirect(
+        reverse("polls:results", args=(question_id,)))
 
 
+@idempotent
 @login_required
 def clear(request, question_id):
     """Handle requests for clearing a submitted a vote."""
@@ -193,21 +539,133 @@ def clear(request, question_id):
                      f"Poll: {question_id}.) {question.question_text}")
         return HttpResponseRedirect(
             reverse("polls:index"))
-    try:
-        vote = Vote.objects.get(user=request.user, choice__question=question)
-        vote.delete()
+    # a single delete so concurrent clears cannot both succeed
+    with transaction.atomic():
+        deleted, _ = Vote.objects.filter(user=request.user,
+                                         question=question).delete()
+        if deleted:
+            tasks.enqueue("bump_results_version", question_id=question.id)
+    if deleted:
+        history.record(request.user.id, question.id, VoteEvent.CLEAR,
+                       ip=get_client_ip(request))
         messages.info(request, "Your vote has been successfully removed")
         logger.info(f"{request.user} removed their vote on, "
                     f"Poll: {question_id}.) {question.question_text}")
         return HttpResponseRedirect(
             reverse("polls:detail", args=(question_id,)))
-    except Vote.DoesNotExist:
-        messages.error(request, "You do not have a submitted "
-                       "vote to clear for this question!")
-        logger.error(f"{request.user} tried to clear a non-existant vote in "
-                     f"question {question_id}.) {question.question_text}")
-        return HttpResponseRedirect(
-            reverse("polls:detail", args=(question_id,)))
+    messages.error(request, "You do not have a submitted "
+                   "vote to clear for this question!")
+    logger.error(f"{request.user} tried to clear a non-existant vote in "
+                 f"question {question_id}.) {question.question_text}")
+    return HttpResponseRedirect(
+        reverse("polls:detail", args=(question_id,)))
+
+
+class SurveyView(generic.DetailView):
+    """
+    View that displays all questions of a survey in a single form.
+
+    returns: A rendered template of the survey's published questions.
+    """
+
+    model = Survey
+    template_name = "polls/survey.html"
+
+    def get_context_data(self, **kwargs):
+        """
+        Get the context data with the survey's questions and choices.
+
+        The user's previous answers are fetched in a single query.
+        """
+        context = super().get_context_data(**kwargs)
+        questions = list(self.object.questions
+                         .filter(pub_date__lte=timezone.now())
+                         .order_by('id').prefetch_related('choice_set'))
+        prev_votes = {}
+        if self.request.user.is_authenticated:
+            prev_votes = dict(Vote.objects.filter(
+                user=self.request.user, question__in=questions)
+                .values_list('question_id', 'choice_id'))
+        for question in questions:
+            question.prev_vote = prev_votes.get(question.id)
+        context['questions'] = questions
+        return context
+
+
+def get_survey_answers(request, questions):
+    """
+    Get the answers a user submitted for the questions of a survey.
+
+    Answers are submitted as 'question_<question id>' = choice id.
+    All submitted choices are validated with a single query.
+
+    :param questions: A dict of question id to the survey's questions
+    :return: A dict of question id to selected choice id.
+    :raises ValueError: if an answer is not for an open single choice
+    question of the survey or not one of the question's choices.
+    """
+    answers = {}
+    for key, value in request.POST.items():
+        if key.startswith('question_') and value:
+            answers[int(key[len('question_'):])] = int(value)
+    for question_id in answers:
+        question = questions.get(question_id)
+        if question is None or question.is_ranked() or \
+                not question.can_vote():
+            raise ValueError(f"Question {question_id} can't be answered")
+    choices = dict(Choice.objects.filter(pk__in=answers.values())
+                   .values_list('id', 'question_id'))
+    for question_id, choice_id in answers.items():
+        if choices.get(choice_id) != question_id:
+            raise ValueError(f"Invalid choice for question {question_id}")
+    return answers
+
+
+@login_required
+def submit_survey(request, survey_id):
+    """
+    Handle requests for submitting all answers of a survey at once.
+
+    All votes are written with one bulk upsert in a single transaction,
+    a user's previous answers to the survey's questions are replaced.
+    """
+    survey = get_object_or_404(Survey, pk=survey_id)
+    questions = survey.questions.in_bulk()
+    try:
+        answers = get_survey_answers(request, questions)
+    except ValueError as error:
+        answers = {}
+        logger.error(f"{request.user} submitted an invalid answer in "
+                     f"survey {survey_id}.) {survey.title}: {error}")
+    if not answers:
+        messages.error(request, "Please select a valid choice for the "
+                                "questions before submitting.")
+        return HttpResponseRedirect(reverse("polls:survey",
+                                            args=(survey_id,)))
+    answered = set(Vote.objects.filter(
+        user=request.user, question_id__in=answers)
+        .values_list('question_id', flat=True))
+    with transaction.atomic():
+        Vote.objects.bulk_create(
+            [Vote(user=request.user, question_id=question_id,
+                  choice_id=choice_id, ranking=[])
+             for question_id, choice_id in answers.items()],
+            update_conflicts=True,
+            unique_fields=['user', 'question'],
+            update_fields=['choice', 'ranking', 'updated_at'])
+        tasks.enqueue("record_votes", question_ids=list(answers),
+                      when=timezone.now().isoformat())
+    client_ip = get_client_ip(request)
+    sketches.record_votes(list(answers), request.user.id, client_ip)
+    for question_id, choice_id in answers.items():
+        history.record(request.user.id, question_id,
+                       VoteEvent.CHANGE if question_id in answered
+                       else VoteEvent.CAST, choice_id, ip=client_ip)
+    messages.success(request, f"Your answers to {len(answers)} questions "
+                              f"have been recorded")
+    logger.info(f"{request.user} answered {len(answers)} questions in "
+                f"survey {survey_id}.) {survey.title}")
+    return HttpResponseRedirect(reverse("polls:survey", args=(survey_id,)))
 
 
 def register(request):
@@ -215,11 +673,11 @@ def register(request):
     if request.method == 'POST':
         form = UserCreationForm(request.POST)
         if form.is_valid():
-            form.save()
-            username = form.cleaned_data.get('username')
-            raw_passwd = form.cleaned_data.get('password1')
-            user = authenticate(username=username, password=raw_passwd)
-            login(request, user)
+            # the new user's password is already verified by the form,
+            # log them in directly instead of hashing it again
+            user = form.save()
+            login(request, user,
+                  backend='django.contrib.auth.backends.ModelBackend')
             return redirect('polls:index')
         return render(request, 'registration/register.html', {'form': form})
     else:
@@ -227,14 +685,39 @@ def register(request):
     return render(request, 'registration/register.html', {'form': form})
 
 
+@never_cache
+def healthz(request):
+    """Report that the process is alive, for liveness probes."""
+    return HttpResponse("ok", content_type="text/plain")
+
+
+@never_cache
+def readyz(request):
+    """
+    Report whether the process has warmed up, for readiness probes.
+
+    Returns 503 until the warm-up is done, with the warm-up timings.
+    """
+    is_ready = warmup.ready.is_set()
+    return JsonResponse({"ready": is_ready, "timings": warmup.timings},
+                        status=200 if is_ready else 503)
+
+
 def get_client_ip(request):
-    """Get the visitor’s IP address using request headers."""
+    """
+    Get the visitor’s IP address.
+
+    The X-Forwarded-For header can be set by any client, so it is only
+    read when the app runs behind TRUSTED_PROXY_COUNT reverse proxies. Each
+    proxy appends the address it received the request from, so the client
+    is the entry added by the outermost trusted proxy.
+    """
+    proxies = settings.TRUSTED_PROXY_COUNT
     x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-    if x_forwarded_for:
-        ip = x_forwarded_for.split(',')[0]
-    else:
-        ip = request.META.get('REMOTE_ADDR')
-    return ip
+    if proxies and x_forwarded_for:
+        hops = [hop.strip() for hop in x_forwarded_for.split(',')]
+        return hops[-min(proxies, len(hops))]
+    return request.META.get('REMOTE_ADDR')
 
 
 @receiver(user_logged_in)
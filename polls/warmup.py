@@ -0,0 +1,175 @@
+"""
+Warm-up of a freshly started server process.
+
+Without a warm-up the first requests of a new process import the views,
+build the URL resolver, compile the templates they render and connect to
+the database, so a replica that just joined the load balancer answers its
+first requests slowly. The WSGI application starts warm_up() in a
+background thread: liveness (/healthz) is reported right away, readiness
+(/readyz) only once the warm-up is done. A failed warm-up is retried with
+a growing delay. The time each step took and the time from loading the
+application to the first response byte of a request other than a probe
+are kept in 'timings' and reported by /readyz.
+"""
+import logging
+import os
+import threading
+import time
+from django.conf import settings
+from django.db import close_old_connections, connections
+from django.template import TemplateSyntaxError, engines
+from django.urls import URLResolver, get_resolver
+
+logger = logging.getLogger(__name__)
+
+# set once the process is ready to take traffic
+ready = threading.Event()
+# seconds taken by each warm-up step and until the first response byte
+timings = {}
+TEMPLATE_EXTENSIONS = (".html", ".txt", ".xml")
+# requests of the load balancer, not timed as the first response
+PROBE_PATHS = ("/healthz", "/readyz")
+# seconds before the first retry of a failed warm-up, doubled up to
+# MAX_RETRY_DELAY for each further retry
+RETRY_DELAY = 1
+MAX_RETRY_DELAY = 60
+
+
+def load_urls(resolver=None):
+    """
+    Import every URLconf and its views and compile the URL patterns.
+
+    :return: The number of URL patterns
+    """
+    resolver = resolver or get_resolver()
+    # builds the reverse lookups of the resolver
+    resolver.reverse_dict
+    count = 0
+    for pattern in resolver.url_patterns:
+        # the pattern's regex is compiled on first access
+        pattern.pattern.regex
+        if isinstance(pattern, URLResolver):
+            count += load_urls(pattern)
+        else:
+            count += 1
+    return count
+
+
+def compile_templates():
+    """
+    Compile the templates of every template directory.
+
+    With DEBUG off the template loaders cache compiled templates, so the
+    first request rendering them does not have to.
+
+    :return: The number of compiled templates
+    """
+    count = 0
+    for engine in engines.all():
+        for directory in engine.template_dirs:
+            for root, _, files in os.walk(directory):
+                for file in files:
+                    if not file.endswith(TEMPLATE_EXTENSIONS):
+                        continue
+                    name = os.path.relpath(os.path.join(root, file),
+                                           directory).replace(os.sep, "/")
+                    try:
+                        engine.get_template(name)
+                    except TemplateSyntaxError as error:
+                        logger.warning(f"Template {name} does not compile: "
+                                       f"{error}")
+                        continue
+                    count += 1
+    return count
+
+
+def open_connections():
+    """
+    Connect to every database.
+
+    With a connection pool its minimum number of connections is opened
+    for the request threads, otherwise the connection only checks that
+    the database is reachable.
+
+    :return: The number of databases
+    """
+    for connection in connections.all():
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        pool = getattr(connection, "pool", None)
+        if pool is not None:
+            pool.wait()
+        # returns the connection to the pool, if any
+        connection.close()
+    return len(connections.all())
+
+
+def warm_up():
+    """Run the warm-up steps, time them and mark the process ready."""
+    start = time.perf_counter()
+    for step in (load_urls, compile_templates, open_connections):
+        step_start = time.perf_counter()
+        count = step()
+        timings[step.__name__] = time.perf_counter() - step_start
+        logger.info(f"Warm-up {step.__name__}: {count} in "
+                    f"{timings[step.__name__] * 1000:.0f} ms.")
+    timings["warm_up"] = time.perf_counter() - start
+    ready.set()
+
+
+def retry_warm_up(delay=RETRY_DELAY, max_delay=MAX_RETRY_DELAY):
+    """
+    Run warm_up() until it succeeds.
+
+    Failures are logged and retried after a delay that doubles up to
+    max_delay seconds. The process is not ready until a warm-up succeeds,
+    so it never takes traffic before.
+    """
+    while True:
+        try:
+            warm_up()
+            return
+        except Exception:
+            logger.exception(f"Warm-up failed, retrying in {delay} s.")
+        close_old_connections()
+        time.sleep(delay)
+        delay = min(delay * 2, max_delay)
+
+
+def start():
+    """
+    Warm up the process in a background thread.
+
+    With WARM_UP off the process is ready right away.
+    """
+    if not settings.WARM_UP:
+        ready.set()
+        return
+    threading.Thread(target=retry_warm_up, name="warm-up",
+                     daemon=True).start()
+
+
+def time_first_byte(application, started):
+    """
+    Wrap a WSGI application to time its first response.
+
+    Liveness and readiness probes answer before the process is warm, so
+    they are not timed.
+
+    :param application: The WSGI application
+    :param started: The time.perf_counter() when the application started
+    loading
+    :return: The wrapped WSGI application
+    """
+    def timed_application(environ, start_response):
+        if ("first_byte" in timings
+                or environ.get("PATH_INFO") in PROBE_PATHS):
+            return application(environ, start_response)
+
+        def timed_start_response(*args):
+            timings.setdefault("first_byte", time.perf_counter() - started)
+            logger.info(f"First response after "
+                        f"{timings['first_byte'] * 1000:.0f} ms.")
+            return start_response(*args)
+        return application(environ, timed_start_response)
+    return timed_application